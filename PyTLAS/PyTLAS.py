@@ -42,7 +42,7 @@ for filename in required:
     if not os.path.isfile('{}/{}'.format(python_path, filename)):
         raise ValueError('{} not found. Check BasicATLAS installation'.format(filename))
 
-def load_text(filename, maxlen = 80):
+def load_text(filename, maxlen = 80, text = None):
     """Load a text file as array of bytes
     
     The output dimensions are MxN where M is the number of lines in the text file and N
@@ -52,18 +52,22 @@ def load_text(filename, maxlen = 80):
     Parameters
     ----------
     filename : str
-        Path to the text file
+        Path to the text file. Ignored if `text` is given
     maxlen : number, optional
         Fixed number of characters per line (defaults to 80, which is the value in ATLAS7V)
+    text : str, optional
+        Content of the file to use instead of reading it from `filename`
     
     Returns
     -------
     array_like
         Array of bytes
     """
-    f = open(filename, 'r')
-    lines = f.read().strip().split('\n')
-    f.close()
+    if text is None:
+        f = open(filename, 'r')
+        text = f.read()
+        f.close()
+    lines = text.strip().split('\n')
     content = np.full((len(lines), maxlen), ord(' '), dtype = np.byte, order = 'F')
     for i, line in enumerate(lines):
         content[i,:min(len(line), content.shape[1])] = list(line.encode('ascii')[:content.shape[1]])
@@ -137,6 +141,153 @@ def load_f18(filename):
             content[i,j] = nanfloat(line[14 + (j - 2) * 7:14 + (j - 1) * 7])
     return content
 
+def init_atlas_subprocess():
+    """Initialize a subprocess wrapper of ATLAS-9
+    
+    The ATLAS-9 code calculates the structure of the model atmosphere. The inputs are the Opacity Distribution Function
+    (ODF, p00big*.bdf), the table of Rosseland mean opacities (kappa.ros), the table of molecular equilibrium constants
+    (molecules.dat) and the initial guess for the structure (restart)
+
+    Unlike XNFPELSYN, SYNTHE and SPECTRV, ATLAS-9 is not available as a shared object, since its input and output is tied
+    to Fortran units throughout the code, so the iterations are NOT carried out in-process. Instead, this function returns
+    an object that keeps all inputs and outputs in memory as NumPy arrays and runs the standalone ATLAS-9 executable
+    (atlas9mem.exe, compiled by BasicATLAS) as a subprocess in a scratch directory on a memory-backed filesystem (/dev/shm
+    where available). The files in the scratch directory only exist for the duration of each run. The control file is
+    rendered from the same template and with the same abundances (Settings.abun_std_to_atlas()) as in atlas.atlas() and
+    executed by engine.run_script(). The output is parsed and the best iteration is selected by the same functions as in
+    BasicATLAS (parse_atlas_output() and convergence_class()), so iterations where the chemical equilibrium could not be
+    found carry the 88888.888 error sentinel
+
+    The converged structure is stored in the `.deck` attribute as an array of bytes that can be passed to
+    `.load_structure()` of XNFPELSYN directly, and is also available as numerical arrays through `.get_structure()`
+    
+    Returns
+    -------
+    types.SimpleNamespace
+        ATLAS-9 engine with `.load_odf()`, `.load_structure()`, `.run()` and `.get_structure()` methods bound to it
+    """
+    import tempfile
+    import shutil
+    import sys
+    # The control cards, the execution engine and the output parser are those of BasicATLAS. Its directory is appended
+    # (rather than prepended) to the search path, so that it never shadows modules of the calling code
+    if os.path.realpath('{}/..'.format(python_path)) not in [os.path.realpath(path) for path in sys.path]:
+        sys.path.append(os.path.realpath('{}/..'.format(python_path)))
+    import atlas
+
+    executable = '{}/../bin/atlas9mem.exe'.format(python_path)
+    if not os.path.isfile(executable):
+        raise ValueError('{} not compiled. Run compile.com in BasicATLAS first'.format(executable))
+    lib = types.SimpleNamespace()
+
+    # Load molecules.dat (fort.2)
+    f = open('{}/{}'.format(python_path, '../data/atlas_files/molecules.dat'), 'rb')
+    lib.f2 = np.frombuffer(f.read(), dtype = np.uint8)
+    f.close()
+
+    # Bound method to load the ODF (fort.9) and the Rosseland mean opacities (fort.1). Either file may be given as a path
+    # or as an array of bytes with the content of the file
+    def load_odf(self, odf, kappa):
+        def load_binary(source):
+            if isinstance(source, np.ndarray):
+                return np.ascontiguousarray(source).view(np.uint8).ravel()
+            f = open(source, 'rb')
+            content = np.frombuffer(f.read(), dtype = np.uint8)
+            f.close()
+            return content
+        self.f9 = load_binary(odf)
+        self.f1 = load_binary(kappa)
+    lib.load_odf = types.MethodType(load_odf, lib)
+
+    # Bound method to load the initial guess for the structure (fort.3). Same as in XNFPELSYN, the structure may be given
+    # as a path, as text or as an array of bytes in the format of load_text(). Lines are not truncated at 80 characters,
+    # since the structure rows of ATLAS models are longer
+    def load_structure(self, filename):
+        if isinstance(filename, np.ndarray):
+            self.f3 = np.asfortranarray(filename, dtype = np.byte)
+        elif filename.find('\n') != -1:
+            self.f3 = load_text(None, maxlen = 132, text = filename)
+        else:
+            self.f3 = load_text(filename, maxlen = 132)
+    lib.load_structure = types.MethodType(load_structure, lib)
+
+    # Bound method to run ATLAS-9
+    def run(self, teff, logg, zscale = 0.0, abun = {}, Y = -0.1, vturb = 2, niter = 45, molecules = True, timeout = None):
+        try:
+            self.f9; self.f1
+        except:
+            raise ValueError('ATLAS-9 does not have ODF. ODF must be loaded with load_odf() first')
+        try:
+            self.f3
+        except:
+            raise ValueError('ATLAS-9 does not have structure. Structure must be loaded with load_structure() first')
+
+        # Results of the previous run are discarded, so that a failed run does not leave them looking current
+        self.has_run = False
+        self.best = None
+
+        # Chemical composition and control cards, rendered from the same template as in atlas.atlas()
+        settings = atlas.Settings()
+        settings.teff = teff; settings.logg = logg; settings.zscale = zscale; settings.abun = abun; settings.Y = Y
+        settings.vturb = vturb
+
+        # Run the executable in a memory-backed scratch directory
+        scratch = tempfile.mkdtemp(dir = ['/dev/shm', None][not os.path.isdir('/dev/shm')])
+        try:
+            for unit, content in [(1, self.f1), (9, self.f9), (2, self.f2)]:
+                content.tofile('{}/fort.{}'.format(scratch, unit))
+            f = open('{}/fort.3'.format(scratch), 'w')
+            f.write('\n'.join([bytes(line).decode('ascii').rstrip() for line in self.f3]) + '\n')
+            f.close()
+            cards = atlas.atlas_cards(scratch, settings, niter, molecules)
+            f = open('{}/atlas_control.com'.format(scratch), 'w')
+            f.write(atlas.templates.atlas_control.format(**cards))
+            f.close()
+            atlas.engine.run_script('{}/atlas_control.com'.format(scratch), timeout = timeout)
+            f = open(cards['output_1'], 'r')
+            self.output = f.read()
+            f.close()
+            f = open('{}/fort.7'.format(scratch), 'r')
+            self.punched = f.read().split('\n==========\n')[:-1]
+            f.close()
+        finally:
+            shutil.rmtree(scratch)
+
+        # Maximum flux errors and flux derivative errors in every iteration with a punched structure
+        self.max_err = []; self.max_de = []
+        for kind, value in atlas.parse_atlas_output(self.output.splitlines(keepends = True)):
+            if kind == 'iteration':
+                self.max_err += [value['max_err']]; self.max_de += [value['max_de']]
+        self.max_err = np.array(self.max_err[:len(self.punched)]); self.max_de = np.array(self.max_de[:len(self.punched)])
+        if len(self.max_err) == 0:
+            raise ValueError('ATLAS-9 did not complete any iterations')
+
+        # Pick the iteration with the smallest flux error in the best available convergence class (same as atlas_converged())
+        classes = np.array(atlas.convergence_class(self.max_err, self.max_de))
+        for conv in ['GOLD', 'SILVER', 'BRONZE', 'UNCONVERGED']:
+            if np.count_nonzero(classes == conv) > 0:
+                self.best = np.arange(len(self.max_err))[classes == conv][np.argmin(self.max_err[classes == conv])]
+                break
+        self.deck = load_text(None, text = self.punched[self.best])
+        self.has_run = True
+    lib.run = types.MethodType(run, lib)
+
+    # Bound method to extract the structure of the best iteration as numerical arrays
+    def get_structure(self):
+        if not self.has_run:
+            raise ValueError('ATLAS-9 has not run yet')
+        lines = self.punched[self.best].split('\n')
+        start = [i for i, line in enumerate(lines) if line.find('READ DECK6') != -1][0]
+        columns = ['RHOX', 'T', 'P', 'XNE', 'ABROSS', 'ACCRAD', 'VTURB', 'FLXCNV', 'VCONV', 'VELSND']
+        data = np.array([line.split()[:len(columns)] for line in lines[start + 1:start + 1 + int(lines[start].split()[2])]], dtype = float)
+        return {column: data[:,i] for i, column in enumerate(columns[:data.shape[1]])}
+    lib.get_structure = types.MethodType(get_structure, lib)
+
+    # Flag to check if ATLAS-9 has run
+    lib.has_run = False
+
+    return lib
+
 def init_xnfpelsyn():
     """Initialize XNFPELSYN
     
@@ -197,10 +348,16 @@ def init_xnfpelsyn():
     # Flag to check if XNFPELSYN has run
     lib.has_run = False
 
-    # Bound method to load the ATLAS model into XNFPELSYN
+    # Bound method to load the ATLAS model into XNFPELSYN. The model may be given as a path to a file, as the content of
+    # the file or as an array of bytes in the format of load_text() (e.g. the `.deck` attribute of init_atlas_subprocess())
     def load_structure(self, filename):
         instructions = ['SURFACE FLUX', 'ITERATIONS 1 PRINT 2 PUNCH 2', 'CORRECTION OFF', 'PRESSURE OFF', 'READ MOLECULES', 'MOLECULES ON']
-        self.f5 = load_text(filename)
+        if isinstance(filename, np.ndarray):
+            self.f5 = np.asfortranarray(filename, dtype = np.byte)
+        elif filename.find('\n') != -1:
+            self.f5 = load_text(None, text = filename)
+        else:
+            self.f5 = load_text(filename)
         # If the structure file begins with "TEFF" then we need to prepend it with a series of instructions for ATLAS7V
         if bytes(self.f5[0,:4]) == 'TEFF'.encode('ascii'):
             self.f5 = np.vstack([np.full((len(instructions), self.f5.shape[1]), ord(' '), dtype = self.f5.dtype, order = 'F'), self.f5])
@@ -1,9 +1,9 @@
 from datetime import datetime
 import os
 import re
+import json
 import numpy as np
-from shutil import copyfile
-import subprocess
+from shutil import copyfile, rmtree
 import time
 from scipy.optimize import brentq
 import scipy.constants as spc
@@ -13,8 +13,9 @@ import copy
 from settings import Settings
 import templates
 import restarts
+import engine
 
-from threading import Thread
+from threading import Thread, Event, Lock
 
 # Custom Thread() class that returns information on exceptions raised by the thread to the main program
 class ExceptionHandlingThread(Thread):
@@ -43,18 +44,46 @@ def notify(message, silent):
     if not silent:
         print(message)
 
-def cmd(command):
+def link_or_copy(source, destination):
     """
-    Run a shell command and, if any output is produced, print it including both STDOUT and STDERR
+    Make the read-only input file "source" available at "destination" without duplicating its content where possible.
+    A reflink (see engine.clone_file()) is attempted first, since it shares the data blocks of the source but is an
+    independent file, so writing into the destination can never modify the source. Otherwise, a hard link is made, which
+    remains valid even if the source is deleted later (the data are released once the last link to them is removed, so
+    the link count of the file acts as a reference count). Since the two names of a hard link are the same file, its
+    write permissions are removed, so that the file cannot be modified in place through either name. If hard links are
+    not supported either (e.g. the files are on different filesystems), a symbolic link to the absolute path of the
+    source is made instead. If neither is supported, the file is copied
+
+    arguments:
+        source         :     File to make available
+        destination    :     Path to make the file available at. Must not exist
+
+    returns:
+        Method used: "reflink", "hardlink", "symlink" or "copy"
     """
-    session = subprocess.Popen(command, stdout = subprocess.PIPE, stderr = subprocess.PIPE, shell = True)
-    stdout, stderr = session.communicate()
-    stdout = stdout.decode().strip()
-    stderr = stderr.decode().strip()
-    if stdout != '':
-        print(stdout)
-    if stderr != '':
-        raise ValueError('Command {} returned an error: {}'.format(command, stderr))
+    try:
+        engine.clone_file(source, destination, fallback = False)
+        return 'reflink'
+    except OSError:
+        pass
+    try:
+        os.link(source, destination)
+        try:
+            os.chmod(destination, os.stat(destination).st_mode & ~0o222)
+        except PermissionError:
+            # Only the owner may change the permissions. Files of other users are normally not writable by us anyway
+            pass
+        return 'hardlink'
+    except OSError:
+        pass
+    try:
+        os.symlink(os.path.realpath(source), destination)
+        return 'symlink'
+    except OSError:
+        pass
+    copyfile(source, destination)
+    return 'copy'
 
 def bin_spec(wl, flux, num_bins = 1000):
     """
@@ -103,6 +132,146 @@ def blackbody_dBdT_peak(T):
     max_fun = blackbody_dBdT(max_nu, T)
     return max_nu, max_fun
 
+def table_errors(table):
+    """
+    Extract the flux errors and flux derivative errors from the rows of an iteration summary table in the main output of
+    ATLAS-9 (see parse_atlas_output())
+
+    arguments:
+        table          :     List of table rows (one per layer) without the header
+
+    returns:
+        err            :     Array of flux errors in every layer
+        de             :     Array of flux derivative errors in every layer
+    """
+    return np.array([row.split()[11:13] for row in table], dtype = float).T
+
+def parse_atlas_output(lines):
+    """
+    Parse the main output of ATLAS-9 (output_main.out) in a single pass. The function is a generator that processes the
+    output line by line and yields events as soon as they can be determined, so it can be used both on completed runs
+    and, together with follow_output(), on ongoing runs
+
+    The following events are yielded as (kind, value) tuples:
+        ('frequencies', frequencies) :  Array of all frequencies in the integration grid of ATLAS in Hz (sorted)
+        ('iteration', iteration)     :  Completed iteration. "iteration" is a dictionary with the following keys:
+                                            number   :  Iteration number starting with 1
+                                            table    :  List of rows in the iteration summary table without the
+                                                        header (one row per layer)
+                                            chemfail :  True if the chemical equilibrium could not be found
+                                            max_err  :  Maximum flux error (88888.888 if chemfail is True)
+                                            max_de   :  Maximum flux derivative error (88888.888 if chemfail is True)
+        ('marker', marker)           :  Termination marker printed by patched ATLAS-9: "REACHED GOLD TOLERANCES",
+                                        "MODEL DIVERGED", "INVALID STRUCTURE" or "HYDROFAIL"
+
+    arguments:
+        lines          :     Iterable over the lines of the output, e.g. an open file object
+    """
+    markers = ['REACHED GOLD TOLERANCES', 'MODEL DIVERGED', 'INVALID STRUCTURE', 'HYDROFAIL']
+    table = None; chemfail = False; number = 0
+    frequencies = None; reading = False
+    for raw_line in lines:
+        line = raw_line.rstrip('\n')
+
+        # Frequency table: integration coefficients are interleaved with frequencies, three numbers per frequency. The
+        # length of the line is checked with the line terminator included
+        if reading:
+            if len(raw_line) < 60:
+                reading = False
+                yield 'frequencies', np.array(sorted(frequencies))
+            else:
+                # Minus signs in integration coefficients break the output format. Under normal circumstances
+                # all integration coefficients should be positive, but the first coefficient may be negative if
+                # the frequency grid has been artificially extended short of ~8 nm as ATLAS will assume 8 nm
+                # to be the shortest wavelength regardless
+                frequencies += list(np.array(line.replace('-', ' -').split(), dtype = float)[1::3])
+                continue
+        if frequencies is None and line.find('0FREQID') != -1:
+            frequencies = []; reading = True
+            continue
+
+        # Iteration summary tables. Failures of chemical equilibrium are reported between the end of the previous table
+        # and the end of the current one
+        if line.find('CHEMFAIL') != -1:
+            chemfail = True
+        if line.find('START TABLE') != -1:
+            table = []
+            continue
+        if table is not None:
+            if line.find('END TABLE') == -1:
+                table += [line]
+                continue
+            number += 1
+            table = table[3:]       # Remove the header
+            if chemfail:
+                max_err = 88888.888; max_de = 88888.888
+            else:
+                assert len(table) == 72
+                err, de = table_errors(table)
+                max_err = np.max(np.abs(err)); max_de = np.max(np.abs(de))
+            yield 'iteration', {'number': number, 'table': table, 'chemfail': chemfail, 'max_err': max_err, 'max_de': max_de}
+            table = None; chemfail = False
+            continue
+
+        for marker in markers:
+            if line.find(marker) != -1:
+                yield 'marker', marker
+
+def follow_output(filename, running, poll = 0.5):
+    """
+    Iterate over the lines of a file that is being written by an ongoing process. Lines are yielded as soon as they are
+    completed. The iteration stops once the process has exited and the remainder of the file has been read
+
+    arguments:
+        filename       :     File to follow. It does not have to exist when the function is called
+        running        :     Function that returns True while the file is still being written
+        poll           :     Interval between consecutive checks for new output in seconds
+    """
+    file = None
+    buffer = ''
+    while True:
+        alive = running()
+        if file is None and os.path.isfile(filename):
+            file = open(filename, 'r')
+        if file is not None:
+            buffer += file.read()
+            lines = buffer.split('\n')
+            buffer = lines.pop()      # The last line may be incomplete
+            for line in lines:
+                yield line + '\n'
+        if not alive:
+            break
+        time.sleep(poll)
+    if file is not None:
+        if buffer != '':
+            yield buffer
+        file.close()
+
+def convergence_class(max_err, max_de):
+    """
+    Determine the convergence class of ATLAS iterations from their maximum flux errors and maximum flux derivative errors:
+        GOLD        :   max[|err|] < 1 and max[|de|] < 10
+        SILVER      :   max[|err|] < 10 and max[|de|] < 100
+        BRONZE      :   max[|err|] < 1000
+        UNCONVERGED :   Otherwise
+
+    arguments:
+        max_err        :     Maximum flux error (scalar or array)
+        max_de         :     Maximum flux derivative error (scalar or array)
+
+    returns:
+        Convergence class (string or list of strings, matching the type of the arguments)
+    """
+    if np.ndim(max_err) != 0:
+        return [convergence_class(err, de) for err, de in zip(max_err, max_de)]
+    if max_err < 1.0 and max_de < 10.0:
+        return 'GOLD'
+    if max_err < 10.0 and max_de < 100.0:
+        return 'SILVER'
+    if max_err < 1000.0:
+        return 'BRONZE'
+    return 'UNCONVERGED'
+
 def atlas_converged(run_dir, print_result = False, silent = False, niter = 0):
     """
     Evaluate the convergence parameters and extract the best iteration for a completed or ongoing ATLAS run
@@ -136,88 +305,65 @@ def atlas_converged(run_dir, print_result = False, silent = False, niter = 0):
         err          :         Array of flux errors in the best iteration
         de           :         Array of flux derivative errors in the best iteration
     """
-    # Read the main output file
+    # Parse the main output file and get the maximum flux error and maximum flux error derivative in each iteration
+    max_err = []; max_de = []; tables = []; markers = []
     file = open(run_dir + '/output_main.out', 'r')
-    convergence = file.read()
+    for kind, value in parse_atlas_output(file):
+        if kind == 'iteration':
+            max_err += [value['max_err']]
+            max_de += [value['max_de']]
+            tables += [value['table']]
+        elif kind == 'marker':
+            markers += [value]
     file.close()
 
-    # Break the output into iterations and get the maximum flux error and maximum flux error derivative in each
-    iterations = re.findall('START TABLE.+?END TABLE', convergence, re.DOTALL)
-    cursor = 0
-    max_err = []; max_de = []
-    for i, iteration in enumerate(iterations):
-
-        # Determine where this iteration starts and ends
-        end = convergence.find('END TABLE', cursor)
-        cursor = end + 1
-        start = convergence.rfind('END TABLE', 0, cursor)
-        if start == -1:
-            start = 0
-
-        # Check that the chemical equilibrium calculation finished successfully
-        if convergence[start:end].find('CHEMFAIL') != -1:
-            max_err += [88888.888]
-            max_de += [88888.888]
-            continue
-
-        # Remove header and footer
-        s = iteration.split('\n')[4:-1]
-        assert(len(s) == 72)
-        s = '\n'.join(s)
-
-        err, de = np.loadtxt(s.split('\n'), unpack = True, usecols = [11, 12])
-        max_err += [np.max(np.abs(err))]
-        max_de += [np.max(np.abs(de))]
-
     if len(max_err) == 0:
         raise ValueError('The model diverged immediately: no iterations could be completed')
 
-    # Decide on the best iteration
+    # If the run was stopped externally (e.g. by atlas_watchdog()), the structures of the last iterations may not have been
+    # punched into fort.7 yet. Those iterations cannot be selected as best, since their structure is not available
+    if os.path.isfile(run_dir + '/fort.7'):
+        file = open(run_dir + '/fort.7', 'r')
+        punched = file.read().split('\n==========\n')[:-1]
+        file.close()
+        if len(punched) < len(max_err):
+            max_err = max_err[:len(punched)]; max_de = max_de[:len(punched)]; tables = tables[:len(punched)]
+            if len(max_err) == 0:
+                raise ValueError('The run was stopped before any iterations were saved')
+
+    # Decide on the best iteration: the iteration with the lowest max[|err|] within the best available convergence class
     max_err = np.array(max_err); max_de = np.array(max_de)
-    gold = (max_err < 1.0) & (max_de < 10.0)
-    silver = (max_err < 10.0) & (max_de < 100.0)
-    bronze = (max_err < 1000.0)
-    unconv = (~gold) & (~silver) & (~bronze)
-    if np.count_nonzero(gold) > 0:
-        best = np.arange(len(max_err))[gold][np.argmin(max_err[gold])]; conv = 'GOLD'
-    elif np.count_nonzero(silver) > 0:
-        best = np.arange(len(max_err))[silver][np.argmin(max_err[silver])]; conv = 'SILVER'
-    elif np.count_nonzero(bronze) > 0:
-        best = np.arange(len(max_err))[bronze][np.argmin(max_err[bronze])]; conv = 'BRONZE'
-    else:
-        best = np.arange(len(max_err))[unconv][np.argmin(max_err[unconv])]; conv = 'UNCONVERGED'
+    classes = np.array(convergence_class(max_err, max_de))
+    for conv in ['GOLD', 'SILVER', 'BRONZE', 'UNCONVERGED']:
+        if np.count_nonzero(classes == conv) > 0:
+            best = np.arange(len(max_err))[classes == conv][np.argmin(max_err[classes == conv])]
+            break
     if print_result:
         notify('Total iterations: {} | Best iteration: {}'.format(len(max_de), best + 1), silent)
         notify('For the best iteration: max[|err|] = {} | max[|de|] = {} | convergence class: {}'.format(max_err[best], max_de[best], conv), silent)
 
     # Save the best iteration in a separate file and get its errors
     file = open(run_dir + '/output_last_iteration.out', 'w')
-    file.write('\n'.join(iterations[best].split('\n')[4:-1]))
+    file.write('\n'.join(tables[best]))
     file.close()
-    err, de = np.loadtxt(run_dir + '/output_last_iteration.out', unpack = True, usecols = [11, 12])
-
+    err, de = table_errors(tables[best])
 
     # If fort.7 exists, remove all iterations from it except for the best one
     if os.path.isfile(run_dir + '/fort.7'):
-        file = open(run_dir + '/fort.7', 'r')
-        content = file.read()
-        file.close()
-        content = content.split('\n==========\n')[:-1]
-        assert len(content) == len(max_err)
         file = open(run_dir + '/fort.7', 'w')
-        file.write(content[best])
+        file.write(punched[best])
         file.close()
 
     # Determine if this run was successful (we also consider failed models that terminated with definitive error codes successful)
     success = False
     if (niter == 0) or (niter == len(max_err)):
         success = True
-    if convergence.find('REACHED GOLD TOLERANCES') != -1:
+    if 'REACHED GOLD TOLERANCES' in markers:
         success = True
-    if convergence.find('MODEL DIVERGED') != -1 or convergence.find('INVALID STRUCTURE') != -1:
+    if 'MODEL DIVERGED' in markers or 'INVALID STRUCTURE' in markers:
         success = True
         if print_result: notify('**WARNING:** Model terminated due to divergence', silent)
-    if convergence.find('HYDROFAIL') != -1:
+    if 'HYDROFAIL' in markers:
         success = True
         if print_result: notify('**WARNING:** Model terminated due to hydrostatic failure', silent)
     if not success:
@@ -225,7 +371,116 @@ def atlas_converged(run_dir, print_result = False, silent = False, niter = 0):
 
     return err, de
 
-def atlas(output_dir, settings = Settings(), restart = 'auto', niter = 450, ODF = python_path + '/data/solar_ODF', molecules = True, silent = False):
+def atlas_watchdog(run_dir, thread, cancel, gold_streak = 0, stall_window = 0, callback = None, poll = 0.5):
+    """
+    Monitor an ongoing ATLAS-9 run and stop it once further iterations are unlikely to improve the model. The function
+    follows output_main.out as it is being written, evaluates the convergence parameters of every completed iteration
+    (see atlas_converged()) and terminates the run when any of the following criteria is met:
+        - The gold convergence criterion (max[|err|] < 1 and max[|de|] < 10) holds for "gold_streak" consecutive iterations
+        - max[|err|] has not improved on its best value for "stall_window" consecutive iterations
+        - "callback" returned True
+
+    The run is only terminated once the structures of all evaluated iterations have been punched into fort.7, so that the
+    best iteration can subsequently be extracted by atlas_converged()
+
+    arguments:
+        run_dir        :     Output directory of the ATLAS run
+        thread         :     Thread executing the control file of the ATLAS run (see engine.run_script())
+        cancel         :     threading.Event() passed to engine.run_script() as "cancel". The event is set to stop the run
+        gold_streak    :     Number of consecutive gold iterations required to stop the run. 0 disables the criterion
+        stall_window   :     Number of consecutive iterations without improvement in max[|err|] required to stop the run.
+                             0 disables the criterion
+        callback       :     Optional function to call after every completed iteration with a dictionary of iteration
+                             telemetry as its only argument. The dictionary has the following keys:
+                                 iteration   :   Iteration number starting with 1
+                                 max_err     :   Maximum flux error
+                                 max_de      :   Maximum flux derivative error
+                                 class       :   Convergence class (see convergence_class())
+                                 chemfail    :   True if the chemical equilibrium could not be found
+                                 elapsed     :   Wall time since the start of monitoring in seconds
+                             If the function returns True, the run will be stopped
+        poll           :     Interval between consecutive checks of the output in seconds
+
+    returns:
+        Description of the reason why the run was stopped, or None if the run halted on its own
+    """
+    startTime = time.time()
+    max_err = []; max_de = []
+    for kind, value in parse_atlas_output(follow_output(run_dir + '/output_main.out', thread.is_alive, poll)):
+        if kind != 'iteration':
+            continue
+        max_err += [value['max_err']]; max_de += [value['max_de']]
+        n = len(max_err)
+
+        reason = None
+        if callback is not None:
+            event = {'iteration': value['number'], 'max_err': float(value['max_err']), 'max_de': float(value['max_de']),
+                     'class': convergence_class(value['max_err'], value['max_de']), 'chemfail': value['chemfail'],
+                     'elapsed': time.time() - startTime}
+            if callback(event) is True:
+                reason = 'requested by callback at iteration {}'.format(value['number'])
+        gold = (np.array(max_err) < 1.0) & (np.array(max_de) < 10.0)
+        if reason is None and gold_streak > 0 and n >= gold_streak and np.all(gold[-gold_streak:]):
+            reason = 'gold convergence held for {} consecutive iterations'.format(gold_streak)
+        if reason is None and stall_window > 0 and n > stall_window and np.min(max_err[-stall_window:]) >= np.min(max_err[:-stall_window]):
+            reason = 'max[|err|] did not improve in {} consecutive iterations'.format(stall_window)
+        if reason is None:
+            continue
+
+        # Wait for the structures of all evaluated iterations to be punched into fort.7. ATLAS punches the structure
+        # immediately after printing the iteration summary table
+        while thread.is_alive():
+            punched = 0
+            if os.path.isfile(run_dir + '/fort.7'):
+                f = open(run_dir + '/fort.7', 'r')
+                punched = f.read().count('\n==========\n')
+                f.close()
+            if punched >= n:
+                break
+            time.sleep(poll)
+        if not thread.is_alive():
+            return None
+        cancel.set()
+        thread.join()
+        return reason
+
+    return None
+
+def atlas_cards(output_dir, settings, niter, molecules):
+    """
+    Collect the values to fill in the ATLAS-9 control templates (atlas_control_start, atlas_control and
+    atlas_control_end in templates.py)
+
+    arguments:
+        output_dir     :     Directory to run ATLAS-9 in. The ODF, the restart and the output files are expected there
+        settings       :     Object of class Settings() with atmosphere parameters
+        niter          :     Maximum number of iterations, carried out in batches of 15
+        molecules      :     If True, model formation of molecules
+
+    returns:
+        cards          :     Dictionary of template fields
+    """
+    cards = {
+      'molecules': python_path + '/data/atlas_files/molecules.dat',
+      'initial_model': output_dir + '/restart.dat',
+      'output_1': output_dir + '/output_main.out',
+      'output_2': output_dir + '/output_summary.out',
+      'atlas_exe': python_path + '/bin/atlas9mem.exe',
+      'abundance_scale': 10 ** float(settings.zscale),
+      'teff': settings.teff,
+      'gravity': settings.logg,
+      'vturb': str(int(settings.vturb)),
+      'output_dir': output_dir,
+      'enable_molecules': ['OFF', 'ON'][molecules]
+    }
+    for z, abundance in enumerate(settings.atlas_abun()):
+        cards['element_' + str(z)] = abundance
+    cards.update({'iterations': templates.atlas_iterations.format(iterations = '15') * int(np.floor(int(niter) / 15))})
+    if int(niter) % 15 != 0:
+        cards['iterations'] += templates.atlas_iterations.format(iterations = str(int(niter) % 15))
+    return cards
+
+def atlas(output_dir, settings = Settings(), restart = 'auto', niter = 450, ODF = python_path + '/data/solar_ODF', molecules = True, gold_streak = 0, stall_window = 0, callback = None, telemetry = False, ODF_library = python_path + '/data', timeout = None, silent = False):
     """
     Run ATLAS-9 to calculate a model stellar atmosphere
 
@@ -240,9 +495,25 @@ def atlas(output_dir, settings = Settings(), restart = 'auto', niter = 450, ODF
                              stopped before reaching this number if the final iteration in a batch meets the gold
                              convergence requirement (max[|err|] < 1 and max[|de|] < 10)
         ODF            :     Output directory of a DFSYNTHE run with required Opacity Distribution Functions and Rosseland
-                             mean opacities
+                             mean opacities. Set to "auto" to select a compatible ODF from "ODF_library" (see find_ODF()).
+                             Set to "interpolate" to do the same, but fall back to interpolating between the ODFs in the
+                             library if no compatible ODF is available (see interpolate_ODF()). The interpolated ODF is
+                             stored in the "interpolated_ODF" subdirectory of the output directory
         molecules      :     If True (default), model formation of molecules. When set to False, atomic number densities
                              are evaluated by solving the Saha equation exactly and may therefore be more precise
+        gold_streak    :     If positive, stop the run early once the gold convergence requirement has been met in this many
+                             consecutive iterations. See atlas_watchdog()
+        stall_window   :     If positive, stop the run early once max[|err|] has not improved in this many consecutive
+                             iterations. See atlas_watchdog()
+        callback       :     Optional function to call after every completed iteration with a dictionary of iteration
+                             telemetry (iteration number, max[|err|], max[|de|], convergence class and elapsed wall time).
+                             If the function returns True, the run will be stopped. See atlas_watchdog()
+        telemetry      :     If True, record the iteration telemetry in "telemetry.jsonl" in the output directory as the run
+                             progresses (one JSON object per line)
+        ODF_library    :     ODF library to select the ODF from if "ODF" is "auto" or "interpolate" (see ODF_index()). Defaults to the
+                             "data" directory of BasicATLAS
+        timeout        :     Maximum allowed run time of every executable in seconds. If exceeded, the executable is
+                             terminated and an exception is raised (see engine.run_process()). Defaults to None (no limit)
         silent         :     Do not print status messages
     """
     startTime = datetime.now()
@@ -254,16 +525,27 @@ def atlas(output_dir, settings = Settings(), restart = 'auto', niter = 450, ODF
         os.mkdir(output_dir)
         output_dir = os.path.realpath(output_dir)
 
-    # Validate the provided ODF
-    ODF_meta = meta(ODF)
-    if ODF_meta['type'] != 'DFSYNTHE':
-        raise ValueError('Directory {} does not have ODFs'.format(ODF))
-    settings.check_ODF(ODF_meta)
+    # Find or validate the ODF. ODFs from the library have been validated when the library was indexed
+    if ODF == 'interpolate':
+        try:
+            ODF = find_ODF(settings, ODF_library)
+            notify('Selected ODF {}'.format(ODF), silent)
+        except ValueError:
+            ODF = interpolate_ODF(output_dir + '/interpolated_ODF', settings, ODF_library, silent = silent)
+    elif ODF == 'auto':
+        ODF = find_ODF(settings, ODF_library)
+        notify('Selected ODF {}'.format(ODF), silent)
+    else:
+        ODF_meta = meta(ODF)
+        if ODF_meta['type'] != 'DFSYNTHE':
+            raise ValueError('Directory {} does not have ODFs'.format(ODF))
+        settings.check_ODF(ODF_meta)
 
-    # Prepare ODF
+    # Prepare ODF. The ODF files are only read by ATLAS, so they are shared with the ODF directory rather than copied (see
+    # link_or_copy() for how the shared files are protected from modification)
     if os.path.isfile(ODF + '/p00big{}.bdf'.format(settings.vturb)):
-        copyfile(ODF + '/p00big{}.bdf'.format(settings.vturb), output_dir + '/odf_9.bdf')
-        copyfile(ODF + '/kappa.ros'.format(settings.vturb), output_dir + '/odf_1.ros')
+        link_or_copy(ODF + '/p00big{}.bdf'.format(settings.vturb), output_dir + '/odf_9.bdf')
+        link_or_copy(ODF + '/kappa.ros', output_dir + '/odf_1.ros')
     else:
         vturb_available = [i for o in map(lambda x: re.findall('p00big([0-9]+)\.bdf', x), os.listdir(ODF)) for i in o]
         raise ValueError('ODF not calculated for vturb={}. Available vturb: {}'.format(settings.vturb, vturb_available))
@@ -275,26 +557,7 @@ def atlas(output_dir, settings = Settings(), restart = 'auto', niter = 450, ODF
     notify(message, silent)
     
     # Generate a launcher command file
-    cards = {
-      'molecules': python_path + '/data/atlas_files/molecules.dat',
-      'initial_model': output_dir + '/restart.dat',
-      'output_1': output_dir + '/output_main.out',
-      'output_2': output_dir + '/output_summary.out',
-      'atlas_exe': python_path + '/bin/atlas9mem.exe',
-      'abundance_scale': 10 ** float(settings.zscale),
-      'teff': settings.teff,
-      'gravity': settings.logg,
-      'vturb': str(int(settings.vturb)),
-      'output_dir': output_dir,
-      'enable_molecules': ['OFF', 'ON'][molecules]
-    }
-    for z, abundance in enumerate(settings.atlas_abun()):
-        cards['element_' + str(z)] = abundance
-    cards['element_1'] = settings.atlas_abun()[1]
-    cards['element_2'] = settings.atlas_abun()[2]
-    cards.update({'iterations': templates.atlas_iterations.format(iterations = '15') * int(np.floor(int(niter) / 15))})
-    if int(niter) % 15 != 0:
-        cards['iterations'] += templates.atlas_iterations.format(iterations = str(int(niter) % 15))
+    cards = atlas_cards(output_dir, settings, niter, molecules)
     file = open(output_dir + '/atlas_control_start.com', 'w')
     file.write(templates.atlas_control_start.format(**cards))
     file.close()
@@ -307,96 +570,1432 @@ def atlas(output_dir, settings = Settings(), restart = 'auto', niter = 450, ODF
     notify("Launcher created", silent)
 
     # Run ATLAS
-    cmd('bash {}/atlas_control_start.com'.format(output_dir))
-    cmd('bash {}/atlas_control.com'.format(output_dir))
-    notify("ATLAS-9 halted", silent)
+    engine.run_script(output_dir + '/atlas_control_start.com', timeout = timeout)
+    if gold_streak > 0 or stall_window > 0 or callback is not None or telemetry:
+        # Record telemetry before passing it on to the user callback, so that the file is complete even if the callback
+        # stops the run
+        monitor = callback
+        if telemetry:
+            telemetry_file = open(output_dir + '/telemetry.jsonl', 'w')
+            def monitor(event):
+                telemetry_file.write(json.dumps(event) + '\n')
+                telemetry_file.flush()
+                if callback is not None:
+                    return callback(event)
+        # Disable output buffering in ATLAS, so that the watchdog sees every iteration as soon as it is completed
+        env = dict(os.environ, GFORTRAN_UNBUFFERED_ALL = 'y')
+        cancel = Event()
+        thread = ExceptionHandlingThread(target = engine.run_script, args = [output_dir + '/atlas_control.com'], kwargs = {'timeout': timeout, 'cancel': cancel, 'env': env})
+        thread.start()
+        try:
+            stopped = atlas_watchdog(output_dir, thread, cancel, gold_streak, stall_window, monitor)
+        finally:
+            if telemetry:
+                telemetry_file.close()
+            # Do not leave ATLAS running in the background if monitoring failed (e.g. the callback raised an exception)
+            cancel.set()
+            thread.join()
+        # Cancellation is expected when the run is stopped by the watchdog
+        if stopped is None and thread.exception is not None:
+            raise thread.exception
+    else:
+        engine.run_script(output_dir + '/atlas_control.com', timeout = timeout)
+        stopped = None
+    if stopped is None:
+        notify("ATLAS-9 halted", silent)
+    else:
+        notify("ATLAS-9 stopped early: {}".format(stopped), silent)
 
-    # atlas_converged() will extract the best iteration and print its convergence parameters
-    atlas_converged(output_dir, True, silent, niter)
+    # atlas_converged() will extract the best iteration and print its convergence parameters. A run stopped early has
+    # fewer iterations than requested by design, so the check for premature termination is skipped
+    atlas_converged(output_dir, True, silent, [niter, 0][stopped is not None])
+
+    engine.run_script(output_dir + '/atlas_control_end.com', timeout = timeout)
+    if not (os.path.isfile(cards['output_1']) and os.path.isfile(cards['output_2'])):
+        raise ValueError("ATLAS-9 did not output expected files")
+
+    validate_run(output_dir, silent = silent)
+
+    # ATLAS carries out all frequency integrations over a fixed range of wavelengths that may not be large enough to accommodate
+    # very high temperatures (>200 kK). Here we check if the frequency range is appropriate for the entire temperature run of the model
+    # and display an error if it is not
+    # The frequency table is printed at the beginning of the output, so the file does not need to be read in full
+    frequencies = None
+    with open(cards['output_1']) as f:
+        for kind, value in parse_atlas_output(f):
+            if kind == 'frequencies':
+                frequencies = value
+                break
+    if frequencies is None:
+        raise ValueError('Frequency table not found in {}'.format(cards['output_1']))
+    structure, units = read_structure(output_dir)
+    for temperature in [np.min(structure['temperature']), np.max(structure['temperature'])]:
+        for nu in [np.min(frequencies), np.max(frequencies)]:
+            planck_peak = blackbody_peak(temperature)[1]
+            planck_dT_peak = blackbody_dBdT_peak(temperature)[1]
+            if blackbody(nu, temperature) > 1e-3 * planck_peak:
+                warnings.warn('Planck\'s law in one of the layers at temperature {} K does not vanish at the frequency grid bound {} Hz. The result may be inaccurate!'.format(temperature, nu))
+            if blackbody_dBdT(nu, temperature) > 1e-3 * planck_dT_peak:
+                warnings.warn('Derivative of Planck\'s law (dB/dT) in one of the layers at temperature {} K does not vanish at the frequency grid bound {} Hz. The result may be inaccurate!'.format(temperature, nu))
+
+    # Also check that the temperatures in all layers are within the ODF range
+    ODF_temps, ODF_pres = ODF_grid(ODF)
+    for temperature in [np.min(structure['temperature']), np.max(structure['temperature'])]:
+        if temperature < np.min(ODF_temps) or temperature > np.max(ODF_temps):
+            warnings.warn('Gas temperature {} K  in one of the layers falls outside the ODF range [{}, {}]. The result may be inaccurate!'.format(temperature, np.min(ODF_temps), np.max(ODF_temps)))
+
+    notify("Finished running ATLAS-9 in " + str(datetime.now() - startTime) + " s", silent)
+
+def ODF_key(zscale, Y, abun):
+    """
+    Generate the lookup key of a chemical composition in the ODF library index (see ODF_index()). Compositions that agree
+    to the precision of the ATLAS control cards (0.01 dex in metallicity and individual abundances, 0.001 in the helium
+    mass fraction) share the same key
+
+    ATLAS does not accept abundances below -20 in its own format (see Settings.abun_std_to_atlas()), so any depletion
+    beyond that floor is lost, and meta() of the resulting ODF reports the enhancement at the floor rather than the
+    requested one (e.g. [Li/M]=-11.22 for a requested -15). Elements at the floor are therefore listed without a value,
+    so that the requested and the reported compositions share the same key
+
+    arguments:
+        zscale         :     Metallicity, [M/H]
+        Y              :     Helium mass fraction
+        abun           :     Dictionary of enhancements of individual chemical elements [dex over solar]
+
+    returns:
+        The key as a string
+    """
+    # Adding 0.0 turns negative zeros into positive ones
+    abun = {element: round(float(abun[element]), 2) + 0.0 for element in abun}
+    if len(abun) > 0:
+        Z = np.loadtxt(python_path + '/data/solar.csv', usecols = [0], unpack = True, delimiter = ',')
+        symbol = np.loadtxt(python_path + '/data/solar.csv', usecols = [5], unpack = True, delimiter = ',', dtype = str)
+        elements = Settings().abun_std_to_atlas(Y, zscale, abun)
+        for element in abun:
+            if round(float(elements[int(Z[symbol == element][0])]), 2) <= -20.0:
+                abun[element] = None
+    abun = sorted([[element, abun[element]] for element in abun if abun[element] != 0.0])
+    return json.dumps([round(float(zscale), 2) + 0.0, round(float(Y), 3) + 0.0, abun])
+
+# Cache of ODF library indices loaded by the current process
+ODF_index_cache = {}
+
+def ODF_stamp(run_dir):
+    """
+    Describe the state of the output files of a DFSYNTHE run that are used by the ODF library index (see ODF_index()), so
+    that the index can detect ODFs that have been added, removed, completed or recalculated
+
+    arguments:
+        run_dir        :     Output directory of the DFSYNTHE run
+
+    returns:
+        Sorted list of [filename, size, modification time in ns] for xnfdf.out, kappa.ros and all p00big*.bdf files.
+        None if the directory does not contain a complete DFSYNTHE run
+    """
+    if not (os.path.isfile(run_dir + '/xnfdf.out') and os.path.isfile(run_dir + '/kappa.ros')):
+        return None
+    stamp = []
+    for filename in sorted(os.listdir(run_dir)):
+        if filename in ['xnfdf.out', 'kappa.ros'] or re.match('^p00big[0-9]+\.bdf$', filename):
+            stat = os.stat(run_dir + '/' + filename)
+            stamp += [[filename, stat.st_size, stat.st_mtime_ns]]
+    return stamp
+
+def ODF_index(library = python_path + '/data', rebuild = False):
+    """
+    Load the index of an ODF library. An ODF library is a directory whose subdirectories are DFSYNTHE runs (other
+    subdirectories are ignored). The index lists the chemical composition and the available turbulent velocities of
+    every ODF in the library, and is cached in the file ODF_index.json inside the library, so that ODFs can be found by
+    composition without parsing the output of DFSYNTHE (see meta()) every time
+
+    Every ODF in the index is stored with the state of its output files (see ODF_stamp()). The state of all ODFs is
+    compared against the index on every call, so the index is updated automatically when ODFs are added to or removed
+    from the library, or when their files change (e.g. a DFSYNTHE run in the library completes). Only the changed ODFs are
+    parsed in that case, and the cached file is only rewritten if the index has changed. The index is additionally kept in
+    memory for the lifetime of the process
+
+    arguments:
+        library        :     Path to the ODF library. Defaults to the "data" directory of BasicATLAS, which contains
+                             the solar ODF
+        rebuild        :     If True, parse all ODFs in the library again, ignoring the cached index
+
+    returns:
+        The index as a dictionary with the following keys:
+            ODFs         :       Dictionary of all ODFs in the library keyed by subdirectory name. Each ODF is described
+                                 by a dictionary with "zscale", "Y", "abun" (see meta()), "vturb" (list of available
+                                 turbulent velocities), "key" (see ODF_key()) and "stamp" (see ODF_stamp())
+            lookup       :       Dictionary of subdirectory names keyed by ODF_key()
+    """
+    library = os.path.realpath(library)
+    if not os.path.isdir(library):
+        raise ValueError('ODF library {} not found'.format(library))
+    stamps = {}
+    for name in sorted(os.listdir(library)):
+        if os.path.isdir(library + '/' + name) and (stamp := ODF_stamp(library + '/' + name)) is not None:
+            stamps[name] = stamp
+    if (not rebuild) and (library in ODF_index_cache) and ({name: ODF['stamp'] for name, ODF in ODF_index_cache[library]['ODFs'].items()} == stamps):
+        return ODF_index_cache[library]
+
+    # Load the cached index
+    index_fn = library + '/ODF_index.json'
+    index = {'ODFs': {}}
+    if (not rebuild) and os.path.isfile(index_fn):
+        f = open(index_fn, 'r')
+        index = json.load(f)
+        f.close()
+
+    # Parse the ODFs that have changed since they were last indexed
+    ODFs = {}
+    for name, stamp in stamps.items():
+        if index['ODFs'].get(name, {}).get('stamp', None) == stamp:
+            ODFs[name] = index['ODFs'][name]
+            continue
+        ODF_meta = meta(library + '/' + name)
+        ODFs[name] = {'zscale': float(ODF_meta['zscale']), 'Y': float(ODF_meta['Y']), 'abun': {element: float(ODF_meta['abun'][element]) for element in ODF_meta['abun']}}
+        ODFs[name]['vturb'] = sorted([int(re.findall('^p00big([0-9]+)\.bdf$', entry[0])[0]) for entry in stamp if entry[0].startswith('p00big')])
+        ODFs[name]['key'] = ODF_key(ODFs[name]['zscale'], ODFs[name]['Y'], ODFs[name]['abun'])
+        ODFs[name]['stamp'] = stamp
+    if ODFs != index['ODFs']:
+        index = {'ODFs': ODFs}
+        # Write into a temporary file first so that concurrent readers never see an incomplete index
+        try:
+            f = open(index_fn + '.{}.tmp'.format(os.getpid()), 'w')
+            json.dump(index, f, indent = 4)
+            f.close()
+            os.replace(index_fn + '.{}.tmp'.format(os.getpid()), index_fn)
+        except OSError:
+            warnings.warn('Could not save the index of the ODF library {}'.format(library))
+
+    index['lookup'] = {}
+    for name in index['ODFs']:
+        index['lookup'][index['ODFs'][name]['key']] = name
+    ODF_index_cache[library] = index
+    return index
+
+def find_ODF(settings, library = python_path + '/data'):
+    """
+    Find an ODF compatible with given settings in an ODF library (see ODF_index())
+
+    arguments:
+        settings       :     Object of class Settings() with required chemical abundances and turbulent velocity
+        library        :     Path to the ODF library
+
+    returns:
+        Path to the output directory of the DFSYNTHE run with the compatible ODF
+    """
+    index = ODF_index(library)
+    key = ODF_key(settings.zscale, settings.mass_fractions()[1], settings.abun)
+    if key not in index['lookup']:
+        raise ValueError('No ODF for zscale={}, Y={}, abun={} in library {}'.format(settings.zscale, settings.mass_fractions()[1], dict(settings.abun), library))
+    name = index['lookup'][key]
+    if int(settings.vturb) not in index['ODFs'][name]['vturb']:
+        raise ValueError('ODF {} not calculated for vturb={}. Available vturb: {}'.format(name, settings.vturb, index['ODFs'][name]['vturb']))
+    return os.path.realpath(library) + '/' + name
+
+def missing_ODFs(grid, library = python_path + '/data'):
+    """
+    Check a list of models against an ODF library (see ODF_index()) and determine which chemical compositions are not
+    available in the library yet, so that they can be calculated with dfsynthe() before the models are run
+
+    arguments:
+        grid           :     List of models as objects of class Settings()
+        library        :     Path to the ODF library
+
+    returns:
+        List of missing compositions. Each composition is listed once as an object of class Settings() with the
+        "zscale", "Y" and "abun" attributes set, regardless of how many models require it. Compositions that are
+        available in the library, but not for the required turbulent velocity, are included as well
+    """
+    index = ODF_index(library)
+    missing = {}
+    for settings in grid:
+        key = ODF_key(settings.zscale, settings.mass_fractions()[1], settings.abun)
+        if (key in index['lookup']) and (int(settings.vturb) in index['ODFs'][index['lookup'][key]]['vturb']):
+            continue
+        if key not in missing:
+            missing[key] = Settings()
+            missing[key].zscale = settings.zscale
+            missing[key].Y = settings.Y
+            missing[key].abun = copy.deepcopy(settings.abun)
+    return list(missing.values())
+
+def read_fortran_records(filename):
+    """
+    Read a Fortran sequential unformatted file (e.g. the ODFs in "p00big*.bdf") as a list of records. Every record is
+    enclosed by 4-byte markers that store its length in bytes
+
+    arguments:
+        filename       :     Path to the file
+
+    returns:
+        List of records as bytes objects
+    """
+    f = open(filename, 'rb')
+    content = f.read()
+    f.close()
+    records = []
+    pos = 0
+    while pos < len(content):
+        length = int(np.frombuffer(content, dtype = '<i4', count = 1, offset = pos)[0])
+        if length < 0 or pos + 8 + length > len(content) or int(np.frombuffer(content, dtype = '<i4', count = 1, offset = pos + 4 + length)[0]) != length:
+            raise ValueError('File {} is not a valid Fortran unformatted file'.format(filename))
+        records += [content[pos + 4 : pos + 4 + length]]
+        pos += 8 + length
+    return records
+
+def write_fortran_records(filename, records):
+    """
+    Write a list of records into a Fortran sequential unformatted file (see read_fortran_records())
+
+    arguments:
+        filename       :     Path to the file
+        records        :     List of records as bytes objects
+    """
+    f = open(filename, 'wb')
+    for record in records:
+        marker = np.array([len(record)], dtype = '<i4').tobytes()
+        f.write(marker + record + marker)
+    f.close()
+
+def ODF_coordinates(zscale, Y, abun, elements):
+    """
+    Calculate the coordinates of a chemical composition in the space of compositions used to interpolate ODFs (see
+    interpolate_ODF()). The coordinates are the metallicity, the helium-to-hydrogen number ratio (rather than the helium
+    mass fraction, which changes with metallicity at fixed helium abundance) and the enhancements of individual elements
+
+    arguments:
+        zscale         :     Metallicity, [M/H]
+        Y              :     Helium mass fraction. Any number outside the valid range loads the solar value
+        abun           :     Dictionary of enhancements of individual chemical elements [dex over solar]
+        elements       :     List of elements to include in the coordinates
+
+    returns:
+        Dictionary of coordinates keyed by "zscale", "He" (log10 of the helium-to-hydrogen number ratio) and element
+        symbols. The coordinates are rounded to the precision of ODF_key()
+    """
+    atlas_abun = Settings().abun_std_to_atlas(Y, zscale, abun)
+    coordinates = {'zscale': round(float(zscale), 2) + 0.0, 'He': round(float(np.log10(atlas_abun[2] / atlas_abun[1])), 3) + 0.0}
+    for element in elements:
+        if element in abun:
+            coordinates[element] = round(float(abun[element]), 2) + 0.0
+        else:
+            coordinates[element] = 0.0
+    return coordinates
+
+def ODF_grid(ODF):
+    """
+    Read the temperature-pressure grid that the ODF of a DFSYNTHE run is tabulated on from the control file of XNFDF
+    (xnfdf.com). Interpolated ODFs (see interpolate_ODF()) keep a copy of the control file of one of their components
+
+    arguments:
+        ODF            :     Output directory of the DFSYNTHE run or of the interpolated ODF
+
+    returns:
+        ODF_temps      :     List of temperatures of the grid in K
+        ODF_pres       :     List of gas pressures of the grid
+    """
+    if not os.path.isfile(ODF + '/xnfdf.com'):
+        raise ValueError('XNFDF control file not found in {}'.format(ODF))
+    ODF_temps = []
+    ODF_pres = []
+    reading = False
+    with open(ODF + '/xnfdf.com') as f:
+        for line in f:
+            if line.find('RHOX,T,P,XNE,ABROSS,ACCRAD,VTURB,CONVFRAC,VCONV') != -1:
+                reading = True
+                continue
+            if len(line) < 10:
+                reading = False
+                continue
+            if reading:
+                line = np.loadtxt([line])
+                ODF_temps += [line[1]]
+                ODF_pres += [line[2]]
+    return ODF_temps, ODF_pres
+
+def interpolate_ODF(output_dir, settings, library = python_path + '/data', silent = False):
+    """
+    Build an approximate ODF for a chemical composition that is not in an ODF library (see ODF_index()) by interpolating
+    between the ODFs of bracketing compositions in the library. The interpolation is multilinear in the coordinates of
+    ODF_coordinates() (metallicity, helium abundance and enhancements of individual elements, e.g. [alpha/M]). For every
+    coordinate in turn, the ODFs that match the required value are used if available; otherwise, the nearest available
+    values on either side are interpolated between. The library must therefore contain ODFs at the corners of a box
+    around the required composition in all coordinates that are not matched exactly. Elements whose enhancements are
+    equal to each other in all ODFs and in the required composition (e.g. the alpha elements in a grid of ODFs in
+    [alpha/M]) are treated as a single coordinate
+
+    The ODFs ("p00big*.bdf") are stored by SEPARATEDF as 2-byte integers proportional to the logarithm of the opacity,
+    and the Rosseland mean opacities in "kappa.ros" are tabulated as logarithms as well, so the interpolation is linear
+    in the logarithm of the opacity. The output directory can be passed to atlas() in place of the output of dfsynthe().
+    The interpolation is recorded in "interpolated.json" in the output directory, and meta() of the output directory
+    reports the interpolated composition with the "interpolated" flag set. The control file of XNFDF (xnfdf.com), which
+    defines the temperature-pressure grid of the ODF (see ODF_grid()), is copied from the first component, after checking
+    that all components share the same grid
+
+    Interpolated ODFs are approximate. See benchmarks/odf_interpolation.py for a comparison of models calculated with
+    interpolated and exact ODFs
+
+    arguments:
+        output_dir     :     Directory to store the interpolated ODF. Must NOT exist
+        settings       :     Object of class Settings() with required chemical abundances and turbulent velocity
+        library        :     Path to the ODF library
+        silent         :     Do not print status messages
+
+    returns:
+        Path to the output directory
+    """
+    if os.path.isdir(output_dir):
+        raise ValueError('Directory {} already exists'.format(output_dir))
+    index = ODF_index(library)
+    library = os.path.realpath(library)
+
+    # Only ODFs available for the required turbulent velocity are considered
+    names = [name for name in index['ODFs'] if int(settings.vturb) in index['ODFs'][name]['vturb']]
+    elements = sorted(set([element for name in names for element in index['ODFs'][name]['abun']] + list(settings.abun.keys())))
+    target = ODF_coordinates(settings.zscale, settings.Y, settings.abun, elements)
+    candidates = [(name, ODF_coordinates(index['ODFs'][name]['zscale'], index['ODFs'][name]['Y'], index['ODFs'][name]['abun'], elements)) for name in names]
+
+    def bracket(candidates, axes):
+        # Find the ODFs and their weights for the remaining axes, or return None if the composition cannot be bracketed
+        if len(candidates) == 0:
+            return None
+        if len(axes) == 0:
+            return [(candidates[0][0], 1.0)]
+        axis = axes[0]
+        exact = [candidate for candidate in candidates if candidate[1][axis] == target[axis]]
+        if len(exact) != 0 and (result := bracket(exact, axes[1:])) is not None:
+            return result
+        below = [candidate[1][axis] for candidate in candidates if candidate[1][axis] < target[axis]]
+        above = [candidate[1][axis] for candidate in candidates if candidate[1][axis] > target[axis]]
+        if len(below) == 0 or len(above) == 0:
+            return None
+        low = bracket([candidate for candidate in candidates if candidate[1][axis] == max(below)], axes[1:])
+        high = bracket([candidate for candidate in candidates if candidate[1][axis] == min(above)], axes[1:])
+        if low is None or high is None:
+            return None
+        weight = (target[axis] - max(below)) / (min(above) - max(below))
+        return [(name, w * (1 - weight)) for name, w in low] + [(name, w * weight) for name, w in high]
+
+    # Elements whose enhancements are equal in all ODFs and in the required composition (e.g. the alpha elements in a grid
+    # of ODFs in [alpha/M]) are varied together, so they are combined into a single coordinate
+    groups = {}
+    for element in elements:
+        groups.setdefault(tuple([target[element]] + [candidate[1][element] for candidate in candidates]), element)
+    components = bracket(candidates, ['zscale', 'He'] + list(groups.values()))
+    if components is None:
+        raise ValueError('Cannot interpolate the ODF for zscale={}, Y={}, abun={}: the composition is not bracketed by the ODFs in library {}'.format(settings.zscale, settings.Y, dict(settings.abun), library))
+    weights = {}
+    for name, weight in components:
+        weights[name] = weights.get(name, 0.0) + weight
+    weights = {name: weights[name] for name in weights if weights[name] > 0.0}
+    notify('Interpolating the ODF between ' + ', '.join(['{} (weight {:.3f})'.format(name, weights[name]) for name in weights]), silent)
+    vturb = sorted(set.intersection(*[set(index['ODFs'][name]['vturb']) for name in weights]))
+    grids = [ODF_grid(library + '/' + name) for name in weights]
+    if any([grid != grids[0] for grid in grids]):
+        raise ValueError('The interpolated ODFs are tabulated on different temperature-pressure grids')
+
+    os.mkdir(output_dir)
+    output_dir = os.path.realpath(output_dir)
+    copyfile(library + '/{}/xnfdf.com'.format(list(weights.keys())[0]), output_dir + '/xnfdf.com')
+
+    # Interpolate the ODFs record by record. ATLAS-9 reads every record of the ODF (one per temperature-pressure point)
+    # as a single array of 2-byte integers for all frequencies and sub-bins, so every record must have the same even
+    # length, and all ODFs share the same temperature, pressure and frequency grids, so their records must be identical
+    # in number and length
+    for v in vturb:
+        result = None
+        for name in weights:
+            records = read_fortran_records(library + '/{}/p00big{}.bdf'.format(name, v))
+            if len(records) == 0 or len(set([len(record) for record in records])) != 1 or len(records[0]) % 2 != 0:
+                raise ValueError('{} does not consist of records of 2-byte integers of equal length'.format(library + '/{}/p00big{}.bdf'.format(name, v)))
+            if result is None:
+                lengths = [len(record) for record in records]
+                result = [np.zeros(length // 2) for length in lengths]
+            elif [len(record) for record in records] != lengths:
+                raise ValueError('ODF {} does not match the other ODFs in the interpolation'.format(name))
+            for i, record in enumerate(records):
+                result[i] += weights[name] * np.frombuffer(record, dtype = '<i2')
+        write_fortran_records(output_dir + '/p00big{}.bdf'.format(v), [np.clip(np.rint(record), -32768, 32767).astype('<i2').tobytes() for record in result])
+
+    # Interpolate the Rosseland mean opacities. Every row of the table lists log(T), log(P) and log(kappa) for the five
+    # standard turbulent velocities followed by auxiliary columns that are taken from the first ODF as they are
+    tables = {}
+    for name in weights:
+        f = open(library + '/{}/kappa.ros'.format(name), 'r')
+        tables[name] = f.read().split('\n')
+        f.close()
+    first = list(weights.keys())[0]
+    if len(set([len(tables[name]) for name in tables])) != 1:
+        raise ValueError('The Rosseland mean opacity tables of the interpolated ODFs do not match')
+    f = open(output_dir + '/kappa.ros', 'w')
+    for i, line in enumerate(tables[first]):
+        if not re.match('^ [0-9]\.[0-9][0-9][ -][0-9]\.[0-9][0-9]', line):
+            f.write(line + ['\n', ''][i == len(tables[first]) - 1])
+            continue
+        if len(set([tables[name][i][:10] for name in tables])) != 1:
+            raise ValueError('The Rosseland mean opacity tables of the interpolated ODFs are tabulated on different grids')
+        kappa = np.sum([weights[name] * np.array([float(tables[name][i][10 + j * 7 : 17 + j * 7]) for j in range(5)]) for name in weights], axis = 0)
+        f.write(line[:10] + ''.join(['{:7.3f}'.format(value) for value in kappa]) + line[45:] + ['\n', ''][i == len(tables[first]) - 1])
+    f.close()
+
+    f = open(output_dir + '/interpolated.json', 'w')
+    json.dump({'zscale': float(settings.zscale), 'Y': float(settings.mass_fractions()[1]), 'abun': {key: float(settings.abun[key]) for key in settings.abun}, 'library': library, 'components': weights, 'vturb': vturb}, f, indent = 4)
+    f.close()
+    return output_dir
+
+def grid_settings(grid):
+    """
+    Convert a grid of models or chemical compositions into a list of objects of class Settings()
+
+    arguments:
+        grid           :     List of grid entries. Each entry may be given either as an object of class Settings() or
+                             as a dictionary of Settings() attributes (e.g. {'teff': 4000, 'logg': 1.5, 'zscale': -1.0}),
+                             so a table of parameters can be passed as a list of its rows. Omitted attributes take their
+                             default values
+
+    returns:
+        List of objects of class Settings()
+    """
+    models = []
+    for i, model in enumerate(grid):
+        if not isinstance(model, Settings):
+            settings = Settings()
+            for key in model:
+                if not hasattr(settings, key):
+                    raise ValueError('Unknown model parameter {} in grid entry {}'.format(key, i))
+                setattr(settings, key, model[key])
+            model = settings
+        models += [model]
+    return models
+
+def ODF_name(settings):
+    """
+    Generate the name of the subdirectory of an ODF library that build_ODF_library() uses for a chemical composition,
+    e.g. "zscale_-1.00_Y_0.245_Mg_+0.40_Si_+0.40"
+
+    arguments:
+        settings       :     Object of class Settings() with the chemical composition
+
+    returns:
+        The name as a string
+    """
+    zscale, Y, abun = json.loads(ODF_key(settings.zscale, settings.mass_fractions()[1], settings.abun))
+    return 'zscale_{:+.2f}_Y_{:.3f}'.format(zscale, Y) + ''.join(['_{}_{:+.2f}'.format(element, value) for element, value in abun])
+
+def build_ODF_library_composition(output_dir, settings, parallel):
+    """
+    Calculate the ODF of a single chemical composition for build_ODF_library(). The function is executed in a worker
+    process and never raises: instead, the outcome of the calculation is returned to the parent process
+
+    returns:
+        status         :     "done" if the ODF was calculated successfully and "failed" otherwise
+        error          :     Description of the exception raised by dfsynthe() or None if the calculation succeeded
+        elapsed        :     Wall time of the calculation in seconds
+    """
+    startTime = datetime.now()
+    try:
+        dfsynthe(output_dir, settings, parallel = parallel, resume = True, silent = True)
+        status = 'done'; error = None
+    except Exception as e:
+        status = 'failed'; error = '{}: {}'.format(type(e).__name__, e)
+    return status, error, (datetime.now() - startTime).total_seconds()
+
+def build_ODF_library(grid, library = python_path + '/data', max_workers = None, silent = False):
+    """
+    Calculate the ODFs for a grid of chemical compositions and add them to an ODF library (see ODF_index()). Compositions
+    that are already in the library are skipped. Every missing composition is calculated by dfsynthe() (including its
+    own XNFDF stage) in a new subdirectory of the library named by ODF_name(), and the compositions are calculated
+    concurrently in a pool of worker processes. Calculating whole compositions in parallel rather than the temperatures of
+    one composition at a time keeps all workers busy until the end of the grid. The temperatures of each composition are
+    only calculated in parallel when there are fewer compositions than workers
+
+    If the calculation is interrupted, it can be resumed by calling this function again: the DFSYNTHE runs of incomplete
+    compositions are resumed from their checkpoint files (see dfsynthe()). The index of the library is updated at the end
+
+    arguments:
+        grid           :     List of chemical compositions. Each composition may be given either as an object of class
+                             Settings() or as a dictionary of Settings() attributes (e.g. {'zscale': -1.0, 'abun':
+                             {'Mg': 0.4}}), so the grid of models for atlas_grid() may be passed directly
+        library        :     Path to the ODF library. Created if it does not exist
+        max_workers    :     Total number of DFSYNTHE processes running at the same time. Defaults to the estimate of
+                             engine.available_workers(), which also respects the global core budget set with
+                             engine.set_core_budget()
+        silent         :     Do not print status messages. Individual dfsynthe() runs are always silent
+
+    returns:
+        List of calculated compositions. Each composition is described by a dictionary with the subdirectory of the
+        ODF ("dir"), its "zscale", "Y" and "abun", "status" ("done" or "failed"), "error" and wall "time" in seconds
+    """
+    startTime = datetime.now()
+    if not os.path.isdir(library):
+        os.makedirs(library)
+    library = os.path.realpath(library)
+
+    # Compositions that are in the library, but not for a required turbulent velocity, are skipped as well, since dfsynthe()
+    # always calculates the same standard velocities
+    index = ODF_index(library)
+    missing = [settings for settings in missing_ODFs(grid_settings(grid), library) if ODF_key(settings.zscale, settings.mass_fractions()[1], settings.abun) not in index['lookup']]
+    notify('{} compositions missing from the ODF library {}'.format(len(missing), library), silent)
+    if len(missing) == 0:
+        return []
+    ODFs = [{'dir': ODF_name(settings), 'zscale': float(settings.zscale), 'Y': float(settings.Y), 'abun': {key: float(settings.abun[key]) for key in settings.abun}, 'status': 'pending', 'error': None, 'time': None} for settings in missing]
+    for ODF in ODFs:
+        if os.path.isdir(library + '/' + ODF['dir']) and not os.path.isfile(library + '/' + ODF['dir'] + '/dfsynthe_progress.json'):
+            raise ValueError('Directory {} already exists and does not contain a DFSYNTHE checkpoint'.format(library + '/' + ODF['dir']))
+
+    # Split the workers between the compositions
+    if max_workers is None:
+        max_workers = engine.available_workers(dfsynthe_memory)
+    workers = min(max_workers, len(missing))
+    parallel = max_workers // workers
+    if parallel < 2:
+        parallel = False
+    notify('Calculating {} compositions at a time'.format(workers) + (', {} temperatures each'.format(parallel) if parallel else ''), silent)
+
+    import concurrent.futures
+    completed = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as executor:
+        futures = {}
+        for i, settings in enumerate(missing):
+            futures[executor.submit(build_ODF_library_composition, library + '/' + ODFs[i]['dir'], settings, parallel)] = i
+        for future in concurrent.futures.as_completed(futures):
+            ODF = ODFs[futures[future]]
+            ODF['status'], ODF['error'], ODF['time'] = future.result()
+            completed += 1
+            hours = (datetime.now() - startTime).total_seconds() / 3600
+            notify('{} {} ({}/{}) | Throughput: {:.2f} ODFs/hour'.format(ODF['dir'], ODF['status'], completed, len(ODFs), completed / hours), silent)
+            if ODF['error'] is not None:
+                notify('{} failed with {}'.format(ODF['dir'], ODF['error']), silent)
+
+    index = ODF_index(library)
+    statuses = [ODF['status'] for ODF in ODFs]
+    notify('Finished building the ODF library in {} s: {} ODFs done, {} failed. {} ODFs in the library'.format(datetime.now() - startTime, statuses.count('done'), statuses.count('failed'), len(index['ODFs'])), silent)
+    return ODFs
+
+# Approximate peak memory footprint of a single ATLAS-9 process in bytes, used to size the pool of worker processes
+atlas_memory = 5.0e8
+
+def atlas_grid_model(output_dir, settings, restart, niter, ODF, molecules, ODF_library, silent):
+    """
+    Calculate a single model of a grid for atlas_grid(). The function is executed in a worker process and never raises:
+    instead, the outcome of the calculation is returned to the parent process
+
+    returns:
+        status         :     "done" if the model was calculated successfully and "failed" otherwise
+        error          :     Description of the exception raised by the model or None if the model succeeded
+        elapsed        :     Wall time of the calculation in seconds
+    """
+    startTime = datetime.now()
+    try:
+        atlas(output_dir, settings, restart = restart, niter = niter, ODF = ODF, molecules = molecules, ODF_library = ODF_library, silent = silent)
+        status = 'done'; error = None
+    except Exception as e:
+        status = 'failed'; error = '{}: {}'.format(type(e).__name__, e)
+    return status, error, (datetime.now() - startTime).total_seconds()
+
+def atlas_grid(output_dir, grid, max_workers = None, restart = 'auto', niter = 450, ODF = python_path + '/data/solar_ODF', molecules = True, retry_failed = False, ODF_library = python_path + '/data', silent = False):
+    """
+    Run ATLAS-9 for a grid of models in parallel. Every model is calculated by atlas() in its own subdirectory of the output
+    directory (model_0, model_1, ...) and the status of every model is recorded in the manifest file (manifest.json). If the
+    grid is interrupted, it can be resumed by calling this function again with the same arguments: models that have
+    already been calculated will be skipped and incomplete models will be restarted from scratch
+
+    Models that raise exceptions (e.g. in atlas_converged()) are marked as failed in the manifest along with the error
+    message, and do not stop the rest of the grid. If a worker process dies (e.g. killed by the operating system when
+    running out of memory), all models that have not completed are marked as failed, so that they can be recalculated
+    with "retry_failed"
+
+    arguments:
+        output_dir     :     Directory to store the output. If the directory exists, it must contain the manifest of a
+                             previous run of the same grid
+        grid           :     List of models to calculate (see grid_settings())
+        max_workers    :     Maximum number of models calculated at the same time. Defaults to the estimate of
+                             engine.available_workers(), which also respects the global core budget set with
+                             engine.set_core_budget()
+        retry_failed   :     If True, models that failed in a previous run of the grid will be recalculated. Otherwise
+                             (default), they are skipped
+        silent         :     Do not print status messages. Individual atlas() runs are always silent
+        restart, niter, ODF, molecules, ODF_library : Passed to atlas() for every model in the grid. If ODF is "auto",
+                             all models are checked against the library (see missing_ODFs()) before the calculation starts
+
+    returns:
+        The manifest of the grid as a dictionary. The "models" key lists the output directory, parameters and status
+        ("pending", "running", "done" or "failed") of every model
+    """
+    startTime = datetime.now()
+
+    # Convert the grid into a list of Settings() objects and their serializable descriptions
+    models = grid_settings(grid)
+    params = [{'teff': float(s.teff), 'logg': float(s.logg), 'zscale': float(s.zscale), 'Y': float(s.Y), 'vturb': int(s.vturb), 'abun': {key: float(s.abun[key]) for key in s.abun}} for s in models]
+
+    # Make sure all models have ODFs before anything is calculated
+    if ODF == 'auto':
+        missing = missing_ODFs(models, ODF_library)
+        if len(missing) > 0:
+            raise ValueError('No ODFs in the library for {} compositions required by the grid (see build_ODF_library()): {}'.format(len(missing), ', '.join(['zscale={}, Y={}, abun={}'.format(s.zscale, s.Y, dict(s.abun)) for s in missing])))
+
+    # Load the manifest of a previous run or start a new one
+    manifest_fn = output_dir + '/manifest.json'
+    if os.path.isdir(output_dir):
+        if not os.path.isfile(manifest_fn):
+            raise ValueError('Directory {} already exists and does not contain a grid manifest'.format(output_dir))
+        f = open(manifest_fn, 'r')
+        manifest = json.load(f)
+        f.close()
+        if [model['params'] for model in manifest['models']] != params:
+            raise ValueError('The grid in {} does not match the requested grid'.format(output_dir))
+        notify('Resuming the grid in {}'.format(output_dir), silent)
+    else:
+        os.mkdir(output_dir)
+        manifest = {'models': [{'dir': 'model_{}'.format(i), 'params': params[i], 'status': 'pending', 'error': None, 'time': None} for i in range(len(models))]}
+    output_dir = os.path.realpath(output_dir)
+
+    def save_manifest():
+        # Write into a temporary file first so that an interrupted write never corrupts the manifest
+        f = open(manifest_fn + '.tmp', 'w')
+        json.dump(manifest, f, indent = 4)
+        f.close()
+        os.replace(manifest_fn + '.tmp', manifest_fn)
+
+    # Decide which models need to be calculated and remove the output of interrupted or failed attempts
+    queue = []
+    for i, model in enumerate(manifest['models']):
+        if model['status'] == 'done' and os.path.isdir(output_dir + '/' + model['dir']):
+            continue
+        if model['status'] == 'failed' and not retry_failed:
+            continue
+        if os.path.isdir(output_dir + '/' + model['dir']):
+            rmtree(output_dir + '/' + model['dir'])
+        model['status'] = 'pending'; model['error'] = None; model['time'] = None
+        queue += [i]
+    save_manifest()
+    notify('{} models in the grid, {} to be calculated'.format(len(models), len(queue)), silent)
+
+    import concurrent.futures
+    if max_workers is None:
+        max_workers = engine.available_workers(atlas_memory)
+    completed = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers = max_workers) as executor:
+        futures = {}
+        for i in queue:
+            futures[executor.submit(atlas_grid_model, output_dir + '/' + manifest['models'][i]['dir'], models[i], restart, niter, ODF, molecules, ODF_library, True)] = i
+            manifest['models'][i]['status'] = 'running'
+        save_manifest()
+        for future in concurrent.futures.as_completed(futures):
+            i = futures[future]
+            model = manifest['models'][i]
+            try:
+                model['status'], model['error'], model['time'] = future.result()
+            except concurrent.futures.process.BrokenProcessPool as e:
+                # A worker process has died. The pool cannot be used any further, so the remaining models fail as well
+                model['status'], model['error'], model['time'] = 'failed', '{}: {}'.format(type(e).__name__, e), None
+            save_manifest()
+            completed += 1
+            hours = (datetime.now() - startTime).total_seconds() / 3600
+            notify('{} {} ({}/{}) | Throughput: {:.2f} models/hour'.format(model['dir'], model['status'], completed, len(queue), completed / hours), silent)
+            if model['error'] is not None:
+                notify('{} failed with {}'.format(model['dir'], model['error']), silent)
+
+    hours = (datetime.now() - startTime).total_seconds() / 3600
+    statuses = [model['status'] for model in manifest['models']]
+    notify('Finished running the grid in {} s: {} models done, {} failed'.format(datetime.now() - startTime, statuses.count('done'), statuses.count('failed')), silent)
+    if completed > 0:
+        notify('Average throughput: {:.2f} models/hour'.format(completed / hours), silent)
+
+    return manifest
+
+def synbeg(min_wl, max_wl, res):
+    """
+    Calculate the total number of wavelength points in a given region at given resolution. The function mimics the
+    calculation carried out by synbeg.for and should produce the same output
+
+    arguments:
+        min_wl         :     Minimum wavelength of the calculation (nm)
+        max_wl         :     Maximum wavelength of the calculation (nm)
+        res            :     Sampling resolution (lambda / delta_lambda)
+    """
+    ratio = 1.0 + 1.0 / res
+    ratiolg = np.log(ratio)
+    ixwlbeg = int(np.log(min_wl) / ratiolg)
+    wbegin = np.e ** (ixwlbeg * ratiolg)
+    if (wbegin < min_wl):
+        ixwlbeg += 1
+        wbegin = np.e ** (ixwlbeg * ratiolg)
+    ixwlend = int(np.log(max_wl) / ratiolg)
+    wllast = np.e ** (ixwlend * ratiolg)
+    if (wllast > max_wl):
+        ixwlend -= 1
+        wllast = np.e ** (ixwlend * ratiolg)
+    return int(ixwlend - ixwlbeg + 1)
+
+def synthe_chunks(min_wl, max_wl, res, buffsize, chunks, overlap = 0.0, filenames = [], line_cost = 1.0):
+    """
+    Split the wavelength range of a SYNTHE run into chunks of approximately equal computational cost that can be
+    calculated in parallel. The cost of a chunk is estimated as the number of wavelength points plus "line_cost" times the
+    number of lines in the chunk. The number of lines is inferred from the indices of the line lists (see
+    index_linelists()). Line lists that have not been indexed are not accounted for
+
+    Every chunk is extended by "overlap" on either side of the boundaries it shares with its neighbours, so that the
+    wings of the lines just outside the chunk are included in the calculation. The spectrum of every chunk is trimmed
+    back to the original boundaries by read_spectrum(). The cost of the extensions is included when the chunks are
+    balanced. The number of chunks is increased beyond "chunks" if necessary to fit every extended chunk in the buffer,
+    and reduced (with a warning) if the extensions of a chunk would be wider than the chunk itself, since most of the
+    additional work would then be spent on the overlaps
+
+    arguments:
+        min_wl         :     Minimum wavelength of the calculation (nm)
+        max_wl         :     Maximum wavelength of the calculation (nm)
+        res            :     Sampling resolution (lambda / delta_lambda)
+        buffsize       :     Maximum allowed number of wavelength points per chunk
+        chunks         :     Requested number of chunks
+        overlap        :     Wavelength extension of every chunk on either side of the boundaries shared with other chunks
+                             (nm)
+        filenames      :     Paths to the line lists used in the calculation
+        line_cost      :     Cost of a single line in the units of the cost of a single wavelength point
+
+    returns:
+        List of tuples (start wavelength, end wavelength, start of the trimmed range, end of the trimmed range) for every
+        chunk (nm)
+    """
+    if overlap < 0:
+        raise ValueError('Chunk overlap must not be negative')
+    if synbeg(min_wl, min_wl + 2 * overlap, res) > buffsize:
+        raise ValueError('Requested resolution too high for buffer size')
+
+    # Cumulative cost on a fine logarithmic wavelength grid
+    grid = np.exp(np.linspace(np.log(min_wl), np.log(max_wl), 10001))
+    cost = np.log(grid / min_wl) / np.log(1.0 + 1.0 / res)
+    for filename in filenames:
+        if not (os.path.isfile(filename + '.idx') and os.path.isfile(filename + '.sorted')):
+            continue
+        index = np.load(filename + '.idx')
+        if len(index['offset']) == 0:
+            continue
+        # Lines are stored in fixed-width records, so byte offsets are proportional to line counts
+        f = open(filename + '.sorted', 'rb')
+        f.seek(int(index['offset'][0]))
+        length = len(f.readline())
+        f.close()
+        cost += line_cost * np.interp(grid, index['wl'], index['offset'] - index['offset'][0]) / length
+
+    def split(n):
+        # Boundaries of n chunks of equal cost including the overlaps. Every boundary follows from the previous one for a
+        # given cost per chunk, which is found by bisection so that the last chunk has the same cost as the others
+        def edges_for(target):
+            edges = [min_wl]
+            for i in range(n - 1):
+                start = np.interp(max(edges[-1] - overlap, min_wl) if i > 0 else min_wl, grid, cost)
+                edges += [float(np.interp(start + target, cost, grid)) - overlap]
+            return edges
+        edges = [min_wl]
+        if n > 1:
+            low = 0.0; high = cost[-1] - cost[0]
+            for iteration in range(60):
+                target = (low + high) / 2
+                edges = edges_for(target)
+                if cost[-1] - np.interp(max(edges[-1] - overlap, min_wl), grid, cost) > target:
+                    low = target
+                else:
+                    high = target
+        edges = np.round(np.array(edges + [max_wl]), 4)
+        edges[0] = min_wl; edges[-1] = max_wl
+        batches = []
+        for i in range(n):
+            wlbeg = edges[i] if i == 0 else np.round(edges[i] - overlap, 4)
+            wlend = edges[i + 1] if i == n - 1 else np.round(edges[i + 1] + overlap, 4)
+            batches += [(float(wlbeg), float(wlend), float(edges[i]), float(edges[i + 1]))]
+        return batches
+
+    fits = lambda batches: all([synbeg(batch[0], batch[1], res) <= buffsize for batch in batches])
+    # The overlaps of every chunk must not be wider than the chunk itself
+    wide = lambda batches: all([batch[3] - batch[2] >= (batch[2] - batch[0]) + (batch[1] - batch[3]) for batch in batches])
+
+    n = max(int(chunks), int(np.ceil(synbeg(min_wl, max_wl, res) / buffsize)), 1)
+    batches = split(n)
+    while not fits(batches):
+        n += 1
+        batches = split(n)
+    requested = n
+    while n > 1 and not wide(batches):
+        candidate = split(n - 1)
+        if not fits(candidate):
+            break
+        n -= 1
+        batches = candidate
+    if any([batch[3] <= batch[2] for batch in batches]):
+        raise ValueError('Wavelength range too narrow for {} chunks with an overlap of {} nm'.format(n, overlap))
+    if n < requested:
+        warnings.warn('Number of chunks reduced from {} to {}, since the overlap of {} nm would exceed the width of the chunks'.format(requested, n, overlap))
+    return batches
+
+# Atomic line lists shipped with BasicATLAS (see data/linelists/README.txt)
+atomic_linelists = ['gfall08oct17', 'vald3', 'kirby_escala', 'merged', 'BasicATLAS']
+
+# Width of the wavelength field at the start of every line in the line lists read by each importer
+linelist_importers = {'rgfalllinesnew.exe': 11, 'rmolecasc.exe': 10}
+
+def index_linelist(filename, width, block = 1024):
+    """
+    Convert a line list into the wavelength-indexed format read by extract_linelist(). The lines are sorted by
+    wavelength and saved in "<filename>.sorted" in the original format (so that they can still be read by the SYNTHE
+    importers), while "<filename>.idx" stores the byte offset and the wavelength of every "block"-th line. Hydrogen lines
+    in atomic line lists are placed at the start of the sorted file and are always extracted, since their wings extend
+    far beyond any practical wavelength margin
+
+    arguments:
+        filename       :     Path to the line list
+        width          :     Width of the wavelength field (nm) at the start of every line (see linelist_importers)
+        block          :     Number of lines per block of the index
+    """
+    stat = os.stat(filename)
+    f = open(filename, 'rb')
+    lines = [line if line.endswith(b'\n') else line + b'\n' for line in f]
+    f.close()
+    wl = np.array([float(line[:width]) for line in lines])
+    # Hydrogen lines (element code 1.00 in the gfall format) of atomic line lists
+    if width == linelist_importers['rgfalllinesnew.exe']:
+        hydrogen = np.array([line[18:24].strip() in [b'1.00', b'1.01', b'1.02'] for line in lines], dtype = bool)
+    else:
+        hydrogen = np.zeros(len(lines), dtype = bool)
+    head = b''.join([lines[i] for i in np.where(hydrogen)[0]])
+    order = np.where(~hydrogen)[0][np.argsort(wl[~hydrogen], kind = 'stable')]
+
+    f = open(filename + '.sorted.tmp', 'wb')
+    f.write(head)
+    offsets = []; starts = []; offset = len(head)
+    for i, j in enumerate(order):
+        if i % block == 0:
+            offsets += [offset]; starts += [wl[j]]
+        f.write(lines[j])
+        offset += len(lines[j])
+    f.close()
+    f = open(filename + '.idx.tmp', 'wb')
+    np.savez(f, wl = np.array(starts, dtype = float), offset = np.array(offsets, dtype = np.int64), head = len(head), width = width, end = offset, size = stat.st_size, mtime = stat.st_mtime_ns)
+    f.close()
+    os.replace(filename + '.sorted.tmp', filename + '.sorted')
+    os.replace(filename + '.idx.tmp', filename + '.idx')
+
+def synthe_linelists(linelist_dir, atomic):
+    """
+    List the line lists read by templates.synthe_lines along with the widths of their wavelength fields (see
+    linelist_importers). The binary H2O line list imported by rh2ofast.exe is not included
+
+    arguments:
+        linelist_dir   :     Directory with the line lists
+        atomic         :     Names of the atomic line lists to include (see the "linelist" argument of synthe())
+
+    returns:
+        Dictionary of widths keyed by the paths to the line lists
+    """
+    filenames = {os.path.normpath(linelist_dir + '/{}.dat'.format(name)): linelist_importers['rgfalllinesnew.exe'] for name in atomic}
+    cards = {'lines_dir': '.', 'l_files': '{l_files}', 'd_files': '{d_files}', 'synthe_suite': '', 'linelist': '{linelist}', 'C12C13': '', 'airorvac': 'VAC', 'wlbeg': 0.0, 'wlend': 0.0, 'resolu': 0.0, 'turbv': 0.0, 'ifnlte': 0, 'linout': 0, 'cutoff': 0.0, 'ifpred': 0, 'nread': 0}
+    steps = engine.parse_script(templates.synthe_lines.format(**cards))
+    for i, step in enumerate(steps[:-1]):
+        if step[0] == 'ln' and step[1].startswith('{l_files}') and steps[i + 1][0] == 'run' and os.path.basename(steps[i + 1][1]) in linelist_importers:
+            filenames[os.path.normpath(step[1].replace('{l_files}', linelist_dir + '/'))] = linelist_importers[os.path.basename(steps[i + 1][1])]
+    return filenames
+
+def index_linelists(atomic = atomic_linelists, linelist_dir = python_path + '/data/synthe_files/', silent = False):
+    """
+    Convert every line list read by templates.synthe_lines into the wavelength-indexed format (see index_linelist()), so
+    that SYNTHE runs only import the lines near the wavelength range of the calculation (see extract_linelist()). The
+    conversion only needs to be carried out once (and again if any of the line lists is replaced)
+
+    arguments:
+        atomic         :     Names of the atomic line lists to convert (see the "linelist" argument of synthe()). Missing
+                             line lists are skipped
+        linelist_dir   :     Directory with the line lists (see the "linelist_dir" argument of synthe())
+        silent         :     Do not print status messages
+    """
+    filenames = synthe_linelists(linelist_dir, atomic)
+    for filename in filenames:
+        if not os.path.isfile(filename):
+            continue
+        startTime = datetime.now()
+        index_linelist(filename, filenames[filename])
+        notify('Indexed {} in {} s'.format(filename, datetime.now() - startTime), silent)
+
+def prune_linelists(output_dir, models, cutoff = 0.0001, margin = 1.0, vturb = 1.5, atomic = atomic_linelists, linelist_dir = python_path + '/data/synthe_files/', reference = None, reference_wl = [500, 510], reference_res = 600000.0, silent = False):
+    """
+    Remove the lines that are too weak to affect the spectra of a range of model atmospheres from all atomic and
+    molecular line lists read by templates.synthe_lines, and save the reduced line lists in a new directory that may be
+    passed to synthe() as "linelist_dir". This is a generalization of data/linelists/reduce_tio.py, which removes the
+    lines below a fixed oscillator strength from the TiO list only
+
+    The range of model atmospheres (effective temperatures, surface gravities and chemical compositions) is given as a
+    list of ATLAS runs that span it, e.g. the corners of a grid. SYNTHE ignores a line in a layer of the atmosphere if the
+    opacity at the center of the line is below "cutoff" times the continuum opacity. For every line, an upper bound on the
+    ratio of the central line opacity to the Rosseland mean opacity is estimated in every layer of every model, assuming
+    that all atoms of the element are in the ionization stage of the line (or that all atoms of the rarer element are
+    bound in the molecule), that the partition function is 1 and that the line has a Doppler profile with thermal and
+    turbulent broadening. The statistical weight of the lower level is contained in gf, so the population of the lower
+    level is N g exp(-chi / kT) / U. The partition function U is never smaller than the statistical weight of the ground
+    state, which is at least 1, so setting U = 1 can only overestimate the population. Stimulated emission is neglected,
+    which overestimates the opacity as well:
+
+        S = log(gf) - 5040 / T * chi + log(lambda) + log(N / rho) - log(v_D) - log(kappa_R) + const
+
+    where "chi" is the excitation potential of the lower level (eV) and "N / rho" is the number of atoms of the element per
+    unit mass. A line is removed if S is below log(cutoff) - margin in all layers of all models. Hydrogen lines are always
+    kept. The binary H2O line list is not reduced
+
+    If a reference model is given, its spectrum is calculated with the original and the reduced line lists to estimate
+    the error introduced by the reduction
+
+    arguments:
+        output_dir     :     Directory to save the reduced line lists in. Must not exist
+        models         :     List of directories with ATLAS runs spanning the range of model atmospheres
+        cutoff         :     Line opacity cutoff of SYNTHE in the units of the continuum opacity (see templates.synthe_lines)
+        margin         :     Safety margin in dex below the cutoff, accounting for the continuum opacity being lower than
+                             the Rosseland mean opacity at some wavelengths
+        vturb          :     Turbulent velocity [km/s] used in the synthesis (see synthe())
+        atomic         :     Names of the atomic line lists to reduce (see the "linelist" argument of synthe()). Missing
+                             atomic line lists are skipped
+        linelist_dir   :     Directory with the line lists to reduce. Defaults to data/synthe_files. The reference
+                             spectrum with the original line lists is calculated from this directory as well
+        reference      :     Directory with the ATLAS run of the reference model. If None (default), the error is not
+                             estimated
+        reference_wl   :     Wavelength range of the reference synthesis (nm)
+        reference_res  :     Resolution of the reference synthesis
+        silent         :     Do not print status messages
+
+    returns:
+        Dictionary with the numbers of lines in the original ("total") and reduced ("kept") line lists keyed by the names
+        of the line lists, as well as the maximum relative error in the flux ("max_flux_error") and in the continuum-
+        normalized flux ("max_line_error") of the reference model (if requested). The dictionary is also saved in
+        "pruning.json" in the output directory
+    """
+    if os.path.isdir(output_dir):
+        raise ValueError('Directory {} already exists'.format(output_dir))
+    filenames = synthe_linelists(linelist_dir, atomic)
+    for filename in filenames:
+        if not os.path.isfile(filename) and os.path.basename(filename)[:-4] not in atomic:
+            raise ValueError('Line list {} not found'.format(filename))
+
+    # Atomic weights
+    Z, A = np.loadtxt(python_path + '/data/solar.csv', usecols = [0, 1], unpack = True, delimiter = ',')
+    weights = np.zeros(100)
+    weights[Z.astype(int)] = A
+
+    # Temperatures, Rosseland mean opacities and number of atoms of every element per unit mass in every layer of every
+    # model (SI units)
+    atmospheres = []
+    for model in models:
+        structure = read_structure(model)[0]
+        elements, params = parse_atlas_abundances(model + '/output_summary.out', lookbehind = 1, params = ['ABUNDANCE SCALE'])
+        fractions = np.array([0.0, elements[1], elements[2]] + [10 ** (elements[i] + np.log10(params['ABUNDANCE SCALE'])) for i in range(3, 100)])
+        atmospheres += [{'T': structure['temperature'], 'kappa': structure['rosseland_opacity'] * 0.1, 'N': fractions / np.sum(fractions * weights) / spc.atomic_mass}]
+
+    def strength(wl, gf, chi, species):
+        # Upper bound on log(line opacity / Rosseland mean opacity) at the center of every line in every layer of every
+        # model, maximized over layers and models. "species" lists the atomic numbers of the constituents of every
+        # species (the second one is 0 for atoms)
+        mass = weights[species[:, 0]] + weights[species[:, 1]]
+        result = np.full(len(wl), -np.inf)
+        for atmosphere in atmospheres:
+            N = np.where(species[:, 1] == 0, atmosphere['N'][species[:, 0]], np.min([atmosphere['N'][species[:, 0]], atmosphere['N'][species[:, 1]]], axis = 0))
+            N = np.where(species[:, 0] == species[:, 1], N / 2, N)
+            v_D = np.sqrt(2 * spc.k * atmosphere['T'][np.newaxis, :] / (mass[:, np.newaxis] * spc.atomic_mass) + (vturb * 1e3) ** 2)
+            S = (gf + np.log10(np.pi * spc.physical_constants['classical electron radius'][0] * spc.c / np.sqrt(np.pi) * wl * 1e-9 * N))[:, np.newaxis]
+            S = S - 5040 / atmosphere['T'][np.newaxis, :] * chi[:, np.newaxis] - np.log10(v_D) - np.log10(atmosphere['kappa'][np.newaxis, :])
+            result = np.maximum(result, np.max(S, axis = 1))
+        return result
+
+    os.makedirs(output_dir)
+    report = {}
+    block = 100000
+    for filename in filenames:
+        if not os.path.isfile(filename):
+            continue
+        startTime = datetime.now()
+        width = filenames[filename]
+        total = 0; kept = 0
+        f = open(filename, 'r')
+        g = open(output_dir + '/' + os.path.basename(filename), 'w')
+        while len(lines := f.readlines(block * 160)) > 0:
+            lines = [line for line in lines if line.strip() != '']
+            wl = np.array([float(line[:width]) for line in lines])
+            gf = np.array([float(line[width : width + 7]) for line in lines])
+            if width == linelist_importers['rgfalllinesnew.exe']:
+                # Atomic lines (gfall format): species code (element.ion) and the energies of both levels (cm^-1)
+                code = np.array([float(line[18:24]) for line in lines])
+                E = np.array([[float(line[24:36]), float(line[52:64])] for line in lines])
+                species = np.stack([np.floor(code), np.zeros(len(lines))], axis = 1).astype(int)
+                hydrogen = species[:, 0] == 1
+            else:
+                # Molecular lines: species code (e.g. 106 for CH) and the energies of both levels (cm^-1)
+                code = np.array([int(line[48:52]) for line in lines])
+                E = np.array([[float(line[22:32]), float(line[37:48])] for line in lines])
+                species = np.stack([code // 100, code % 100], axis = 1)
+                hydrogen = np.zeros(len(lines), dtype = bool)
+            # Lines of unknown species are kept
+            unknown = (species[:, 0] < 1) | (species[:, 0] > 99) | (species[:, 1] < 0) | (species[:, 1] > 99)
+            species[unknown] = 1
+            chi = np.min(np.abs(E), axis = 1) * spc.h * spc.c * 100 / spc.e
+            keep = hydrogen | unknown | (strength(wl, gf, chi, species) >= np.log10(cutoff) - margin)
+            g.write(''.join([line for line, flag in zip(lines, keep) if flag]))
+            total += len(lines); kept += int(np.sum(keep))
+        f.close()
+        g.close()
+        report[os.path.basename(filename)] = {'total': total, 'kept': kept}
+        notify('Kept {} lines out of {} in {} ({} s)'.format(kept, total, os.path.basename(filename), datetime.now() - startTime), silent)
+
+    # Estimate the error on the reference model
+    if reference is not None:
+        spectra = []
+        linelist = [name for name in ['BasicATLAS'] + atomic if os.path.isfile(output_dir + '/{}.dat'.format(name))][0]
+        for name, reference_dir in [('reference_original', linelist_dir), ('reference_reduced', output_dir)]:
+            run_dir = output_dir + '/' + name
+            os.mkdir(run_dir)
+            for filename in ['output_summary.out', 'output_last_iteration.out']:
+                copyfile(reference + '/' + filename, run_dir + '/' + filename)
+            synthe(run_dir, reference_wl[0], reference_wl[1], res = reference_res, vturb = vturb, linelist = linelist, linelist_dir = reference_dir, silent = True, progress = False)
+            spectra += [read_spectrum(run_dir)]
+        report['max_flux_error'] = float(np.max(np.abs(spectra[1]['flux'] / spectra[0]['flux'] - 1)))
+        report['max_line_error'] = float(np.max(np.abs(spectra[1]['line'] - spectra[0]['line'])))
+        notify('Maximum relative flux error in the reference model: {:.2e} (continuum-normalized: {:.2e})'.format(report['max_flux_error'], report['max_line_error']), silent)
+
+    report['cutoff'] = cutoff
+    report['margin'] = margin
+    report['models'] = [os.path.realpath(model) for model in models]
+    report['linelist_dir'] = os.path.realpath(linelist_dir)
+    f = open(output_dir + '/pruning.json', 'w')
+    json.dump(report, f, indent = 4)
+    f.close()
+    return report
+
+def extract_linelist(filename, wlbeg, wlend, destination):
+    """
+    Extract the lines within a wavelength range from a line list converted by index_linelist()
+
+    arguments:
+        filename       :     Path to the original line list
+        wlbeg          :     Start wavelength of the range (nm)
+        wlend          :     End wavelength of the range (nm)
+        destination    :     Path to save the extracted lines in
+
+    returns:
+        Number of extracted bytes or None if the line list has not been indexed or was modified after indexing
+    """
+    if not (os.path.isfile(filename + '.idx') and os.path.isfile(filename + '.sorted')):
+        return None
+    index = np.load(filename + '.idx')
+    stat = os.stat(filename)
+    if int(index['size']) != stat.st_size or int(index['mtime']) != stat.st_mtime_ns:
+        warnings.warn('Line list {} was modified after it was indexed. Run index_linelists() to update the index'.format(filename))
+        return None
+    width = int(index['width'])
+
+    # Blocks that may contain the lines in the range
+    start = max(np.searchsorted(index['wl'], wlbeg, side = 'right') - 1, 0)
+    end = np.searchsorted(index['wl'], wlend, side = 'right')
+    end = int(index['end']) if end >= len(index['offset']) else int(index['offset'][end])
+    f = open(filename + '.sorted', 'rb')
+    head = f.read(int(index['head']))
+    if len(index['offset']) > 0:
+        f.seek(int(index['offset'][start]))
+        lines = f.read(end - int(index['offset'][start])).splitlines(keepends = True)
+    else:
+        lines = []
+    f.close()
+    f = open(destination, 'wb')
+    f.write(head)
+    size = len(head)
+    for line in lines:
+        if wlbeg <= float(line[:width]) <= wlend:
+            f.write(line)
+            size += len(line)
+    f.close()
+    return size
+
+def window_linelists(cards, lines_dir, line_margin):
+    """
+    Extract the lines near the wavelength range of a SYNTHE batch from all indexed line lists (see index_linelists())
+    read by templates.synthe_lines into the "linelists" subdirectory of the directory where the line lists are imported.
+    Line lists that have not been indexed are linked into the same subdirectory as they are. The subdirectory is removed
+    by templates.synthe_lines once the import is complete
+
+    arguments:
+        cards          :     Control cards of the SYNTHE batch prepared by synthe()
+        lines_dir      :     Directory where the line lists will be imported
+        line_margin    :     Fractional wavelength margin on either side of the range. Lines within the margin are
+                             imported as well, since their wings may contribute opacity in the range
+
+    returns:
+        Control cards with the line lists replaced by the extracted ones
+    """
+    wlbeg = cards['wlbeg'] * (1 - line_margin)
+    wlend = cards['wlend'] * (1 + line_margin)
+    if os.path.isdir(lines_dir + '/linelists'):
+        rmtree(lines_dir + '/linelists')
+    os.makedirs(lines_dir + '/linelists')
+    window_cards = copy.deepcopy(cards)
+    window_cards['l_files'] = 'linelists'
+    window_cards['linelist'] = 'linelists/' + os.path.basename(cards['linelist'])
+    l_files = os.path.realpath(cards['l_files'])
+    for step in engine.parse_script(templates.synthe_lines.format(**dict(cards, lines_dir = '.'))):
+        if step[0] != 'ln' or not (os.path.dirname(os.path.realpath(step[1])) == l_files or step[1] == cards['linelist']):
+            continue
+        destination = lines_dir + '/linelists/' + os.path.basename(step[1])
+        if extract_linelist(step[1], wlbeg, wlend, destination) is None:
+            os.symlink(os.path.realpath(step[1]), destination)
+    return window_cards
 
-    cmd('bash {}/atlas_control_end.com'.format(output_dir))
-    if not (os.path.isfile(cards['output_1']) and os.path.isfile(cards['output_2'])):
-        raise ValueError("ATLAS-9 did not output expected files")
+def import_lines(filename, max_workers = None, timeout = None, silent = False):
+    """
+    Execute the control file of the line list import (see templates.synthe_lines) with every line list imported
+    concurrently into its own shard. The initialization by synbeg.exe is carried out first. Each importer (the
+    executables in linelist_importers and rh2ofast.exe) then runs in a separate subdirectory that starts with a copy of
+    the initialized files, and the shards are merged in the order of the control file once all imports are complete:
+    the output files of every shard are appended to the output files of the initialization, and the line counts
+    accumulated by every shard in the parameter file (fort.93) are added up
+
+    The merge relies on the layout of fort.93 written by synbeg.exe (a single record starting with the number of lines
+    (NLINES) and holding the number of special lines (N19) in the fifth field). If a shard changes the parameter file in
+    any other way, the shards are discarded and the control file is executed again serially. See
+    benchmarks/import_lines.py for a comparison of the merged output with a serial import
 
-    validate_run(output_dir, silent = silent)
+    arguments:
+        filename       :     Path to the control file
+        max_workers    :     Maximum number of imports running at the same time. Defaults to the estimate of
+                             engine.available_workers()
+        timeout        :     Maximum allowed run time of every executable in seconds (see engine.run_process())
+        silent         :     Do not print status messages
 
-    # ATLAS carries out all frequency integrations over a fixed range of wavelengths that may not be large enough to accommodate
-    # very high temperatures (>200 kK). Here we check if the frequency range is appropriate for the entire temperature run of the model
-    # and display an error if it is not
-    frequencies = []
-    reading = False
-    with open(cards['output_1']) as f:
-        for line in f:
-            if line.find('0FREQID') != -1:
-                reading = True
-                continue
-            if reading and len(line) < 60:
-                break
-            if reading:
-                # Minus signs in integration coefficients break the output format. Under normal circumstances
-                # all integration coefficients should be positive, but the first coefficient may be negative if
-                # the frequency grid has been artificially extended short of ~8 nm as ATLAS will assume 8 nm
-                # to be the shortest wavelength regardless
-                line = line.replace('-', ' -')
-                frequencies += list(np.loadtxt([line])[1::3])
-    frequencies = np.array(sorted(frequencies))
-    structure, units = read_structure(output_dir)
-    for temperature in [np.min(structure['temperature']), np.max(structure['temperature'])]:
-        for nu in [np.min(frequencies), np.max(frequencies)]:
-            planck_peak = blackbody_peak(temperature)[1]
-            planck_dT_peak = blackbody_dBdT_peak(temperature)[1]
-            if blackbody(nu, temperature) > 1e-3 * planck_peak:
-                warnings.warn('Planck\'s law in one of the layers at temperature {} K does not vanish at the frequency grid bound {} Hz. The result may be inaccurate!'.format(temperature, nu))
-            if blackbody_dBdT(nu, temperature) > 1e-3 * planck_dT_peak:
-                warnings.warn('Derivative of Planck\'s law (dB/dT) in one of the layers at temperature {} K does not vanish at the frequency grid bound {} Hz. The result may be inaccurate!'.format(temperature, nu))
+    returns:
+        usage          :     List of resource usage dictionaries for every launched executable (see engine.run_process())
+    """
+    import concurrent.futures
+    importers = list(linelist_importers.keys()) + ['rh2ofast.exe']
+    file = open(filename, 'r')
+    steps = engine.parse_script(file.read())
+    file.close()
+    cwd = os.path.dirname(os.path.realpath(filename))
+
+    # Split the control file into the initialization, the imports (each preceded by the steps it depends on, such as
+    # the C12/C13 ratio) and the final steps
+    is_import = lambda i: i + 2 < len(steps) and steps[i][0] == 'ln' and steps[i + 1][0] == 'run' and os.path.basename(steps[i + 1][1]) in importers and steps[i + 2][0] == 'rm'
+    start = 0
+    while start < len(steps) and not is_import(start):
+        start += 1
+    imports = []; context = []; i = start
+    while i < len(steps):
+        if is_import(i):
+            imports += [(copy.copy(context), steps[i : i + 3])]
+            i += 3
+        elif steps[i][0] == 'write' or (steps[i][0] == 'rm' and not steps[i][3]):
+            context += [steps[i]]
+            i += 1
+        else:
+            break
+    final = steps[i:]
+    if len(imports) < 2:
+        return engine.run_script(filename, timeout = timeout)
+
+    usage = []
+    for step in steps[:start]:
+        if step[0] == 'run':
+            usage += [engine.run_process(step[1], cwd, stdin = step[2], stdin_text = step[3], stdout = step[4], timeout = timeout)]
+        else:
+            cwd = engine.apply_step(step, cwd)
+    # Output files of the initialization
+    base = {}
+    for name in os.listdir(cwd):
+        if name.startswith('fort.'):
+            f = open(cwd + '/' + name, 'rb')
+            base[name] = f.read()
+            f.close()
+
+    def shard(k):
+        shard_dir = cwd + '/shard_{}'.format(k)
+        os.mkdir(shard_dir)
+        for name in base:
+            copyfile(cwd + '/' + name, shard_dir + '/' + name)
+        context, unit = imports[k]
+        for step in context:
+            engine.apply_step(step, shard_dir)
+        # Relative paths to the line lists are given with respect to the working directory of the control file
+        engine.apply_step(('ln', os.path.join(cwd, unit[0][1]), unit[0][2], unit[0][3]), shard_dir)
+        result = engine.run_process(unit[1][1], shard_dir, stdin = unit[1][2], stdin_text = unit[1][3], stdout = unit[1][4], timeout = timeout)
+        engine.apply_step(unit[2], shard_dir)
+        return result
+
+    def merge():
+        # Check the parameter files of the shards and collect the output of every shard
+        records = read_fortran_records(cwd + '/fort.93')
+        if len(records) != 1 or len(records[0]) < 20:
+            return None
+        header = np.frombuffer(records[0][:20], dtype = '<i4').copy()
+        output = {}
+        for k in range(len(imports)):
+            shard_dir = cwd + '/shard_{}'.format(k)
+            shard_records = read_fortran_records(shard_dir + '/fort.93')
+            if len(shard_records) != 1 or len(shard_records[0]) != len(records[0]) or shard_records[0][4:16] != records[0][4:16] or shard_records[0][20:] != records[0][20:]:
+                return None
+            shard_header = np.frombuffer(shard_records[0][:20], dtype = '<i4')
+            header[0] += shard_header[0] - np.frombuffer(records[0][:4], dtype = '<i4')[0]
+            header[4] += shard_header[4] - np.frombuffer(records[0][16:20], dtype = '<i4')[0]
+            for name in sorted(os.listdir(shard_dir)):
+                if not name.startswith('fort.') or name == 'fort.93':
+                    continue
+                f = open(shard_dir + '/' + name, 'rb')
+                content = f.read()
+                f.close()
+                if name in base:
+                    if not content.startswith(base[name]):
+                        return None
+                    content = content[len(base[name]):]
+                output[name] = output.get(name, []) + [content]
+        return header.tobytes() + records[0][20:], output
+
+    workers = min(len(imports), max_workers if max_workers is not None else engine.available_workers())
+    notify('Importing {} line lists in {} shards at a time'.format(len(imports), workers), silent)
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers = workers) as executor:
+            usage += list(executor.map(shard, range(len(imports))))
+        merged = merge()
+        if merged is not None:
+            write_fortran_records(cwd + '/fort.93', [merged[0]])
+            for name in merged[1]:
+                f = open(cwd + '/' + name, 'ab')
+                for content in merged[1][name]:
+                    f.write(content)
+                f.close()
+            # Keep the logs of the importers and the state left by the imports (e.g. the C12/C13 ratio)
+            for k in range(len(imports)):
+                for name in os.listdir(cwd + '/shard_{}'.format(k)):
+                    if not name.startswith('fort.'):
+                        os.replace(cwd + '/shard_{}/{}'.format(k, name), cwd + '/' + name)
+    finally:
+        for k in range(len(imports)):
+            if os.path.isdir(cwd + '/shard_{}'.format(k)):
+                rmtree(cwd + '/shard_{}'.format(k))
+
+    if merged is None:
+        warnings.warn('Line list shards in {} could not be merged. The line lists will be imported serially'.format(cwd))
+        for name in os.listdir(cwd):
+            if name.startswith('fort.') or name.endswith('.out') and name != 'synbeg.out':
+                os.remove(cwd + '/' + name)
+        return engine.run_script(filename, timeout = timeout)
+
+    for step in final:
+        if step[0] == 'run':
+            usage += [engine.run_process(step[1], cwd, stdin = step[2], stdin_text = step[3], stdout = step[4], timeout = timeout)]
+        else:
+            cwd = engine.apply_step(step, cwd)
+    return usage
 
-    # Also check that the temperatures in all layers are within the ODF range
-    ODF_temps = []
-    ODF_pres = []
-    reading = False
-    with open(ODF + '/xnfdf.com') as f:
-        for line in f:
-            if line.find('RHOX,T,P,XNE,ABROSS,ACCRAD,VTURB,CONVFRAC,VCONV') != -1:
-                reading = True
-                continue
-            if len(line) < 10:
-                reading = False
-                continue
-            if reading:
-                line = np.loadtxt([line])
-                ODF_temps += [line[1]]
-                ODF_pres += [line[2]]
-    for temperature in [np.min(structure['temperature']), np.max(structure['temperature'])]:
-        if temperature < np.min(ODF_temps) or temperature > np.max(ODF_temps):
-            warnings.warn('Gas temperature {} K  in one of the layers falls outside the ODF range [{}, {}]. The result may be inaccurate!'.format(temperature, np.min(ODF_temps), np.max(ODF_temps)))
+def linelist_stamp(script, line_margin = None):
+    """
+    Describe the line lists and other input files linked by a rendered control file for use in cache keys. The
+    description includes the path, size and modification time of every linked file. If the line lists are windowed (see
+    window_linelists()), it also includes the margin and the sizes and modification times of the indices of the line
+    lists (see index_linelist()), since they determine which lines are imported
 
-    notify("Finished running ATLAS-9 in " + str(datetime.now() - startTime) + " s", silent)
+    arguments:
+        script         :     Rendered control file
+        line_margin    :     Fractional wavelength margin of the windowed line lists or None if the line lists are not
+                             windowed
 
-def synbeg(min_wl, max_wl, res):
+    returns:
+        Description of the linked files
     """
-    Calculate the total number of wavelength points in a given region at given resolution. The function mimics the
-    calculation carried out by synbeg.for and should produce the same output
+    stamp = 'line_margin {}\n'.format(line_margin)
+    for step in engine.parse_script(script):
+        if step[0] != 'ln' or not os.path.isfile(step[1]):
+            continue
+        filenames = [step[1]]
+        if line_margin is not None:
+            filenames += [step[1] + '.idx', step[1] + '.sorted']
+        for filename in filenames:
+            if os.path.isfile(filename):
+                stat = os.stat(filename)
+                stamp += '{} {} {}\n'.format(os.path.realpath(filename), stat.st_size, stat.st_mtime_ns)
+    return stamp
+
+def publish_cache_entry(temp_dir, entry, readonly_files):
+    """
+    Publish a cache entry prepared in a temporary directory. The directory is renamed into place in a single step, so
+    concurrent runs either see the complete entry or no entry at all. The temporary directory must be on the same file
+    system as the entry (e.g. inside the cache). If another run has published the same entry in the meantime, that entry
+    is kept and the temporary directory is removed
 
     arguments:
-        min_wl         :     Minimum wavelength of the calculation (nm)
-        max_wl         :     Maximum wavelength of the calculation (nm)
-        res            :     Sampling resolution (lambda / delta_lambda)
+        temp_dir       :     Temporary directory with the content of the entry
+        entry          :     Path to the entry
+        readonly_files :     Names of the files in the entry to make read-only, i.e. those that are shared with the
+                             runs that use the entry and must never change
     """
-    ratio = 1.0 + 1.0 / res
-    ratiolg = np.log(ratio)
-    ixwlbeg = int(np.log(min_wl) / ratiolg)
-    wbegin = np.e ** (ixwlbeg * ratiolg)
-    if (wbegin < min_wl):
-        ixwlbeg += 1
-        wbegin = np.e ** (ixwlbeg * ratiolg)
-    ixwlend = int(np.log(max_wl) / ratiolg)
-    wllast = np.e ** (ixwlend * ratiolg)
-    if (wllast > max_wl):
-        ixwlend -= 1
-        wllast = np.e ** (ixwlend * ratiolg)
-    return int(ixwlend - ixwlbeg + 1)
+    for filename in readonly_files:
+        os.chmod(temp_dir + '/' + filename, 0o444)
+    # Temporary directories are only accessible to their owner
+    os.chmod(temp_dir, 0o755)
+    try:
+        os.rename(temp_dir, entry)
+    except OSError:
+        if not os.path.isdir(entry):
+            raise
+        rmtree(temp_dir)
+
+def synthe_lines(cards, line_cache, line_margin = None, timeout = None, silent = False):
+    """
+    Prepare the line lists for a SYNTHE batch in the line list cache. The preparation consists of the initialization of
+    the calculation by synbeg.exe followed by the import of the atomic and molecular line lists (rgfalllinesnew.exe,
+    rmolecasc.exe and rh2ofast.exe), as given in templates.synthe_lines, with all line lists imported concurrently (see
+    import_lines()). The output of these steps does not depend on the model atmosphere, so it can be reused by all SYNTHE
+    runs over the same wavelength range with the same settings
+
+    Every cache entry is a subdirectory of the cache named by a hash of the rendered control file, of the line margin and
+    of the sizes and modification times of all line lists it imports and of their indices (see linelist_stamp()), so
+    entries are invalidated automatically when a line list is replaced (e.g. by reduce_tio.py) or indexed again. New
+    entries are prepared in a temporary directory and published with publish_cache_entry(), so concurrent runs never see
+    incomplete entries. The line data files are made read-only and are copied into the runs that use them (see
+    synthe_batch())
+
+    arguments:
+        cards          :     Control cards of the SYNTHE batch prepared by synthe()
+        line_cache     :     Path to the cache. Created if it does not exist
+        line_margin    :     If not None, only import the lines near the wavelength range of the batch from the indexed
+                             line lists (see window_linelists())
+        timeout        :     Maximum allowed run time of every executable in seconds (see engine.run_process())
+        silent         :     Do not print status messages
 
-def synthe(output_dir, min_wl, max_wl, res = 600000.0, vturb = 1.5, abun_adjust = {}, C12C13 = False, linelist = 'BasicATLAS', buffsize = 2010001, overwrite_prev = False, air_wl = False, silent = False, progress = True):
+    returns:
+        Path to the cache entry
+    """
+    import hashlib
+    import tempfile
+    script = templates.synthe_lines.format(**dict(cards, lines_dir = '.'))
+    key = hashlib.sha1(script.encode())
+    key.update(linelist_stamp(script, line_margin).encode())
+    key = key.hexdigest()
+
+    os.makedirs(line_cache, exist_ok = True)
+    entry = os.path.realpath(line_cache) + '/' + key
+    if os.path.isdir(entry):
+        notify('Line lists found in the cache: {}'.format(entry), silent)
+        return entry
+
+    temp_dir = tempfile.mkdtemp(prefix = '.' + key, dir = line_cache)
+    try:
+        # The windowed line lists only contain the lines near the range of the batch. The margin is part of the key
+        if line_margin is not None:
+            script = templates.synthe_lines.format(**dict(window_linelists(cards, temp_dir, line_margin), lines_dir = '.'))
+        file = open(temp_dir + '/synthe_lines.com', 'w')
+        file.write(script)
+        file.close()
+        import_lines(temp_dir + '/synthe_lines.com', timeout = timeout, silent = silent)
+        if not (os.path.isfile(temp_dir + '/fort.12') and os.path.isfile(temp_dir + '/fort.93')):
+            raise ValueError('Line list import did not output expected files')
+        publish_cache_entry(temp_dir, entry, [filename for filename in os.listdir(temp_dir) if filename.startswith('fort.') and filename != 'fort.93'])
+    except:
+        if os.path.isdir(temp_dir):
+            rmtree(temp_dir)
+        raise
+    notify('Line lists imported into the cache: {}'.format(entry), silent)
+    return entry
+
+def synthe(output_dir, min_wl, max_wl, res = 600000.0, vturb = 1.5, abun_adjust = {}, C12C13 = False, linelist = 'BasicATLAS', linelist_dir = python_path + '/data/synthe_files/', buffsize = 2010001, max_memory = 'auto', overwrite_prev = False, append = False, air_wl = False, line_cache = None, line_margin = None, spectrum_cache = None, spectrum_cache_size = 1.0e10, parallel = True, chunks = None, chunk_overlap = 1.0, timeout = None, silent = False, progress = True, callback = None):
     """
     Run SYNTHE to calculate the emergent spectrum corresponding to an existing ATLAS model
 
@@ -418,18 +2017,68 @@ def synthe(output_dir, min_wl, max_wl, res = 600000.0, vturb = 1.5, abun_adjust
                              of writing)
         linelist       :     Atomic line list to use in spectral synthesis. See data/linelists/README.txt for a discussion
                              of available options. Defaults to the recommended line list
+        linelist_dir   :     Directory with the atomic and molecular line lists. Defaults to data/synthe_files. Reduced
+                             line lists for a range of model atmospheres can be prepared with prune_linelists(). The other
+                             input files of SYNTHE (e.g. molecules.dat and continua.dat) are always taken from
+                             data/synthe_files
         buffsize       :     Maximum allowed number of wavelength points per calculation. If the required number of points
                              exceeds this value, the calculation will be split into multiple batches. This argument is
                              introduced as SYNTHE allocates a buffer of finite size and cannot handle more wavelength
                              points than that. The default value, 2010001, corresponds to the default buffer size in
-                             synthe.for
+                             synthe.for. The number of points per batch is reduced further if required by "max_memory"
+        max_memory     :     Memory available to the run in bytes. The batches are made small enough to fit in this memory
+                             (see synthe_batch_memory()), and no more batches are calculated at the same time than fit in
+                             it together. If "auto" (default), the memory available to the job is determined by
+                             engine.available_memory(). If None, the memory is not accounted for. An error is raised
+                             before the calculation if a single batch cannot fit in the memory
         overwrite_prev :     If True, will remove any output of previous SYNTHE runs in the run directory before startup.
                              If False (default), an error is thrown when a previous SYNTHE run is discovered
+        append         :     If True, keep the batches of a previous SYNTHE run in the run directory and only calculate the
+                             parts of the wavelength range that they do not cover. The new batches are numbered after the
+                             existing ones and read_spectrum() merges all batches in wavelength order. The settings of the
+                             previous run (resolution, turbulent velocity, medium, line lists, C12/C13 ratio and abundance
+                             adjustments) must match the requested ones. Defaults to False
         air_wl         :     If True, save output in AIR wavelengths. If False (default), use VACUUM wavelengths
+        line_cache     :     Path to a cache of imported line lists (see synthe_lines()). If given, the line lists are
+                             only imported once for every combination of wavelength range, resolution, line list, C12/C13
+                             ratio and air/vacuum wavelengths, and the imported lines are copied into the run (as reflinks
+                             that do not duplicate the data where the file system supports them). If None (default), the
+                             line lists are imported for every batch in a temporary cache that is removed once the batch
+                             is complete
+        line_margin    :     Fractional wavelength margin around the range of every batch. If the line lists have been
+                             indexed with index_linelists(), only the lines within the range extended by this margin on
+                             either side are imported (see window_linelists()), along with all hydrogen lines. Lines outside
+                             the margin are omitted, so the spectrum may differ slightly from one calculated with the full
+                             line lists where the wings of strong lines extend beyond the margin. A margin of 0.05 (i.e.
+                             25 nm at 500 nm) is recommended. If None (default), the full line lists are imported
+        spectrum_cache :     Path to a cache of calculated SYNTHE batches. If given, every batch is looked up in the cache
+                             by a hash of the model in output_synthe.out and of all parameters of the calculation (see
+                             synthe_cache_key()), and batches found in the cache are linked into the run instead of being
+                             calculated. Calculated batches are added to the cache. The hit/miss statistics of the cache
+                             are kept in its "stats.json" (see synthe_cache_stats()). If None (default), no cache is used
+        spectrum_cache_size  Maximum total size of the spectrum cache in bytes. The least recently used entries are evicted
+                             once the size is exceeded. Defaults to 1e10 (10 GB)
+        parallel       :     If the wavelength range is split into multiple batches (see "buffsize"), calculate the batches
+                             in parallel worker processes. If True (default), the number of workers is chosen based on the
+                             available cores and memory (see engine.available_workers()). An integer sets the number of
+                             workers explicitly. If False, the batches are calculated one after another
+        chunks         :     If None (default), the wavelength range is only split into batches when it does not fit in the
+                             buffer. Otherwise, the range is split into this many batches of approximately equal cost (see
+                             synthe_chunks()), or into as many batches as there are available workers if "auto", so that a
+                             single synthesis can use multiple cores. More batches are used if required by the buffer size
+        chunk_overlap  :     Wavelength overlap between adjacent batches in nm when "chunks" is set, accounting for the
+                             wings of the lines beyond the batch boundaries. The overlapping parts are trimmed by
+                             read_spectrum(). Defaults to 1 nm
+        timeout        :     Maximum allowed run time of every executable in seconds. If exceeded, the executable is
+                             terminated and an exception is raised (see engine.run_process()). Defaults to None (no limit)
         silent         :     Do not print status messages
-        progress       :     If True (default), show progress of the run. Progress is inferred from the progress.dat file,
-                             created by patched synthe.for at the beginning of processing each atmospheric layer. The feature
-                             requires the tqdm module
+        progress       :     If True (default), show progress of the run, averaged over all batches. Progress is reported by
+                             patched synthe.for at the beginning of processing each atmospheric layer through named pipes
+                             in the batch directories (see synthe_monitor()). A progress bar is shown if the tqdm module is
+                             installed, otherwise progress is printed in steps of 10%
+        callback       :     Optional function to call at the beginning of every atmospheric layer of every batch and on the
+                             completion of every batch with a dictionary of progress information, including the elapsed
+                             time and the estimated remaining time of the batch (see synthe_monitor())
     """
     startTime = datetime.now()
 
@@ -438,15 +2087,44 @@ def synthe(output_dir, min_wl, max_wl, res = 600000.0, vturb = 1.5, abun_adjust
     if not (os.path.isfile(output_dir + '/output_last_iteration.out') and os.path.isfile(output_dir + '/output_summary.out')):
         raise ValueError('ATLAS run output not found in {}'.format(output_dir))
 
+    if append and overwrite_prev:
+        raise ValueError('Cannot set both append=True and overwrite_prev=True')
+
+    # Largest batch that fits in the available memory
+    if max_memory == 'auto':
+        max_memory = engine.available_memory()
+    if max_memory is not None:
+        points = int((max_memory - synthe_base_memory) // synthe_point_memory)
+        if synbeg(min_wl, min_wl + 1, res) > points:
+            raise ValueError('Insufficient memory for SYNTHE: a batch of 1 nm at {} nm requires {:.3f} GB, while {:.3f} GB are available'.format(min_wl, synthe_batch_memory(synbeg(min_wl, min_wl + 1, res)) / 1e9, max_memory / 1e9))
+        if points < buffsize:
+            notify('Buffer size reduced from {} to {} points to fit in {:.2f} GB of memory'.format(buffsize, points, max_memory / 1e9), silent)
+            buffsize = points
+
     # Check that SYNTHE has not already ran
-    if os.path.isdir(output_dir + '/synthe_1'):
+    previous = []
+    if os.path.isdir(output_dir + '/synthe_1') and append:
+        # Keep the previous run, once it is confirmed to be complete
+        validate_run(output_dir, silent = silent)
+        synthe_num = 1
+        while os.path.isdir(output_dir + '/synthe_{}'.format(synthe_num)):
+            if not (os.path.isfile(output_dir + '/synthe_{}/batch.json'.format(synthe_num)) and os.path.isfile(output_dir + '/synthe_{}/spectrum.bin'.format(synthe_num))):
+                raise ValueError('Previous SYNTHE run in {} cannot be extended. To overwrite, set overwrite_prev=True'.format(output_dir))
+            f = open(output_dir + '/synthe_{}/batch.json'.format(synthe_num), 'r')
+            previous += [json.load(f)]
+            f.close()
+            synthe_num += 1
+        f = open(output_dir + '/output_synthe.out', 'r')
+        previous_model = f.read()
+        f.close()
+    elif os.path.isdir(output_dir + '/synthe_1'):
         if not overwrite_prev:
             raise ValueError('Previous SYNTHE run output found in {}. To overwrite, set overwrite_prev=True'.format(output_dir))
         else:
             file = open(output_dir + '/synthe_cleanup.com', 'w')
             file.write(templates.synthe_cleanup.format(output_dir = output_dir))
             file.close()
-            cmd('bash {}/synthe_cleanup.com'.format(output_dir))
+            engine.run_script(output_dir + '/synthe_cleanup.com', timeout = timeout)
             notify("Removed the output of a previous SYNTHE run", silent)
 
     # Prepare a SYNTHE friendly file
@@ -496,36 +2174,76 @@ def synthe(output_dir, min_wl, max_wl, res = 600000.0, vturb = 1.5, abun_adjust
         notify("Updated abundances in output_synthe.out for spectral synthesis", silent)
 
     # Make sure the requested atomic line list exists
-    linelist = os.path.realpath(python_path + '/data/synthe_files/{}.dat'.format(linelist))
+    linelist = os.path.realpath(linelist_dir + '/{}.dat'.format(linelist))
     if not os.path.isfile(linelist):
         raise ValueError('Linelist {} not found'.format(linelist))
 
-    synthe_num = 0            # Batch number
-    completed = False         # The last batch sets this flag to True
-    current_min_wl = min_wl   # Start wavelength of the current batch
-    while not completed:
-        synthe_num += 1
+    # C12/C13 ratio
+    if type(C12C13) is not bool:
+        C13 = 1 / (C12C13 + 1)
+        C12 = 1 - C13
+        C12C13_line = 'echo "{} {}" > c12c13.dat'.format(np.log10(C12), np.log10(C13))
+    else:
+        C12C13_line = 'rm -f c12c13.dat'
 
-        # Determine the end wavelength
-        if synbeg(current_min_wl, max_wl, res) > buffsize:
-            current_max_wl = int(brentq(lambda x: synbeg(current_min_wl, x, res) - buffsize, current_min_wl, max_wl))
-            if current_max_wl == current_min_wl:
-                raise ValueError('Requested resolution too high for buffer size')
-        else:
-            current_max_wl = max_wl
-            completed = True
-
-        # C12/C13 ratio
-        if type(C12C13) is not bool:
-            C13 = 1 / (C12C13 + 1)
-            C12 = 1 - C13
-            C12C13_line = 'echo "{} {}" > c12c13.dat'.format(np.log10(C12), np.log10(C13))
-        else:
-            C12C13_line = 'rm -f c12c13.dat'
+    # Settings that must be shared by all batches of the run
+    batch_settings = {'res': float(res), 'vturb': float(vturb), 'air_wl': bool(air_wl), 'linelist': linelist, 'linelist_dir': os.path.realpath(linelist_dir), 'C12C13': C12C13_line}
 
-        # Generate a launcher command file
-        cards = {
+    # Parts of the wavelength range not covered by the previous run
+    intervals = [(min_wl, max_wl)]
+    if len(previous) > 0:
+        f = open(output_dir + '/output_synthe.out', 'r')
+        model = f.read()
+        f.close()
+        if model != previous_model:
+            # Restore the model of the previous run, so that it remains valid
+            f = open(output_dir + '/output_synthe.out', 'w')
+            f.write(previous_model)
+            f.close()
+            raise ValueError('Requested abundance adjustments differ from those of the previous SYNTHE run in {}'.format(output_dir))
+        for batch in previous:
+            for key in batch_settings:
+                if batch.get('settings', {}).get(key, None) != batch_settings[key]:
+                    raise ValueError('Requested {} differs from that of the previous SYNTHE run in {}: {} vs {}'.format(key, output_dir, batch_settings[key], batch.get('settings', {}).get(key, None)))
+        intervals = []
+        current_min_wl = min_wl
+        for batch in sorted(previous, key = lambda batch: batch['min_wl']):
+            if batch['min_wl'] > current_min_wl and current_min_wl < max_wl:
+                intervals += [(current_min_wl, min(batch['min_wl'], max_wl))]
+            current_min_wl = max(current_min_wl, batch['max_wl'])
+        if current_min_wl < max_wl:
+            intervals += [(current_min_wl, max_wl)]
+        notify('Previous SYNTHE run covers {} batches. Missing wavelength ranges: {}'.format(len(previous), intervals), silent)
+
+    # Split every missing part of the wavelength range into batches that fit in the buffer, or into chunks of equal cost
+    batches = []
+    if chunks == 'auto':
+        chunks = engine.available_workers(synthe_memory)
+    for interval_min_wl, interval_max_wl in intervals:
+        if chunks is None:
+            current_min_wl = interval_min_wl   # Start wavelength of the current batch
+            while True:
+                if synbeg(current_min_wl, interval_max_wl, res) > buffsize:
+                    current_max_wl = int(brentq(lambda x: synbeg(current_min_wl, x, res) - buffsize, current_min_wl, interval_max_wl))
+                    if current_max_wl == current_min_wl:
+                        raise ValueError('Requested resolution too high for buffer size')
+                    batches += [(current_min_wl, current_max_wl, current_min_wl, current_max_wl)]
+                    current_min_wl = current_max_wl
+                else:
+                    batches += [(current_min_wl, interval_max_wl, current_min_wl, interval_max_wl)]
+                    break
+        else:
+            # The chunks are distributed between the missing parts in proportion to their numbers of wavelength points
+            interval_chunks = max(1, int(np.round(chunks * synbeg(interval_min_wl, interval_max_wl, res) / np.sum([synbeg(a, b, res) for a, b in intervals]))))
+            filenames = [linelist] + list(synthe_linelists(linelist_dir, []).keys())
+            batches += synthe_chunks(interval_min_wl, interval_max_wl, res, buffsize, interval_chunks, chunk_overlap, filenames)
+
+    # Control cards of every batch
+    batch_cards = []
+    for synthe_num, (current_min_wl, current_max_wl, core_min_wl, core_max_wl) in enumerate(batches, start = len(previous) + 1):
+        batch_cards += [{
           's_files': python_path + '/data/synthe_files/',
+          'l_files': os.path.normpath(linelist_dir) + '/',
           'd_files': python_path + '/data/dfsynthe_files/',
           'synthe_suite': python_path + '/bin/',
           'airorvac': ['VAC', 'AIR'][air_wl],
@@ -543,43 +2261,476 @@ def synthe(output_dir, min_wl, max_wl, res = 600000.0, vturb = 1.5, abun_adjust
           'synthe_num': synthe_num,
           'C12C13': C12C13_line,
           'linelist': linelist,
-        }
-        file = open(output_dir + '/synthe_launch.com', 'w')
-        file.write(templates.synthe_control.format(**cards))
+          'min_wl': float(core_min_wl),
+          'max_wl': float(core_max_wl),
+          'settings': batch_settings,
+        }]
+        notify("Batch {} will cover the wavelength range ({}, {}). Expected number of points: {} (buffer {})".format(synthe_num, current_min_wl, current_max_wl, synbeg(current_min_wl, current_max_wl, res), buffsize), silent)
+
+    if len(batches) == 0:
+        notify('The requested wavelength range is already covered by the previous SYNTHE run', silent)
+        return
+
+    # Batches calculated before are taken from the spectrum cache
+    missing = batch_cards
+    if spectrum_cache is not None:
+        missing = []
+        for cards in batch_cards:
+            cards['spectrum_key'] = synthe_cache_key(cards, line_margin)
+            if not synthe_cache_restore(spectrum_cache, cards, silent = silent):
+                missing += [cards]
+        notify('{} of {} batches found in the spectrum cache'.format(len(batch_cards) - len(missing), len(batch_cards)), silent)
+
+    # XNFPELSYN output is shared by all batches
+    if len(missing) > 0:
+        xnfpelsyn_dir = synthe_xnfpelsyn(output_dir, missing[0], timeout = timeout, silent = silent)
+        for cards in missing:
+            cards['xnfpelsyn_dir'] = xnfpelsyn_dir
+
+    # Run SYNTHE. Every batch is calculated in its own directory (synthe_1, synthe_2, ...), so all batches can run at the
+    # same time
+    import concurrent.futures
+    if parallel and len(missing) > 1:
+        # Only the batches that are not restored from the spectrum cache are calculated, so only they need memory
+        batch_memory = max([synthe_batch_memory(synbeg(cards['wlbeg'], cards['wlend'], res)) for cards in missing])
+        if max_memory is None:
+            workers = min(len(missing), engine.available_workers(batch_memory) if parallel is True else int(parallel))
+        else:
+            workers = min(len(missing), engine.available_workers() if parallel is True else int(parallel), max(int(max_memory // batch_memory), 1))
+        notify('Running {} SYNTHE batches in {} worker processes. Estimated peak memory: {:.2f} GB'.format(len(missing), workers, workers * batch_memory / 1e9), silent)
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers = workers)
+    else:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers = 1)
+    monitored = (progress or callback is not None) and len(missing) > 0
+    if monitored:
+        # SYNTHE reports its progress through a named pipe in place of progress.dat
+        for cards in missing:
+            os.makedirs(output_dir + '/synthe_{}'.format(cards['synthe_num']), exist_ok = True)
+            fifo = output_dir + '/synthe_{}/progress.dat'.format(cards['synthe_num'])
+            if os.path.lexists(fifo):
+                os.remove(fifo)
+            try:
+                os.mkfifo(fifo)
+            except OSError:
+                # Named pipes are not supported by the file system. Only the completion of the batch is reported
+                pass
+    with executor:
+        futures = [executor.submit(synthe_batch, output_dir, cards, line_cache, line_margin, timeout, silent) for cards in missing]
+        if monitored:
+            pbar = None
+            if progress:
+                try:
+                    import tqdm
+                    pbar = tqdm.tqdm(total = 100)
+                except ImportError:
+                    pass
+            reported = [0]
+            def monitor(event):
+                if pbar is not None:
+                    pbar.update(max(int(np.round(event['progress'] * 100)) - pbar.n, 0))
+                elif progress and int(event['progress'] * 10) > reported[0]:
+                    reported[0] = int(event['progress'] * 10)
+                    notify('SYNTHE progress: {}%'.format(reported[0] * 10), silent)
+                if callback is not None:
+                    callback(event)
+            try:
+                synthe_monitor(output_dir, [cards['synthe_num'] for cards in missing], futures, monitor)
+            finally:
+                if pbar is not None:
+                    pbar.close()
+        for future in futures:
+            future.result()
+    notify("SYNTHE halted", silent)
+
+    if spectrum_cache is not None:
+        for cards in missing:
+            synthe_cache_store(spectrum_cache, cards, silent = silent)
+        synthe_cache_stats(spectrum_cache, hits = len(batch_cards) - len(missing), misses = len(missing), max_size = spectrum_cache_size, keep = [cards['spectrum_key'] for cards in batch_cards], silent = silent)
+
+    # The launcher of the last batch is kept in the run directory to mark the run as a SYNTHE run (see validate_run())
+    copyfile(output_dir + '/synthe_{}/synthe_launch.com'.format(batch_cards[-1]['synthe_num']), output_dir + '/synthe_launch.com')
+    validate_run(output_dir, silent = silent)
+
+    notify("Finished running SYNTHE in " + str(datetime.now() - startTime) + " s", silent)
+
+def synthe_xnfpelsyn(output_dir, cards, timeout = None, silent = False):
+    """
+    Run XNFPELSYN for a SYNTHE run and store its output in the "xnfpelsyn" subdirectory of the run directory, so that it
+    can be shared by all batches of the run. The output of XNFPELSYN (the chemical equilibrium and the continuous
+    opacities in every layer) only depends on the model in output_synthe.out (including the abundance adjustments), not on
+    the wavelength range. Every entry is a subdirectory named by a hash of output_synthe.out, the rendered control file and
+    the sizes and modification times of the files it links, so the output is also reused by later SYNTHE runs of the same
+    model (e.g. with overwrite_prev=True), which do not remove the directory
+
+    arguments:
+        output_dir     :     Run directory of the SYNTHE run
+        cards          :     Control cards of the SYNTHE run prepared by synthe()
+        timeout        :     Maximum allowed run time of XNFPELSYN in seconds (see engine.run_process())
+        silent         :     Do not print status messages
+
+    returns:
+        Path to the directory with the output of XNFPELSYN
+    """
+    import hashlib
+    import tempfile
+    script = templates.xnfpelsyn_control.format(**dict(cards, xnfpelsyn_dir = '.'))
+    key = hashlib.sha1(script.encode())
+    f = open(cards['synthe_solar'], 'rb')
+    key.update(f.read())
+    f.close()
+    for step in engine.parse_script(script):
+        if step[0] == 'ln' and os.path.isfile(step[1]):
+            stat = os.stat(step[1])
+            key.update('{} {} {}'.format(os.path.realpath(step[1]), stat.st_size, stat.st_mtime_ns).encode())
+    key = key.hexdigest()
+
+    os.makedirs(output_dir + '/xnfpelsyn', exist_ok = True)
+    entry = output_dir + '/xnfpelsyn/' + key
+    if os.path.isdir(entry):
+        notify('XNFPELSYN output found in {}'.format(entry), silent)
+        return entry
+
+    temp_dir = tempfile.mkdtemp(prefix = '.' + key, dir = output_dir + '/xnfpelsyn')
+    try:
+        file = open(temp_dir + '/xnfpelsyn.com', 'w')
+        file.write(script)
         file.close()
-        notify("Launcher created for wavelength range ({}, {}), batch {}. Expected number of points: {} (buffer {})".format(current_min_wl, current_max_wl, synthe_num, synbeg(current_min_wl, current_max_wl, res), buffsize), silent)
+        engine.run_script(temp_dir + '/xnfpelsyn.com', timeout = timeout)
+        if not os.path.isfile(temp_dir + '/xnfpelsyn.dat'):
+            raise ValueError('XNFPELSYN did not output expected files')
+        # The output is copied into the batches and must not change
+        publish_cache_entry(temp_dir, entry, ['xnfpelsyn.dat'])
+    except:
+        if os.path.isdir(temp_dir):
+            rmtree(temp_dir)
+        raise
+    notify('XNFPELSYN output saved in {}'.format(entry), silent)
+    return entry
+
+def synthe_cache_key(cards, line_margin = None):
+    """
+    Calculate the key of a SYNTHE batch in the spectrum cache (see synthe()). The key is a hash of the model in
+    output_synthe.out (including the abundance adjustments), the control files of the line import and of the batch
+    rendered with the paths of the run removed, the line margin, and the sizes and modification times of all line lists
+    they link and of their indices (see linelist_stamp()), so the key changes whenever any input of the calculation
+    changes
 
-        # Run SYNTHE
-        args = ['bash {}/synthe_launch.com'.format(output_dir)]
-        if not progress:
-            cmd(*args)
-        else:
-            thread = ExceptionHandlingThread(target = cmd, args = args)
-            thread.start()
-            import tqdm
-            pbar = tqdm.tqdm(total = 100)
-            while thread.is_alive():
-                time.sleep(2)
-                if not os.path.isfile(progress_fn := output_dir + '/synthe_{}/progress.dat'.format(synthe_num)):
-                    progress = 0
-                else:
-                    f = open(progress_fn, 'r')
-                    progress = f.read().strip().split('\n')[-1].split('/')
-                    progress = (int(progress[0].strip()) - 1) / int(progress[1].strip())
-                    f.close()
-                pbar.update(np.round(progress * 100) - pbar.n)
-            pbar.update(100)
-            pbar.close()
-            if thread.exception is not None:
-                raise thread.exception
-        if not (os.path.isfile(output_dir + '/synthe_{}/spectrum.bin'.format(cards['synthe_num']))):
-            raise ValueError("SYNTHE did not output expected files")
-        notify("SYNTHE halted", silent)
-        validate_run(output_dir, silent = silent)
+    arguments:
+        cards          :     Control cards of the SYNTHE batch prepared by synthe()
+        line_margin    :     Fractional wavelength margin for windowed line lists (see synthe())
+
+    returns:
+        Key of the batch
+    """
+    import hashlib
+    neutral = dict(cards, output_dir = '.', synthe_num = 0, synthe_solar = '.', xnfpelsyn_dir = '.', lines_dir = '.', lines = '')
+    script = templates.synthe_lines.format(**neutral) + templates.synthe_control.format(**neutral)
+    key = hashlib.sha1(script.encode())
+    f = open(cards['synthe_solar'], 'rb')
+    key.update(f.read())
+    f.close()
+    key.update(linelist_stamp(script, line_margin).encode())
+    return key.hexdigest()
 
-        current_min_wl = current_max_wl
+# Files of a SYNTHE batch stored in the spectrum cache. The spectrum is all that read_spectrum() needs, while the rest are
+# required by validate_run()
+synthe_cache_files = ['spectrum.bin', 'synbeg.out', 'synthe_lines.com', 'synthe_launch.com']
 
-    notify("Finished running SYNTHE in " + str(datetime.now() - startTime) + " s", silent)
+def synthe_cache_restore(spectrum_cache, cards, silent = False):
+    """
+    Look up a SYNTHE batch in the spectrum cache (see synthe()) and, if found, link the cached output into the directory
+    of the batch, so that the batch does not need to be calculated. The modification time of the entry is updated to
+    mark it as recently used (see synthe_cache_stats()). The entry is looked up and linked under a shared lock, so it
+    cannot be evicted by a concurrent run in the meantime. The files are hard-linked (or copied, if the cache is on a
+    different file system) rather than symbolically linked, so the run remains valid after the entry is evicted
+
+    arguments:
+        spectrum_cache :     Path to the cache
+        cards          :     Control cards of the SYNTHE batch prepared by synthe(), including the key of the batch
+                             ("spectrum_key")
+        silent         :     Do not print status messages
+
+    returns:
+        True if the batch was found in the cache, False otherwise
+    """
+    import fcntl
+    entry = os.path.realpath(spectrum_cache) + '/' + cards['spectrum_key']
+    if not os.path.isdir(spectrum_cache):
+        return False
+    lock = open(spectrum_cache + '/stats.lock', 'w')
+    fcntl.flock(lock, fcntl.LOCK_SH)
+    try:
+        if not os.path.isfile(entry + '/spectrum.bin'):
+            return False
+        batch_dir = cards['output_dir'] + '/synthe_{}'.format(cards['synthe_num'])
+        os.makedirs(batch_dir, exist_ok = True)
+        for filename in synthe_cache_files:
+            if os.path.isfile(entry + '/' + filename):
+                if os.path.lexists(batch_dir + '/' + filename):
+                    os.remove(batch_dir + '/' + filename)
+                try:
+                    os.link(entry + '/' + filename, batch_dir + '/' + filename)
+                except OSError:
+                    engine.clone_file(entry + '/' + filename, batch_dir + '/' + filename)
+        os.utime(entry)
+    finally:
+        fcntl.flock(lock, fcntl.LOCK_UN)
+        lock.close()
+    file = open(batch_dir + '/batch.json', 'w')
+    json.dump({'min_wl': cards['min_wl'], 'max_wl': cards['max_wl'], 'wlbeg': cards['wlbeg'], 'wlend': cards['wlend'], 'settings': cards['settings']}, file, indent = 4)
+    file.close()
+    notify('Batch {} found in the spectrum cache: {}'.format(cards['synthe_num'], entry), silent)
+    return True
+
+def synthe_cache_store(spectrum_cache, cards, silent = False):
+    """
+    Store the output of a calculated SYNTHE batch in the spectrum cache (see synthe()). The entry is prepared in a
+    temporary directory and published with publish_cache_entry(), so concurrent runs never see incomplete entries. The
+    files are made read-only, as they are hard-linked into the runs that use them
+
+    arguments:
+        spectrum_cache :     Path to the cache. Created if it does not exist
+        cards          :     Control cards of the SYNTHE batch prepared by synthe(), including the key of the batch
+                             ("spectrum_key")
+        silent         :     Do not print status messages
+    """
+    import tempfile
+    os.makedirs(spectrum_cache, exist_ok = True)
+    entry = os.path.realpath(spectrum_cache) + '/' + cards['spectrum_key']
+    if os.path.isdir(entry):
+        return
+    batch_dir = cards['output_dir'] + '/synthe_{}'.format(cards['synthe_num'])
+    temp_dir = tempfile.mkdtemp(prefix = '.' + cards['spectrum_key'], dir = spectrum_cache)
+    try:
+        for filename in synthe_cache_files:
+            if os.path.isfile(batch_dir + '/' + filename):
+                copyfile(batch_dir + '/' + filename, temp_dir + '/' + filename)
+        publish_cache_entry(temp_dir, entry, os.listdir(temp_dir))
+    except:
+        if os.path.isdir(temp_dir):
+            rmtree(temp_dir)
+        raise
+    notify('Batch {} stored in the spectrum cache: {}'.format(cards['synthe_num'], entry), silent)
+
+def synthe_cache_stats(spectrum_cache, hits = 0, misses = 0, max_size = None, keep = [], silent = False):
+    """
+    Update the statistics of the spectrum cache (see synthe()) and evict the least recently used entries until the total
+    size of the cache does not exceed "max_size". The statistics are kept in "stats.json" in the cache and updated under
+    an exclusive lock, so the cache can be shared by concurrent runs. Call with the default arguments to read the
+    statistics only
+
+    arguments:
+        spectrum_cache :     Path to the cache
+        hits           :     Number of batches found in the cache to add to the statistics
+        misses         :     Number of batches not found in the cache to add to the statistics
+        max_size       :     Maximum total size of the cache in bytes. If None (default), no entries are evicted
+        keep           :     Keys of the entries that must not be evicted (e.g. those used by the current run)
+        silent         :     Do not print status messages
+
+    returns:
+        Dictionary with the total numbers of hits, misses and evictions, the current number of entries and the current
+        total size of the cache in bytes
+    """
+    import fcntl
+    os.makedirs(spectrum_cache, exist_ok = True)
+    lock = open(spectrum_cache + '/stats.lock', 'w')
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    try:
+        stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        if os.path.isfile(spectrum_cache + '/stats.json'):
+            f = open(spectrum_cache + '/stats.json', 'r')
+            stats.update(json.load(f))
+            f.close()
+        stats['hits'] += hits
+        stats['misses'] += misses
+
+        # Complete entries with their sizes, most recently used first
+        entries = []
+        for key in os.listdir(spectrum_cache):
+            if key.startswith('.') or not os.path.isdir(spectrum_cache + '/' + key):
+                continue
+            size = np.sum([os.path.getsize(spectrum_cache + '/' + key + '/' + filename) for filename in os.listdir(spectrum_cache + '/' + key)])
+            entries += [(os.path.getmtime(spectrum_cache + '/' + key), key, int(size))]
+        entries = sorted(entries, reverse = True)
+        size = int(np.sum([entry[2] for entry in entries]))
+        if max_size is not None:
+            for entry in entries[::-1]:
+                if size <= max_size:
+                    break
+                if entry[1] in keep:
+                    continue
+                rmtree(spectrum_cache + '/' + entry[1])
+                entries.remove(entry)
+                size -= entry[2]
+                stats['evictions'] += 1
+                notify('Evicted entry {} from the spectrum cache'.format(entry[1]), silent)
+        stats['entries'] = len(entries)
+        stats['size'] = size
+
+        file = open(spectrum_cache + '/stats.json', 'w')
+        json.dump(stats, file, indent = 4)
+        file.close()
+    finally:
+        fcntl.flock(lock, fcntl.LOCK_UN)
+        lock.close()
+    return stats
+
+def synthe_monitor(output_dir, batches, futures, callback):
+    """
+    Follow the progress of the batches of an ongoing SYNTHE run until all of them are complete. Patched synthe.for writes
+    a line to progress.dat at the beginning of processing each atmospheric layer. If progress.dat has been created as a
+    named pipe (FIFO) before the batch is started (see synthe()), the lines are delivered to this function as soon as they
+    are written, without polling the file system. The completion of the batches is signalled through a separate pipe, so
+    the function returns as soon as the last batch is complete. The pipes are removed from the batch directories once the
+    run is complete
+
+    arguments:
+        output_dir     :     Run directory of the SYNTHE run
+        batches        :     Numbers of the monitored batches
+        futures        :     concurrent.futures.Future of every monitored batch
+        callback       :     Function to call at the beginning of every layer of every batch and on the completion of
+                             every batch, with a dictionary of progress information as its only argument. The dictionary
+                             has the following keys:
+                                 batch       :   Batch number
+                                 layer       :   Number of the layer being processed, starting with 1. Equal to "layers"
+                                                 once the batch is complete
+                                 layers      :   Total number of layers
+                                 elapsed     :   Wall time since the beginning of the first layer of the batch in seconds
+                                 eta         :   Estimated remaining wall time of the batch in seconds, based on the
+                                                 average time per layer so far. None until the first layer is complete
+                                 done        :   True if the batch is complete
+                                 progress    :   Completed fraction of all monitored batches
+    """
+    import selectors
+    import stat
+    selector = selectors.DefaultSelector()
+    wake_r, wake_w = os.pipe()
+    os.set_blocking(wake_r, False)
+    selector.register(wake_r, selectors.EVENT_READ, None)
+    # The futures may complete after the function has returned (e.g. if the callback raises). The pipe is closed under
+    # the lock, so that a late completion never writes into a closed (and possibly reused) file descriptor
+    wake_lock = Lock()
+    wake_open = [True]
+    def wake(future):
+        with wake_lock:
+            if wake_open[0]:
+                os.write(wake_w, b'\0')
+    state = {}
+    for synthe_num, future in zip(batches, futures):
+        state[synthe_num] = {'future': future, 'start': None, 'layer': 0, 'layers': 0, 'buffer': b'', 'fd': None, 'done': False}
+        fifo = output_dir + '/synthe_{}/progress.dat'.format(synthe_num)
+        if os.path.exists(fifo) and stat.S_ISFIFO(os.stat(fifo).st_mode):
+            # Opening the pipe for both reading and writing never blocks and never reports the end of the input, so
+            # neither side depends on the other having opened it
+            state[synthe_num]['fd'] = os.open(fifo, os.O_RDWR | os.O_NONBLOCK)
+            selector.register(state[synthe_num]['fd'], selectors.EVENT_READ, synthe_num)
+        # Every future writes exactly one byte once complete
+        future.add_done_callback(wake)
+
+    def report(synthe_num):
+        batch = state[synthe_num]
+        elapsed = 0.0 if batch['start'] is None else time.time() - batch['start']
+        eta = None
+        if batch['done']:
+            eta = 0.0
+        elif batch['layer'] > 1:
+            eta = elapsed / (batch['layer'] - 1) * (batch['layers'] - batch['layer'] + 1)
+        fractions = []
+        for other in state.values():
+            if other['done']:
+                fractions += [1.0]
+            elif other['layers'] > 0:
+                fractions += [(other['layer'] - 1) / other['layers']]
+            else:
+                fractions += [0.0]
+        callback({'batch': synthe_num, 'layer': batch['layer'], 'layers': batch['layers'], 'elapsed': elapsed, 'eta': eta,
+                  'done': batch['done'], 'progress': float(np.mean(fractions))})
+
+    try:
+        completed = 0
+        while completed < len(futures):
+            for key, mask in selector.select():
+                if key.data is None:
+                    completed += len(os.read(wake_r, len(futures)))
+                    for synthe_num, batch in state.items():
+                        if batch['future'].done() and not batch['done']:
+                            batch['done'] = True
+                            batch['layer'] = batch['layers']
+                            report(synthe_num)
+                    continue
+                synthe_num = key.data
+                batch = state[synthe_num]
+                try:
+                    batch['buffer'] += os.read(key.fd, 65536)
+                except BlockingIOError:
+                    continue
+                lines = batch['buffer'].split(b'\n')
+                batch['buffer'] = lines.pop()      # The last line may be incomplete
+                for line in lines:
+                    layer = line.decode().split('/')
+                    try:
+                        batch['layer'], batch['layers'] = int(layer[0].strip()), int(layer[1].strip())
+                    except (ValueError, IndexError):
+                        continue
+                    if batch['start'] is None:
+                        batch['start'] = time.time()
+                    if not batch['done']:
+                        report(synthe_num)
+    finally:
+        selector.close()
+        with wake_lock:
+            wake_open[0] = False
+            os.close(wake_w)
+        os.close(wake_r)
+        for synthe_num, batch in state.items():
+            if batch['fd'] is not None:
+                os.close(batch['fd'])
+                os.remove(output_dir + '/synthe_{}/progress.dat'.format(synthe_num))
+
+def synthe_batch(output_dir, cards, line_cache, line_margin, timeout, silent):
+    """
+    Calculate a single batch of a SYNTHE run (see synthe()) in the "synthe_<n>" subdirectory of the run directory. The
+    launcher of the batch is saved in the same subdirectory
+
+    arguments:
+        output_dir     :     Run directory of the SYNTHE run
+        cards          :     Control cards of the batch prepared by synthe()
+        line_cache     :     Path to the line list cache (see synthe()). If None, the line lists are imported in a
+                             temporary cache removed once the batch is complete
+        line_margin    :     Fractional wavelength margin for windowed line lists (see synthe())
+        timeout        :     Maximum allowed run time of every executable in seconds (see engine.run_process())
+        silent         :     Do not print status messages
+    """
+    synthe_num = cards['synthe_num']
+    cards = copy.deepcopy(cards)
+    if line_cache is None:
+        import_dir = output_dir + '/synthe_line_import_{}'.format(synthe_num)
+    else:
+        import_dir = line_cache
+    try:
+        # The imported files are copied from the cache rather than linked, since SYNTHE opens some of them for writing (e.g.
+        # the parameter file, fort.93) and a write through a link would corrupt the cache. The copies are reflinks where the
+        # file system supports them (see engine.clone_file()), so the line data are not duplicated
+        lines_dir = synthe_lines(cards, import_dir, line_margin, timeout = timeout, silent = silent)
+        link_commands = []
+        for filename in sorted(os.listdir(lines_dir)):
+            link_commands += ['cp {}/{} {}'.format(lines_dir, filename, filename)]
+        cards['lines'] = templates.synthe_lines_cached.format(lines_dir = lines_dir, link_commands = '\n'.join(link_commands))
+        os.makedirs(output_dir + '/synthe_{}'.format(synthe_num), exist_ok = True)
+        # Part of the spectrum of the batch kept by read_spectrum()
+        file = open(output_dir + '/synthe_{}/batch.json'.format(synthe_num), 'w')
+        json.dump({'min_wl': cards['min_wl'], 'max_wl': cards['max_wl'], 'wlbeg': cards['wlbeg'], 'wlend': cards['wlend'], 'settings': cards['settings']}, file, indent = 4)
+        file.close()
+        file = open(output_dir + '/synthe_{}/synthe_launch.com'.format(synthe_num), 'w')
+        file.write(templates.synthe_control.format(**cards))
+        file.close()
+        notify("Launcher created for wavelength range ({}, {}), batch {}".format(cards['wlbeg'], cards['wlend'], synthe_num), silent)
+        engine.run_script(output_dir + '/synthe_{}/synthe_launch.com'.format(synthe_num), timeout = timeout)
+    finally:
+        if line_cache is None and os.path.isdir(import_dir):
+            rmtree(import_dir)
+    if not (os.path.isfile(output_dir + '/synthe_{}/spectrum.bin'.format(synthe_num))):
+        raise ValueError("SYNTHE did not output expected files")
 
 def load_binary_spectrum(filename, mask = False):
     """
@@ -618,16 +2769,89 @@ def load_binary_spectrum(filename, mask = False):
 
     return wl, flux, cont, flux / cont
 
-def dfsynthe(output_dir, settings, parallel = False, silent = False):
+# Approximate peak memory footprint of a single DFSYNTHE process in bytes, used to size the pool of worker processes
+dfsynthe_memory = 1.0e9
+
+# Memory model of a SYNTHE batch. SYNTHE keeps the line opacity of every wavelength point of the batch in each of the 72
+# model layers as single precision numbers, on top of a fixed footprint of the executable and the remaining arrays
+synthe_layers = 72
+synthe_point_memory = synthe_layers * 4
+synthe_base_memory = 4.2e8
+
+def synthe_batch_memory(points):
+    """
+    Estimate the peak memory footprint of a single SYNTHE batch
+
+    arguments:
+        points         :     Number of wavelength points in the batch (see synbeg())
+
+    returns:
+        Memory footprint in bytes
+    """
+    return synthe_base_memory + synthe_point_memory * points
+
+# Approximate peak memory footprint of a single SYNTHE batch with the default buffer size in bytes
+synthe_memory = synthe_batch_memory(2010001)
+
+def dfsynthe_temperature(output_dir, cards, dfts, vs, i, timeout = None):
+    """
+    Run DFSYNTHE for one of the standard temperatures in its own working directory (dft_0, dft_1, ...). This function
+    is called by dfsynthe() and may be executed in a separate worker process
+
+    arguments:
+        output_dir     :     Output directory of the DFSYNTHE run
+        cards          :     Dictionary of control cards prepared by dfsynthe()
+        dfts           :     List of standard temperatures
+        vs             :     List of standard turbulent velocities
+        i              :     Index of the temperature to process in "dfts"
+        timeout        :     Maximum allowed run time of DFSYNTHE in seconds (see engine.run_process())
+
+    returns:
+        files          :     List of output files (one per turbulent velocity) relative to the output directory
+    """
+    dft_cards = copy.deepcopy(cards)
+    dft_cards['dft'] = str(int(float(dfts[i])))
+    dft_cards['dfsynthe_control_cards'] = '0' * i + '1' + '0' * (len(dfts) - 1 - i)
+    dft_cards['output_dir'] = '{}/dft_{}/'.format(output_dir, i)
+    if os.path.isdir(dft_cards['output_dir']):
+        rmtree(dft_cards['output_dir'])
+    os.mkdir(dft_cards['output_dir'])
+    file = open(filename := (output_dir + '/dft_{}/dfp.com'.format(i)), 'w')
+    file.write(templates.dfsynthe_control_start.format(**dft_cards))
+    file.write(templates.dfsynthe_control.format(**dft_cards))
+    file.write(templates.dfsynthe_control_end.format(**dft_cards))
+    file.close()
+    engine.run_script(filename, timeout = timeout)
+    files = ['dfp00t{}vt{}sortp.asc'.format(dft_cards['dft'], v) for v in vs]
+    for filename in files:
+        if not os.path.isfile(output_dir + '/' + filename):
+            raise ValueError('DFSYNTHE did not output expected files')
+    return files
+
+def dfsynthe(output_dir, settings, parallel = False, resume = False, timeout = None, silent = False):
     """
     Run DFSYNTHE and KAPPAROS to calculate Opacity Distribution Functions (ODFs) and Rosseland mean opacities for a given
     set of chemical abundances
     The calculation is carried out for 5 turbulent velocities (0, 1, 2, 4 and 8 km/s)
 
+    The progress of the calculation is recorded in the checkpoint file dfsynthe_progress.json in the output directory,
+    which lists the completed stages (XNFDF, every DFSYNTHE temperature, SEPARATEDF and KAPPA9 for every turbulent
+    velocity, KAPREADTS) along with the sizes of their output files. If the calculation is interrupted, it can be resumed
+    with "resume" set to True. Stages are only skipped if all of their output files are still present and unchanged in
+    size; incomplete stages are carried out again from scratch
+
     arguments:
-        output_dir     :     Directory to store the output. Must NOT exist
+        output_dir     :     Directory to store the output. Must NOT exist, unless "resume" is True
         settings       :     Object of class Settings() with required chemical abundances
-        parallel       :     If True, run DFSYNTHE for all temperatures in parallel using concurrent.futures
+        parallel       :     If True, run DFSYNTHE for multiple temperatures at once in a pool of worker processes,
+                             followed by SEPARATEDF and KAPPA9 for all turbulent velocities in parallel. The number of
+                             workers is estimated from the available cores and memory (see engine.available_workers()),
+                             or can be given explicitly as an integer. To share the cores with other jobs running on the
+                             same machine, see engine.set_core_budget()
+        resume         :     If True and the output directory exists, resume the calculation from its checkpoint file.
+                             The chemical abundances in "settings" must match the original calculation
+        timeout        :     Maximum allowed run time of every executable in seconds. If exceeded, the executable is
+                             terminated and an exception is raised (see engine.run_process()). Defaults to None (no limit)
         silent         :     Do not print status messages
     """
     startTime = datetime.now()
@@ -640,12 +2864,42 @@ def dfsynthe(output_dir, settings, parallel = False, silent = False):
     # Standard turbulent velocities
     vs = ['0', '1', '2', '4', '8']
 
-    # Organize the working directory
+    # Organize the working directory and load the checkpoint file if resuming
+    params = {'zscale': float(settings.zscale), 'Y': float(settings.Y), 'abun': {key: float(settings.abun[key]) for key in settings.abun}}
     if os.path.isdir(output_dir):
-        raise ValueError('Directory {} already exists'.format(output_dir))
+        if not (resume and os.path.isfile(output_dir + '/dfsynthe_progress.json')):
+            raise ValueError('Directory {} already exists'.format(output_dir))
+        f = open(output_dir + '/dfsynthe_progress.json', 'r')
+        progress = json.load(f)
+        f.close()
+        if progress['params'] != params:
+            raise ValueError('The DFSYNTHE run in {} was started for a different chemical composition: {}'.format(output_dir, progress['params']))
+        output_dir = os.path.realpath(output_dir)
+        notify('Resuming the DFSYNTHE run in {}'.format(output_dir), silent)
     else:
         os.mkdir(output_dir)
         output_dir = os.path.realpath(output_dir)
+        progress = {'params': params, 'stages': {}}
+
+    progress_lock = Lock()
+    def checkpoint(stage, files):
+        # Record the sizes of the output files of a completed stage. The checkpoint file is replaced atomically, so that
+        # an interruption never leaves it corrupted
+        with progress_lock:
+            progress['stages'][stage] = {filename: os.path.getsize(output_dir + '/' + filename) for filename in files}
+            f = open(output_dir + '/dfsynthe_progress.json.tmp', 'w')
+            json.dump(progress, f, indent = 4)
+            f.close()
+            os.replace(output_dir + '/dfsynthe_progress.json.tmp', output_dir + '/dfsynthe_progress.json')
+    def completed(stage):
+        # Check that a stage was completed and its output files are intact
+        with progress_lock:
+            if stage not in progress['stages']:
+                return False
+            for filename, size in progress['stages'][stage].items():
+                if (not os.path.isfile(output_dir + '/' + filename)) or os.path.getsize(output_dir + '/' + filename) != size:
+                    return False
+            return True
 
     # Generate the XNFDF command file
     cards = {
@@ -670,67 +2924,100 @@ def dfsynthe(output_dir, settings, parallel = False, silent = False):
     notify('Launcher created for ' + str(len(dfts)) + ' temperatures from ' + str(min(map(float, dfts))) + ' K to ' + str(max(map(float, dfts))) + ' K', silent)
     
     # Run XNFDF
-    cmd('bash {}/xnfdf.com'.format(output_dir))
-    if (not (os.path.isfile(output_dir + '/xnfpdf.dat'))) or (not (os.path.isfile(output_dir + '/xnfpdfmax.dat'))):
-         raise ValueError('XNFDF did not output expected files')
-    notify('XNFDF halted', silent)
+    if completed('xnfdf'):
+        notify('XNFDF output found in the checkpoint', silent)
+    else:
+        engine.run_script(output_dir + '/xnfdf.com', timeout = timeout)
+        if (not (os.path.isfile(output_dir + '/xnfpdf.dat'))) or (not (os.path.isfile(output_dir + '/xnfpdfmax.dat'))):
+             raise ValueError('XNFDF did not output expected files')
+        checkpoint('xnfdf', ['xnfdf.out', 'xnfpdf.dat', 'xnfpdfmax.dat'])
+        notify('XNFDF halted', silent)
     
     # Run DFSYNTHE
     notify('Will run DFSYNTHE to tabulate the ODFs (Opacity Distribution Functions)', silent)
-    def process_dft(i):
-        dft_cards = copy.deepcopy(cards)
-        dft_cards['dft'] = str(int(float(dfts[i])))
-        dft_cards['dfsynthe_control_cards'] = '0' * i + '1' + '0' * (len(dfts) - 1 - i)
-        dft_cards['output_dir'] = '{}/dft_{}/'.format(output_dir, i)
-        os.mkdir(dft_cards['output_dir'])
-        file = open(filename := (output_dir + '/dft_{}/dfp.com'.format(i)), 'w')
-        file.write(templates.dfsynthe_control_start.format(**dft_cards))
-        file.write(templates.dfsynthe_control.format(**dft_cards))
-        file.write(templates.dfsynthe_control_end.format(**dft_cards))
-        file.close()
-        cmd('bash {}'.format(filename))
+    def finish_dft(i, files):
+        checkpoint('dft_{}'.format(i), files)
         notify(str(float(dfts[i])) + ' K done! (' + str(i+1) + '/' + str(len(dfts)) + ')', silent)
-    if parallel:
-        import concurrent.futures
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            results = executor.map(process_dft, range(len(dfts)))
+    # The intermediate output of DFSYNTHE, SEPARATEDF and KAPPA9 is removed by KAPREADTS, so if the latter has completed,
+    # the former should not be checked
+    if completed('kapreadts'):
+        notify('DFSYNTHE, SEPARATEDF and KAPPA9 output found in the checkpoint', silent)
+        pending = []
     else:
+        pending = []
         for i in range(len(dfts)):
-            process_dft(i)
-
-    # Run SEPARATEDF
-    notify('Will run SEPARATEDF to merge the output in a single file for every standard turbulent velocity (0, 1, 2, 4 and 8 km/s)', silent)
-    for j, v in enumerate(vs):
-        cards['v'] = v
-        file = open(output_dir + '/separatedf.com', 'w')
+            if completed('dft_{}'.format(i)):
+                notify(str(float(dfts[i])) + ' K found in the checkpoint (' + str(i+1) + '/' + str(len(dfts)) + ')', silent)
+            else:
+                pending += [i]
+        # DFSYNTHE is slowest at high temperatures, so those are scheduled first to avoid a long tail at the end of the run
+        pending = sorted(pending, key = lambda i: -float(dfts[i]))
+    if parallel and len(pending) > 0:
+        import concurrent.futures
+        workers = min(len(pending), engine.available_workers(dfsynthe_memory) if parallel is True else int(parallel))
+        notify('Running DFSYNTHE in {} worker processes'.format(workers), silent)
+        with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as executor:
+            futures = {executor.submit(dfsynthe_temperature, output_dir, cards, dfts, vs, i, timeout): i for i in pending}
+            for future in concurrent.futures.as_completed(futures):
+                finish_dft(futures[future], future.result())
+    else:
+        for i in pending:
+            finish_dft(i, dfsynthe_temperature(output_dir, cards, dfts, vs, i, timeout))
+
+    # Run SEPARATEDF and KAPPA9 for every standard turbulent velocity. Each velocity is processed in its own working
+    # directory (vturb_0, vturb_1, ...), so all velocities can be processed at the same time
+    notify('Will run SEPARATEDF to merge the output in a single file and KAPPA9 to calculate Rosseland mean opacities for every standard turbulent velocity (0, 1, 2, 4 and 8 km/s)', silent)
+    def process_v(v):
+        v_cards = copy.deepcopy(cards)
+        v_cards['v'] = v
+        if completed('vturb_' + v):
+            notify(v + ' km/s found in the checkpoint', silent)
+            return
+        if os.path.isdir(output_dir + '/vturb_' + v):
+            rmtree(output_dir + '/vturb_' + v)
+        os.mkdir(output_dir + '/vturb_' + v)
+
+        # SEPARATEDF
+        file = open(output_dir + '/vturb_' + v + '/separatedf.com', 'w')
         for i, dft in enumerate(dfts):
-            cards['dft'] = str(int(float(dft)))
-            cards['serial'] = str(i + 10)
-            file.write(templates.separatedf_control.format(**cards))
-        file.write(templates.separatedf_control_end.format(**cards))
+            v_cards['dft'] = str(int(float(dft)))
+            v_cards['serial'] = str(i + 10)
+            file.write(templates.separatedf_control.format(**v_cards))
+        file.write(templates.separatedf_control_end.format(**v_cards))
         file.close()
-        cmd('bash {}/separatedf.com'.format(output_dir))
+        engine.run_script(output_dir + '/vturb_' + v + '/separatedf.com', timeout = timeout)
         if (not (os.path.isfile(output_dir + '/p00big' + v + '.bdf'))) or (not (os.path.isfile(output_dir + '/p00lit' + v + '.bdf'))):
             raise ValueError('SEPARATEDF did not output expected files')
-        notify(v + " km/s done! (" + str(j+1) + "/" + str(len(vs)) + ")", silent)
-    notify('SEPARATEDF halted', silent)
+
+        # KAPPA9
+        file = open(output_dir + '/kappa9v' + v + '.com', 'w')
+        file.write(templates.kappa9_control.format(**v_cards))
+        file.close()
+        engine.run_script(output_dir + '/kappa9v' + v + '.com', timeout = timeout)
+        if not os.path.isfile(output_dir + '/kapk' + v + '.dat'):
+            raise ValueError('KAPPA9 did not output expected files')
+        checkpoint('vturb_' + v, ['p00big' + v + '.bdf', 'p00lit' + v + '.bdf', 'kapk' + v + '.dat', 'vturb_' + v + '/kapm40k2.out'])
+        notify(v + ' km/s done!', silent)
+    if completed('kapreadts'):
+        pass
+    elif parallel:
+        import concurrent.futures
+        workers = min(len(vs), engine.available_workers() if parallel is True else int(parallel))
+        with concurrent.futures.ThreadPoolExecutor(max_workers = workers) as executor:
+            list(executor.map(process_v, vs))
+    else:
+        for v in vs:
+            process_v(v)
+    notify('SEPARATEDF and KAPPA9 halted', silent)
     notify("Finished running DFSYNTHE in " + str(datetime.now() - startTime) + ' s', silent)
-        
-    # Run KAPPAROS
-    notify('Will run KAPPA9 for every standard turbulent velocity', silent)
-    for i, v in enumerate(vs):
-            cards['v'] = v
-            file = open(output_dir + '/kappa9v' + v + '.com', 'w')
-            file.write(templates.kappa9_control.format(**cards))
-            file.close()
-            cmd('bash {}/kappa9v'.format(output_dir) + v + '.com')
-            notify(v + ' km/s done! (' + str(i+1) + '/' + str(len(vs)) + ')', silent)
-    
+
     # Run KAPREADTS
     file = open(output_dir + '/kapreadts.com', 'w')
     file.write(templates.kapreadts_control.format(**cards))
     file.close()
-    cmd('bash {}/kapreadts.com'.format(output_dir))
+    if not completed('kapreadts'):
+        engine.run_script(output_dir + '/kapreadts.com', timeout = timeout)
+        checkpoint('kapreadts', ['kappa.ros', 'kapm40k2.out'] + ['p00big' + v + '.bdf' for v in vs])
     notify('Merged all velocities in a single table. Final output saved in kappa.ros', silent)
     validate_run(output_dir, silent = silent)
 
@@ -745,6 +3032,8 @@ def meta(run_dir):
         raise ValueError('Run directory {} not found!'.format(run_dir))
     if os.path.isfile(run_dir + '/xnfdf.out'):
         return meta_dfsynthe(run_dir)
+    elif os.path.isfile(run_dir + '/interpolated.json'):
+        return meta_interpolated(run_dir)
     elif os.path.isfile(run_dir + '/output_summary.out'):
         return meta_atlas(run_dir)
     else:
@@ -763,10 +3052,34 @@ def meta_dfsynthe(run_dir):
             Y            :       Helium mass fraction
             zscale       :       Metallicity, [M/H] [dex over solar]
             type         :       Set to "DFSYNTHE" for a DFSYNTHE run
+            interpolated :       Set to False for a DFSYNTHE run (see meta_interpolated())
     """
     elements_received, params_received = parse_atlas_abundances(run_dir + '/xnfdf.out', classic_style = False, lookbehind = 1, params = ['0XSCALE'])
     output = Settings().abun_atlas_to_std(elements_received, np.log10(params_received['0XSCALE']))
     output['type'] = 'DFSYNTHE'
+    output['interpolated'] = False
+    return output
+
+def meta_interpolated(run_dir):
+    """
+    Get meta data for an output directory (interpolated ODF, see interpolate_ODF())
+
+    arguments:
+        run_dir        :     Output directory of interest
+
+    returns:
+        A dictionary of meta data with the same keys as in meta_dfsynthe(), as well as:
+            interpolated :       Set to True for an interpolated ODF
+            components   :       Dictionary of interpolation weights keyed by the names of the interpolated ODFs
+            library      :       Path to the ODF library of the interpolated ODFs
+    """
+    f = open(run_dir + '/interpolated.json', 'r')
+    interpolation = json.load(f)
+    f.close()
+    output = {'abun': interpolation['abun'], 'Y': interpolation['Y'], 'zscale': interpolation['zscale'], 'type': 'DFSYNTHE'}
+    output['interpolated'] = True
+    output['components'] = interpolation['components']
+    output['library'] = interpolation['library']
     return output
 
 def meta_atlas(run_dir):
@@ -789,6 +3102,7 @@ def meta_atlas(run_dir):
             synthe_vturb :       Turbulent velocity in SYNTHE [km/s]. Returns False if the velocity varies
                                  across layers
             medium       :       Whether the output wavelengths are quoted in vacuum or air
+            interpolated :       True if the model was calculated with an interpolated ODF (see interpolate_ODF())
     """
     elements_received, params_received = parse_atlas_abundances(run_dir + '/output_summary.out', classic_style = True, lookbehind = 4, params = ['ABUNDANCE SCALE', 'TEFF', 'GRAVITY'])
     output = Settings().abun_atlas_to_std(elements_received, np.log10(params_received['ABUNDANCE SCALE']))
@@ -797,6 +3111,7 @@ def meta_atlas(run_dir):
     vturb = read_structure(run_dir)[0]['turbulent_velocity'][0]
     output['vturb'] = vturb * 1e-5
     output['type'] = 'ATLAS'
+    output['interpolated'] = os.path.isfile(run_dir + '/interpolated_ODF/interpolated.json')
 
     if os.path.isfile(run_dir + '/synthe_launch.com'):
         output['type'] = 'SYNTHE'
@@ -815,8 +3130,12 @@ def meta_atlas(run_dir):
             output['synthe_vturb'] = np.sqrt(atlas_vturb[0] ** 2.0 + synthe_vturb ** 2.0)
         else:
             output['synthe_vturb'] = False
-        # Figure out if the wavelengths are vacuum or air
-        f = open(run_dir + '/synthe_launch.com')
+        # Figure out if the wavelengths are vacuum or air. If the line lists were taken from the cache (see synthe_lines()),
+        # the setting is listed in the control file of the line import instead of the launcher
+        if os.path.isfile(run_dir + '/synthe_1/synthe_lines.com'):
+            f = open(run_dir + '/synthe_1/synthe_lines.com')
+        else:
+            f = open(run_dir + '/synthe_launch.com')
         content = f.read()
         f.close()
         if content.find('\nAIR ') != -1:
@@ -954,41 +3273,48 @@ def validate_run(run_dir, return_received_synthe = False, silent = False):
 
     # SYNTHE run
     if os.path.isfile(run_dir + '/synthe_launch.com'):
-        # Read the requested values
-        f = open(run_dir + '/synthe_launch.com', 'r')
-        content = f.read()
-        f.close()
-        start = content.find('AIRorVAC  WLBEG     WLEND     RESOLU    TURBV  IFNLTE')
-        for i in range(2):
-            start = content[:start].rfind('\n')
-        end = start + content[start + 1:].find('\n') + 1
-        content = content[start:end].strip()
-        params_requested = {
-            'wlbeg': float(content[10:20].strip()),
-            'wlend': float(content[20:30].strip()),
-            'resolu': float(content[30:40].strip()),
-            'turbv': np.round(float(content[40:50].strip()), 2),
-            'ifnlte': float(content[50:53].strip()),
-            'linout': float(content[53:60].strip()),
-            'cutoff': float(content[60:70].strip()),
-            'ifpred': float(content[70:75].strip()),
-            'nread': float(content[75:80].strip()),
-        }
-
-        # Determine the index of the most recent SYNTHE run
-        synthe_index = 1
-        while os.path.isdir(run_dir + '/synthe_{}'.format(synthe_index + 1)):
-            synthe_index += 1
-
-        # Get received values from the most recent SYNTHE run
-        f = open(run_dir + '/synthe_{}/synbeg.out'.format(synthe_index), 'r')
-        content = f.read()
-        f.close()
-        params_received = {}
-        for param in params_requested:
-            params_received[param] = float(re.findall('{}={{0,1}} *([^ \\n]+)'.format(param.upper()), content)[0])
-            if params_requested[param] != params_received[param]:
-                raise ValueError('{} requested/received mismatch: {} vs {}'.format(param, params_requested[param], params_received[param]))
+        # Validate every batch, starting with the first one
+        synthe_batches = 1
+        while os.path.isdir(run_dir + '/synthe_{}'.format(synthe_batches + 1)):
+            synthe_batches += 1
+        for synthe_index in range(1, synthe_batches + 1):
+            # Read the requested values. If the line lists were taken from the cache (see synthe_lines()), the values are
+            # listed in the control file of the line import instead of the launcher. Runs that predate the control files
+            # of the batches only keep the launcher of the last batch
+            if os.path.isfile(run_dir + '/synthe_{}/synthe_lines.com'.format(synthe_index)):
+                f = open(run_dir + '/synthe_{}/synthe_lines.com'.format(synthe_index), 'r')
+            elif synthe_index != synthe_batches:
+                continue
+            else:
+                f = open(run_dir + '/synthe_launch.com', 'r')
+            content = f.read()
+            f.close()
+            start = content.find('AIRorVAC  WLBEG     WLEND     RESOLU    TURBV  IFNLTE')
+            for i in range(2):
+                start = content[:start].rfind('\n')
+            end = start + content[start + 1:].find('\n') + 1
+            content = content[start:end].strip()
+            params_requested = {
+                'wlbeg': float(content[10:20].strip()),
+                'wlend': float(content[20:30].strip()),
+                'resolu': float(content[30:40].strip()),
+                'turbv': np.round(float(content[40:50].strip()), 2),
+                'ifnlte': float(content[50:53].strip()),
+                'linout': float(content[53:60].strip()),
+                'cutoff': float(content[60:70].strip()),
+                'ifpred': float(content[70:75].strip()),
+                'nread': float(content[75:80].strip()),
+            }
+
+            # Get received values from the batch
+            f = open(run_dir + '/synthe_{}/synbeg.out'.format(synthe_index), 'r')
+            content = f.read()
+            f.close()
+            params_received = {}
+            for param in params_requested:
+                params_received[param] = float(re.findall('{}={{0,1}} *([^ \\n]+)'.format(param.upper()), content)[0])
+                if params_requested[param] != params_received[param]:
+                    raise ValueError('{} requested/received mismatch in batch {}: {} vs {}'.format(param, synthe_index, params_requested[param], params_received[param]))
         if return_received_synthe:
             return params_received
         notify('SYNTHE requested/received validation for {} successful'.format(run_dir), silent)
@@ -1101,11 +3427,30 @@ def read_spectrum(run_dir, num_bins = -1):
     if not os.path.isdir(run_dir + '/synthe_1'):
         raise ValueError('Run directory {} does not contain SYNTHE output!'.format(run_dir))
 
-    data = np.array([[], [], [], []])
+    # Wavelength ranges of all batches. Batches appended to a previous run (see the "append" argument of synthe()) may
+    # be numbered out of wavelength order
+    batches = []
     synthe_num = 1
     while os.path.isdir(run_dir + '/synthe_{}'.format(synthe_num)):
-        data = np.append(data, load_binary_spectrum(run_dir + '/synthe_{}/spectrum.bin'.format(synthe_num)), axis = 1)
+        limits = None
+        if os.path.isfile(run_dir + '/synthe_{}/batch.json'.format(synthe_num)):
+            f = open(run_dir + '/synthe_{}/batch.json'.format(synthe_num), 'r')
+            limits = json.load(f)
+            f.close()
+        batches += [(synthe_num, limits)]
         synthe_num += 1
+    if all([limits is not None for synthe_num, limits in batches]):
+        batches = sorted(batches, key = lambda batch: batch[1]['min_wl'])
+
+    data = np.array([[], [], [], []])
+    for i, (synthe_num, limits) in enumerate(batches):
+        batch = np.array(load_binary_spectrum(run_dir + '/synthe_{}/spectrum.bin'.format(synthe_num)))
+        # Trim the overlap with the adjacent batches (see synthe_chunks()) at the internal boundaries
+        if limits is not None:
+            first = i == 0
+            last = i == len(batches) - 1
+            batch = batch[:, ((batch[0] >= limits['min_wl'] * 10) | first) & ((batch[0] < limits['max_wl'] * 10) | last)]
+        data = np.append(data, batch, axis = 1)
 
     wl, flux, cont, line = data
     if num_bins > 0:
@@ -1261,3 +3606,132 @@ def synphot(run_dir, mag_system, reddening = 0.0, Rv = 3.1, filters_dir = python
                 pass
 
     return BC_dict
+
+### ASYNCIO INTERFACE ###
+
+# atlas_async(), synthe_async() and dfsynthe_async() run the calculations in worker processes supervised by an asyncio
+# event loop without blocking it. Every run is carried out by a separate Python process started with
+# asyncio.create_subprocess_exec() in its own session, so that cancelling the coroutine terminates the whole process
+# group, including any Kurucz executables and worker processes started by the run. The coroutine communicates with the
+# worker over its standard input and output: the arguments are sent to the worker, and the worker sends back callback
+# events, waiting for the return value of the callback, and finally the result or the raised exception. Status messages
+# of the worker are printed into the standard error stream
+
+# Time in seconds given to the worker process of a cancelled run to exit after SIGTERM before it is killed
+async_grace = 5.0
+
+def async_worker():
+    """
+    Entry point of the worker processes started by run_async()
+    """
+    import base64
+    import pickle
+    import sys
+    global python_path
+    # The standard output is reserved for the messages to the coroutine
+    channel = os.fdopen(os.dup(1), 'wb')
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+    def send(kind, payload):
+        try:
+            message = pickle.dumps((kind, payload))
+        except Exception:
+            message = pickle.dumps(('error', ValueError('{} (the original {} could not be passed on)'.format(payload, type(payload).__name__))))
+        channel.write(base64.b64encode(message) + b'\n')
+        channel.flush()
+    def receive():
+        return pickle.loads(base64.b64decode(sys.stdin.buffer.readline()))
+
+    request = receive()
+    python_path = request['python_path']
+    kwargs = request['kwargs']
+    if request['callback']:
+        def callback(event):
+            send('event', event)
+            return receive()
+        kwargs['callback'] = callback
+    try:
+        result = globals()[request['function']](*request['args'], **kwargs)
+    except Exception as e:
+        send('error', e)
+        return
+    send('result', result)
+
+async def run_async(function, *args, callback = None, **kwargs):
+    """
+    Run a function of this module in a worker process supervised by the asyncio event loop (see the description of the
+    asyncio interface above). If the coroutine is cancelled, the worker process and all processes started by it are
+    terminated with SIGTERM, followed by SIGKILL if they do not exit within "async_grace" seconds
+
+    arguments:
+        function       :     Name of the function to run (e.g. "atlas")
+        args           :     Positional arguments of the function. Must be picklable
+        callback       :     Optional callback passed on to the function. It is called in the event loop and may be either
+                             a regular function or a coroutine function. Its return value is passed back to the worker
+        kwargs         :     Keyword arguments of the function. Must be picklable
+
+    returns:
+        Return value of the function
+    """
+    import asyncio
+    import base64
+    import pickle
+    import signal
+    import sys
+    encode = lambda payload: base64.b64encode(pickle.dumps(payload)) + b'\n'
+    proc = await asyncio.create_subprocess_exec(sys.executable, '-c', 'import sys; sys.path.insert(0, {}); import atlas; atlas.async_worker()'.format(repr(os.path.dirname(os.path.realpath(__file__)))),
+                                                stdin = asyncio.subprocess.PIPE, stdout = asyncio.subprocess.PIPE, start_new_session = True, limit = 2 ** 30)
+    try:
+        proc.stdin.write(encode({'python_path': python_path, 'function': function, 'args': args, 'kwargs': kwargs, 'callback': callback is not None}))
+        await proc.stdin.drain()
+        while True:
+            message = await proc.stdout.readline()
+            if message == b'':
+                raise ValueError('Worker process of {}() exited unexpectedly with code {}'.format(function, await proc.wait()))
+            kind, payload = pickle.loads(base64.b64decode(message))
+            if kind == 'event':
+                reply = callback(payload)
+                if asyncio.iscoroutine(reply):
+                    reply = await reply
+                proc.stdin.write(encode(reply))
+                await proc.stdin.drain()
+            elif kind == 'error':
+                raise payload
+            else:
+                await proc.wait()
+                return payload
+    except BaseException:
+        # Do not leave the calculation running if the coroutine was cancelled or the run failed
+        if proc.returncode is None:
+            try:
+                os.killpg(proc.pid, signal.SIGTERM)
+                try:
+                    await asyncio.wait_for(proc.wait(), async_grace)
+                except asyncio.TimeoutError:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                    await proc.wait()
+            except ProcessLookupError:
+                pass
+        raise
+
+async def atlas_async(output_dir, *args, **kwargs):
+    """
+    Asynchronous version of atlas() that runs in a worker process (see run_async()). The arguments are the same as for
+    atlas(). The callback may be a coroutine function
+    """
+    return await run_async('atlas', output_dir, *args, **kwargs)
+
+async def synthe_async(output_dir, *args, **kwargs):
+    """
+    Asynchronous version of synthe() that runs in a worker process (see run_async()). The arguments are the same as for
+    synthe(). The callback may be a coroutine function. Progress bars are disabled unless "progress" is set explicitly
+    """
+    kwargs.setdefault('progress', False)
+    return await run_async('synthe', output_dir, *args, **kwargs)
+
+async def dfsynthe_async(output_dir, *args, **kwargs):
+    """
+    Asynchronous version of dfsynthe() that runs in a worker process (see run_async()). The arguments are the same as for
+    dfsynthe()
+    """
+    return await run_async('dfsynthe', output_dir, *args, **kwargs)
@@ -0,0 +1,74 @@
+# Compare the concurrent line list import (see atlas.import_lines()) with the serial execution of the same control file
+#
+# Usage: python benchmarks/import_lines.py <run_dir> <output_dir> [<batch>]
+#
+# <run_dir> is the directory of a completed SYNTHE run calculated with the full line lists (i.e. without line_margin).
+# The control file of the line list import of the given batch (1 by default) is executed twice in <output_dir>: serially
+# by engine.run_script() and concurrently by atlas.import_lines(). The script reports the wall time of both imports and
+# checks that every output file (fort.12, fort.14, fort.19, fort.20, fort.93 and any other fort.* file) is
+# byte-identical. The exit code is 1 if any of the files differ
+
+import os, sys, time
+from shutil import copyfile
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)) + '/..')
+import atlas
+import engine
+
+if len(sys.argv) < 3:
+    print('Usage: python {} <run_dir> <output_dir> [<batch>]'.format(sys.argv[0]))
+    sys.exit(1)
+run_dir = os.path.realpath(sys.argv[1])
+output_dir = sys.argv[2]
+batch = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+
+control = run_dir + '/synthe_{}/synthe_lines.com'.format(batch)
+if not os.path.isfile(control):
+    raise ValueError('Control file {} not found'.format(control))
+f = open(control, 'r')
+script = f.read()
+f.close()
+if 'linelists/' in script:
+    raise ValueError('The run was calculated with windowed line lists. Repeat it with line_margin=None')
+
+if os.path.isdir(output_dir):
+    raise ValueError('Directory {} already exists'.format(output_dir))
+os.mkdir(output_dir)
+output_dir = os.path.realpath(output_dir)
+
+timing = {}
+for method in ['serial', 'concurrent']:
+    os.mkdir(output_dir + '/' + method)
+    copyfile(control, output_dir + '/{}/synthe_lines.com'.format(method))
+    start = time.time()
+    if method == 'serial':
+        engine.run_script(output_dir + '/serial/synthe_lines.com')
+    else:
+        atlas.import_lines(output_dir + '/concurrent/synthe_lines.com')
+    timing[method] = time.time() - start
+    print('{} import: {:.1f} s'.format(method.capitalize(), timing[method]))
+print('Speed-up: {:.2f}'.format(timing['serial'] / timing['concurrent']))
+
+# Compare the output files
+outputs = {}
+for method in ['serial', 'concurrent']:
+    outputs[method] = sorted([name for name in os.listdir(output_dir + '/' + method) if name.startswith('fort.')])
+identical = outputs['serial'] == outputs['concurrent']
+if not identical:
+    print('Different output files: serial {}, concurrent {}'.format(outputs['serial'], outputs['concurrent']))
+for name in outputs['serial']:
+    if name not in outputs['concurrent']:
+        continue
+    contents = {}
+    for method in ['serial', 'concurrent']:
+        f = open(output_dir + '/{}/{}'.format(method, name), 'rb')
+        contents[method] = f.read()
+        f.close()
+    if contents['serial'] == contents['concurrent']:
+        print('{:<8s} identical ({} bytes)'.format(name, len(contents['serial'])))
+    else:
+        identical = False
+        print('{:<8s} DIFFERENT (serial {} bytes, concurrent {} bytes)'.format(name, len(contents['serial']), len(contents['concurrent'])))
+if not identical:
+    sys.exit(1)
+print('All output files are identical')
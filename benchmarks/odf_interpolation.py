@@ -0,0 +1,90 @@
+# Compare ATLAS-9 models calculated with interpolated and exact ODFs
+#
+# Usage: python benchmarks/odf_interpolation.py <library> <output_dir> <exact ODF> <ODF 1> <ODF 2> [<ODF 3> ...]
+#
+# <library> is an ODF library (see atlas.ODF_index()) that contains the exact ODF and the ODFs to interpolate between,
+# all given as subdirectory names of the library. The exact ODF must be bracketed by the other ODFs, e.g. ODFs at
+# [M/H]=-1.0 and [M/H]=0.0 for an exact ODF at [M/H]=-0.5. The interpolated ODF is built in <output_dir> from a temporary
+# library with the exact ODF left out, and a small grid of models is calculated with both the interpolated and the
+# exact ODF. The script reports the differences in the Rosseland mean opacity tables and in the model structures
+
+import os, sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)) + '/..')
+import atlas
+from settings import Settings
+
+if len(sys.argv) < 6:
+    print('Usage: python {} <library> <output_dir> <exact ODF> <ODF 1> <ODF 2> [<ODF 3> ...]'.format(sys.argv[0]))
+    sys.exit(1)
+library = os.path.realpath(sys.argv[1])
+output_dir = sys.argv[2]
+exact = sys.argv[3]
+components = sys.argv[4:]
+
+# Models to compare
+models = [(3500, 1.0), (4500, 2.0), (5750, 4.5), (8000, 4.0)]
+
+if os.path.isdir(output_dir):
+    raise ValueError('Directory {} already exists'.format(output_dir))
+os.mkdir(output_dir)
+output_dir = os.path.realpath(output_dir)
+
+# Build the interpolated ODF from a library that only contains the bracketing ODFs
+os.mkdir(output_dir + '/library')
+for component in components:
+    os.symlink(library + '/' + component, output_dir + '/library/' + component)
+exact_meta = atlas.meta(library + '/' + exact)
+settings = Settings()
+settings.zscale = exact_meta['zscale']
+settings.Y = exact_meta['Y']
+settings.abun = exact_meta['abun']
+interpolated = atlas.interpolate_ODF(output_dir + '/interpolated_ODF', settings, output_dir + '/library')
+
+# Compare the Rosseland mean opacity tables
+def load_kappa(filename):
+    f = open(filename, 'r')
+    kappa = [[float(line[10 + j * 7 : 17 + j * 7]) for j in range(5)] for line in f.read().split('\n')[2:] if line.strip() != '']
+    f.close()
+    return np.array(kappa)
+difference = load_kappa(interpolated + '/kappa.ros') - load_kappa(library + '/' + exact + '/kappa.ros')
+print('Rosseland mean opacity tables: max |delta log(kappa)| = {:.3f}, rms = {:.3f}'.format(np.max(np.abs(difference)), np.sqrt(np.mean(difference ** 2))))
+
+# Compare the ODFs themselves at the default turbulent velocity
+for v in [settings.vturb]:
+    a = np.concatenate([np.frombuffer(record, dtype = '<i2') for record in atlas.read_fortran_records(interpolated + '/p00big{}.bdf'.format(v))]).astype(float)
+    b = np.concatenate([np.frombuffer(record, dtype = '<i2') for record in atlas.read_fortran_records(library + '/' + exact + '/p00big{}.bdf'.format(v))]).astype(float)
+    print('ODF (vturb={} km/s): max |delta| = {:.0f}, rms = {:.1f} (in units of the integer ODF storage)'.format(v, np.max(np.abs(a - b)), np.sqrt(np.mean((a - b) ** 2))))
+
+# Calculate and compare the models
+compared = 0
+print('{:>6} {:>5} | {:>12} {:>16} {:>18} {:>14}'.format('Teff', 'logg', 'max|dT/T|', 'max|dlog(Pgas)|', 'max|dlog(kappa)|', 'dT(tau=1)'))
+for teff, logg in models:
+    settings.teff = teff
+    settings.logg = logg
+    structures = []
+    for name, ODF in [('exact', library + '/' + exact), ('interpolated', interpolated)]:
+        run_dir = output_dir + '/{}_{}_{}'.format(name, teff, logg)
+        try:
+            atlas.atlas(run_dir, settings, ODF = ODF, silent = True)
+            structures += [atlas.read_structure(run_dir)[0]]
+        except Exception as e:
+            print('{} model at Teff={}, logg={} failed: {}'.format(name, teff, logg, e))
+    if len(structures) != 2:
+        continue
+    exact_structure, interpolated_structure = structures
+    # Compare on the Rosseland optical depth scale
+    tau = exact_structure['rosseland_optical_depth']
+    interp = lambda key: np.interp(np.log10(tau), np.log10(interpolated_structure['rosseland_optical_depth']), interpolated_structure[key])
+    dT = np.max(np.abs(interp('temperature') / exact_structure['temperature'] - 1))
+    dP = np.max(np.abs(np.log10(interp('gas_pressure') / exact_structure['gas_pressure'])))
+    dkappa = np.max(np.abs(np.log10(interp('rosseland_opacity') / exact_structure['rosseland_opacity'])))
+    T1 = np.interp(0.0, np.log10(tau), interp('temperature') - exact_structure['temperature'])
+    print('{:>6} {:>5} | {:>12.4f} {:>16.4f} {:>18.4f} {:>12.1f} K'.format(teff, logg, dT, dP, dkappa, T1))
+    compared += 1
+
+# A benchmark without any compared models is a failure of the benchmark itself rather than of the interpolation
+if compared == 0:
+    print('No models could be compared')
+    sys.exit(1)
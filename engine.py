@@ -0,0 +1,453 @@
+import os
+import fcntl
+import glob
+import random
+import shlex
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+
+### EXECUTION ENGINE FOR THE CONTROL FILES IN templates.py ###
+
+# The control files rendered from templates.py are written in a small subset of the shell language: directory changes,
+# file staging (ln, mv, cp, rm, mkdir), files created with echo or cat, and calls of Kurucz executables with input and
+# output redirected from/to files or here-documents. This module interprets that subset directly instead of handing
+# the files over to bash, so that the file staging is carried out in Python and the executables are launched without
+# an intermediate shell. Parsing (parse_script()) is kept separate from execution (apply_step() and run_process()),
+# so that the same plan can be carried out by other drivers
+
+def parse_script(script):
+    """
+    Parse a control file into a list of steps. Every step is a tuple with the name of the operation followed by its
+    parameters:
+        ('cd', path)                                 :    Change the working directory
+        ('mkdir', path, parents)                     :    Create a directory (with parent directories if "parents")
+        ('ln', source, destination, symbolic)        :    Create a hard link or a symbolic link
+        ('mv', source, destination)                  :    Move a file
+        ('cp', source, destination)                  :    Copy a file
+        ('rm', patterns, force, recursive)           :    Remove files matching shell wildcard patterns
+        ('write', filename, text)                    :    Write text into a file (echo and cat)
+        ('run', executable, stdin, stdin_text,       :    Launch an executable. The standard input is either read from
+                stdout)                                   the file "stdin" or taken from the here-document "stdin_text".
+                                                          Standard output is written into the file "stdout" if given
+    All paths are kept as they appear in the control file and are resolved at execution time
+
+    arguments:
+        script         :     Content of the control file
+
+    returns:
+        steps          :     List of steps
+    """
+    steps = []
+    lines = script.split('\n')
+    i = 0
+    while i < len(lines):
+        line = lines[i].strip(); i += 1
+        if line == '' or line[0] == '#':
+            continue
+        lexer = shlex.shlex(line, posix = True, punctuation_chars = '<>')
+        lexer.whitespace_split = True
+        tokens = list(lexer)
+
+        # Extract redirections
+        stdin = None; stdin_text = None; stdout = None
+        words = []
+        j = 0
+        while j < len(tokens):
+            if tokens[j] in ['<', '<<', '>'] and j + 1 < len(tokens):
+                if tokens[j] == '<':
+                    stdin = tokens[j + 1]
+                elif tokens[j] == '>':
+                    stdout = tokens[j + 1]
+                else:
+                    # Collect the here-document
+                    body = []
+                    while i < len(lines) and lines[i] != tokens[j + 1]:
+                        body += [lines[i]]; i += 1
+                    if i == len(lines):
+                        raise ValueError('Here-document {} not terminated in control file'.format(tokens[j + 1]))
+                    i += 1
+                    stdin_text = '\n'.join(body) + '\n'
+                j += 2
+            elif tokens[j] in ['<', '<<', '>', '>>', '<>', '|', '&', '&&', '||', ';']:
+                raise ValueError('Unsupported shell syntax in control file: {}'.format(line))
+            else:
+                words += [tokens[j]]; j += 1
+        command = words[0]; flags = ''.join([word[1:] for word in words[1:] if word[0] == '-'])
+        args = [word for word in words[1:] if word[0] != '-']
+
+        if command == 'cd' and len(args) == 1:
+            steps += [('cd', args[0])]
+        elif command == 'mkdir' and len(args) == 1:
+            steps += [('mkdir', args[0], 'p' in flags)]
+        elif command == 'ln' and len(args) == 2:
+            steps += [('ln', args[0], args[1], 's' in flags)]
+        elif command in ['mv', 'cp'] and len(args) == 2 and flags == '':
+            steps += [(command, args[0], args[1])]
+        elif command == 'rm' and len(args) > 0:
+            steps += [('rm', args, 'f' in flags, 'r' in flags)]
+        elif command == 'echo' and stdout is not None:
+            steps += [('write', stdout, ' '.join(words[1:]) + '\n')]
+        elif command == 'cat' and len(words) == 1 and stdin_text is not None and stdout is not None:
+            steps += [('write', stdout, stdin_text)]
+        elif command in ['cd', 'mkdir', 'ln', 'mv', 'cp', 'rm', 'echo', 'cat'] or len(words) != 1:
+            raise ValueError('Unsupported command in control file: {}'.format(line))
+        else:
+            steps += [('run', command, stdin, stdin_text, stdout)]
+    return steps
+
+# ioctl request to share the data blocks of one file with another (FICLONE in linux/fs.h)
+FICLONE = 0x40049409
+
+def clone_file(source, destination, fallback = True):
+    """
+    Copy a file. Where the file system supports it (e.g. Btrfs, XFS or ZFS), the copy is a reflink that shares the data
+    blocks of the source until either file is modified, so large files are copied instantly and without using additional
+    space. Unlike a hard link, the copy is an independent file: writing into it never modifies the source. The
+    permissions of the source are not copied, so copies of read-only files are writable
+
+    arguments:
+        source         :     File to copy
+        destination    :     Path to the copy. Overwritten if it exists
+        fallback       :     If True (default), copy the content of the file if reflinks are not supported. Otherwise,
+                             remove the destination and raise OSError
+
+    returns:
+        Method used: "reflink" or "copy"
+    """
+    src = open(source, 'rb')
+    dst = open(destination, 'wb')
+    try:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return 'reflink'
+    except OSError:
+        if not fallback:
+            os.remove(destination)
+            raise
+    finally:
+        src.close()
+        dst.close()
+    shutil.copyfile(source, destination)
+    return 'copy'
+
+def apply_step(step, cwd):
+    """
+    Carry out a file operation from parse_script(), i.e. any step except for "run"
+
+    arguments:
+        step           :     Step to carry out
+        cwd            :     Current working directory
+
+    returns:
+        cwd            :     Working directory after the step
+    """
+    operation = step[0]
+    path = lambda x: os.path.join(cwd, x)
+    try:
+        if operation == 'cd':
+            if not os.path.isdir(path(step[1])):
+                raise FileNotFoundError('No such directory: {}'.format(step[1]))
+            return os.path.normpath(path(step[1]))
+        elif operation == 'mkdir':
+            if step[2]:
+                os.makedirs(path(step[1]), exist_ok = True)
+            else:
+                os.mkdir(path(step[1]))
+        elif operation == 'ln':
+            if step[3]:
+                os.symlink(step[1], path(step[2]))
+            else:
+                os.link(path(step[1]), path(step[2]))
+        elif operation == 'mv':
+            shutil.move(path(step[1]), path(step[2]))
+        elif operation == 'cp':
+            destination = path(step[2])
+            if os.path.isdir(destination):
+                destination = os.path.join(destination, os.path.basename(step[1]))
+            clone_file(path(step[1]), destination)
+        elif operation == 'rm':
+            for pattern in step[1]:
+                matches = glob.glob(path(pattern))
+                if len(matches) == 0 and not step[2]:
+                    raise FileNotFoundError('No such file or directory: {}'.format(pattern))
+                for match in matches:
+                    if os.path.isdir(match) and not os.path.islink(match):
+                        if not step[3]:
+                            raise IsADirectoryError('Is a directory: {}'.format(match))
+                        shutil.rmtree(match)
+                    else:
+                        os.remove(match)
+        elif operation == 'write':
+            file = open(path(step[1]), 'w')
+            file.write(step[2])
+            file.close()
+        else:
+            raise ValueError('Unknown operation {}'.format(operation))
+    except OSError as e:
+        raise ValueError('Command {} returned an error: {}'.format(operation, e))
+    return cwd
+
+### GLOBAL CORE BUDGET ###
+
+# Independent jobs running on the same node (e.g. an ODF library calculation alongside a grid of ATLAS models) can share
+# a fixed number of cores. The budget is a directory of slot files, and every executable launched by run_process() holds
+# an exclusive lock on one of the slot files for as long as it runs. The locks are released by the kernel when the
+# holding process exits, so a crashed job cannot leak its slots. The budget is configured with the environment variables
+# BASICATLAS_CORES (number of slots) and BASICATLAS_CORES_DIR (directory of slot files), so that it is inherited by
+# worker processes and can be shared by separate Python sessions
+
+def set_core_budget(cores, directory = None):
+    """
+    Limit the number of Kurucz executables that may run at the same time across all jobs that use the same budget
+    directory. The budget applies to the current process and all processes started from it
+
+    arguments:
+        cores          :     Number of executables allowed to run at the same time. Set to 0 or None to remove the limit
+        directory      :     Directory of slot files shared by all jobs in the budget. Defaults to "basicatlas_cores" in
+                             the system temporary directory
+    """
+    if cores is None or int(cores) <= 0:
+        os.environ.pop('BASICATLAS_CORES', None)
+        os.environ.pop('BASICATLAS_CORES_DIR', None)
+        return
+    os.environ['BASICATLAS_CORES'] = str(int(cores))
+    if directory is not None:
+        os.environ['BASICATLAS_CORES_DIR'] = os.path.realpath(directory)
+
+def acquire_core(cancel = None, poll = 0.1):
+    """
+    Wait for a free slot in the global core budget (see set_core_budget()) and lock it
+
+    arguments:
+        cancel         :     Optional threading.Event(). If set while waiting, an exception is raised
+        poll           :     Time in seconds between attempts to find a free slot
+
+    returns:
+        slot           :     Open file handle of the locked slot file, to be passed to release_core(). None if no budget
+                             is configured
+    """
+    cores = int(os.environ.get('BASICATLAS_CORES', 0))
+    if cores <= 0:
+        return None
+    directory = os.environ.get('BASICATLAS_CORES_DIR', os.path.join(tempfile.gettempdir(), 'basicatlas_cores'))
+    os.makedirs(directory, exist_ok = True)
+    while True:
+        # Slots are tried in random order, so that waiting jobs do not all contend for the same file
+        for i in random.sample(range(cores), cores):
+            slot = open(os.path.join(directory, 'slot_{}'.format(i)), 'a')
+            try:
+                fcntl.flock(slot, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return slot
+            except BlockingIOError:
+                slot.close()
+        if cancel is not None and cancel.wait(poll):
+            raise ValueError('Cancelled while waiting for a free core')
+        elif cancel is None:
+            time.sleep(poll)
+
+def release_core(slot):
+    """
+    Release a slot locked by acquire_core()
+
+    arguments:
+        slot           :     File handle returned by acquire_core()
+    """
+    if slot is not None:
+        fcntl.flock(slot, fcntl.LOCK_UN)
+        slot.close()
+
+def available_memory():
+    """
+    Estimate the memory available to the current job in bytes. The estimate is the available memory of the machine
+    (MemAvailable in /proc/meminfo), further limited by the remaining memory allowance of the control group of the
+    process if one is set (e.g. by a batch scheduler or a container runtime)
+
+    returns:
+        memory         :     Available memory in bytes. None if it cannot be determined
+    """
+    memory = None
+    if os.path.isfile('/proc/meminfo'):
+        file = open('/proc/meminfo', 'r')
+        for line in file:
+            if line.startswith('MemAvailable:'):
+                memory = int(line.split()[1]) * 1024
+        file.close()
+    # cgroup v2 and v1 limits
+    for limit_fn, usage_fn in [('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory.current'), ('/sys/fs/cgroup/memory/memory.limit_in_bytes', '/sys/fs/cgroup/memory/memory.usage_in_bytes')]:
+        if not (os.path.isfile(limit_fn) and os.path.isfile(usage_fn)):
+            continue
+        file = open(limit_fn, 'r')
+        limit = file.read().strip()
+        file.close()
+        file = open(usage_fn, 'r')
+        usage = file.read().strip()
+        file.close()
+        # Unlimited groups report "max" (v2) or a very large number (v1)
+        if limit.isdigit() and usage.isdigit() and int(limit) < 2 ** 60:
+            remaining = max(int(limit) - int(usage), 0)
+            memory = remaining if memory is None else min(memory, remaining)
+        break
+    return memory
+
+def available_workers(memory = 0):
+    """
+    Estimate the number of worker processes that can run at the same time without oversubscribing the machine. The
+    estimate is the number of CPUs available to the current process, further limited by the global core budget (see
+    set_core_budget()) and by the available memory (see available_memory())
+
+    arguments:
+        memory         :     Expected peak memory footprint of a single worker in bytes. Set to 0 to ignore memory
+
+    returns:
+        workers        :     Number of workers (at least 1)
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        workers = len(os.sched_getaffinity(0))
+    else:
+        workers = os.cpu_count() or 1
+    cores = int(os.environ.get('BASICATLAS_CORES', 0))
+    if cores > 0:
+        workers = min(workers, cores)
+    if memory > 0 and (available := available_memory()) is not None:
+        workers = min(workers, int(available // memory))
+    return max(workers, 1)
+
+def run_process(executable, cwd, stdin = None, stdin_text = None, stdout = None, timeout = None, cancel = None, env = None):
+    """
+    Launch an executable directly (without a shell) and wait for it to finish. The standard input is piped from memory
+    or a file, and the resource usage of the process is collected when it is reaped
+
+    The run is considered failed if anything is printed into the standard error stream, as it was when the control files
+    were executed by a shell. The standard output is printed if not redirected into a file. If a global core budget is configured (see set_core_budget()), the
+    launch is delayed until a core is free
+
+    arguments:
+        executable     :     Path to the executable
+        cwd            :     Working directory of the process
+        stdin          :     File to read the standard input from (relative to "cwd")
+        stdin_text     :     Text to pipe into the standard input (takes precedence over "stdin")
+        stdout         :     File to write the standard output into (relative to "cwd")
+        timeout        :     Maximum allowed run time in seconds. If exceeded, the process is terminated and an exception
+                             is raised. Set to None (default) to wait indefinitely
+        cancel         :     Optional threading.Event(). If set while the process is running, the process is terminated
+                             and an exception is raised
+        env            :     Environment variables of the process. Defaults to the environment of the current process
+
+    returns:
+        usage          :     Dictionary with the command, its return code, elapsed wall time in seconds, user and system
+                             CPU times in seconds and the maximum resident set size in kB
+    """
+    if cancel is not None and cancel.is_set():
+        raise ValueError('Command {} cancelled'.format(executable))
+    slot = acquire_core(cancel)
+    startTime = time.time()
+    files = []
+    try:
+        if stdin_text is not None:
+            stdin_handle = subprocess.PIPE
+        elif stdin is not None:
+            stdin_handle = open(os.path.join(cwd, stdin), 'rb'); files += [stdin_handle]
+        else:
+            stdin_handle = subprocess.DEVNULL
+        if stdout is not None:
+            stdout_handle = open(os.path.join(cwd, stdout), 'wb')
+        else:
+            stdout_handle = tempfile.TemporaryFile()
+        files += [stdout_handle]
+        stderr_handle = tempfile.TemporaryFile(); files += [stderr_handle]
+        try:
+            # Bare command names are looked up in PATH, same as in the shell
+            proc = subprocess.Popen([[executable, os.path.join(cwd, executable)]['/' in executable]], cwd = cwd, stdin = stdin_handle, stdout = stdout_handle, stderr = stderr_handle, env = env)
+        except OSError as e:
+            raise ValueError('Command {} returned an error: {}'.format(executable, e))
+
+        # Feed the here-document in a separate thread, so that large inputs cannot block on a full pipe
+        if stdin_text is not None:
+            def feed():
+                try:
+                    proc.stdin.write(stdin_text.encode())
+                except BrokenPipeError:
+                    pass
+                finally:
+                    try:
+                        proc.stdin.close()
+                    except BrokenPipeError:
+                        pass
+            feeder = threading.Thread(target = feed, daemon = True)
+            feeder.start()
+
+        # Terminate the process on timeout or cancellation. The process is only reaped after "finished" is set (see
+        # below), so the PID cannot be reused while the watcher may still signal it
+        finished = threading.Event(); lock = threading.Lock(); reason = []
+        if timeout is not None or cancel is not None:
+            def watch():
+                deadline = float('inf') if timeout is None else startTime + timeout
+                while not finished.is_set():
+                    if (cancel is not None and cancel.is_set()) or time.time() > deadline:
+                        with lock:
+                            if not finished.is_set():
+                                reason.append(['timed out', 'cancelled'][cancel is not None and cancel.is_set()])
+                                os.kill(proc.pid, signal.SIGTERM)
+                        return
+                    finished.wait(0.05)
+            watcher = threading.Thread(target = watch, daemon = True)
+            watcher.start()
+
+        os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+        with lock:
+            finished.set()
+        pid, status, rusage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        if stdin_text is not None:
+            feeder.join()
+
+        if len(reason) != 0:
+            raise ValueError('Command {} {}'.format(executable, reason[0]))
+        stderr_handle.seek(0)
+        stderr = stderr_handle.read().decode(errors = 'replace').strip()
+        if stderr != '':
+            raise ValueError('Command {} returned an error: {}'.format(executable, stderr))
+        if stdout is None:
+            stdout_handle.seek(0)
+            output = stdout_handle.read().decode(errors = 'replace').strip()
+            if output != '':
+                print(output)
+    finally:
+        for file in files:
+            file.close()
+        release_core(slot)
+
+    return {'command': executable, 'returncode': proc.returncode, 'elapsed': time.time() - startTime, 'utime': rusage.ru_utime, 'stime': rusage.ru_stime, 'maxrss': rusage.ru_maxrss}
+
+def run_script(filename, timeout = None, cancel = None, env = None):
+    """
+    Execute a control file rendered from templates.py. The file is interpreted by parse_script() rather than passed
+    to a shell. Unlike bash, the execution stops at the first failed step
+
+    arguments:
+        filename       :     Path to the control file. Relative paths in the file are resolved against the directory
+                             of the control file until the first "cd"
+        timeout        :     Maximum allowed run time of every executable in seconds. See run_process()
+        cancel         :     Optional threading.Event() to cancel the execution. See run_process()
+        env            :     Environment variables of the launched executables
+
+    returns:
+        usage          :     List of resource usage dictionaries for every launched executable (see run_process())
+    """
+    file = open(filename, 'r')
+    steps = parse_script(file.read())
+    file.close()
+
+    cwd = os.path.dirname(os.path.realpath(filename))
+    usage = []
+    for step in steps:
+        if cancel is not None and cancel.is_set():
+            raise ValueError('Control file {} cancelled'.format(filename))
+        if step[0] == 'run':
+            usage += [run_process(step[1], cwd, stdin = step[2], stdin_text = step[3], stdout = step[4], timeout = timeout, cancel = cancel, env = env)]
+        else:
+            cwd = apply_step(step, cwd)
+    return usage
@@ -77,9 +77,9 @@ EOF
 """
 
 kappa9_control = """
-cd {output_dir}
+cd {output_dir}/vturb_{v}
 cp {d_data}/molecules.dat fort.2
-mv ./p00big{v}.bdf fort.9
+ln -s ../p00big{v}.bdf fort.9
 {dfsynthe_suite}/kappa9.exe<<EOF>kapm40k2.out
 MOLECULES ON
 READ MOLECULES
@@ -185,8 +185,8 @@ VTURB {v}.0E5
 BEGIN                    ITERATION  15 COMPLETED
 END
 EOF
-mv fort.9 ./p00big{v}.bdf
-mv fort.7 kapk{v}.dat
+mv fort.7 ../kapk{v}.dat
+rm fort.*
 """
 
 kapreadts_control = """
@@ -199,8 +199,11 @@ mv kapk8.dat fort.15
 {dfsynthe_suite}/kapreadts.exe
 mv fort.2 kappa.ros
 rm fort.*
+mv vturb_8/kapm40k2.out kapm40k2.out
 rm -r dft_*
+rm -r vturb_*
 rm *.bin
+rm dfp00t*sortp.asc
 """
 
 xnfdf_control_start = """cd {output_dir}
@@ -335,13 +338,13 @@ mv fort.2 ../dfp00t{dft}vt8sortp.asc
 mv fort.1 ../dfp00t{dft}vt8.bin
 """
 
-separatedf_control = """mv {output_dir}/dfp00t{dft}vt{v}sortp.asc {output_dir}/fort.{serial}
+separatedf_control = """ln -s {output_dir}/dfp00t{dft}vt{v}sortp.asc {output_dir}/vturb_{v}/fort.{serial}
 """
 
-separatedf_control_end = """cd {output_dir}
+separatedf_control_end = """cd {output_dir}/vturb_{v}
 {dfsynthe_suite}/separatedf.exe
-mv fort.2 p00big{v}.bdf
-mv fort.3 p00lit{v}.bdf
+mv fort.2 ../p00big{v}.bdf
+mv fort.3 ../p00lit{v}.bdf
 rm fort.*
 """
 
@@ -362,6 +365,32 @@ MOLECULES ON
 synthe_control = """cd {output_dir}
 mkdir -p synthe_{synthe_num}
 cd synthe_{synthe_num}/
+
+# Chemical equilibrium computed by xnfpelsyn.exe (see xnfpelsyn_control)
+cp {xnfpelsyn_dir}/xnfpelsyn.dat xnfpelsyn.dat
+cp {xnfpelsyn_dir}/xnfpelsyn.out xnfpelsyn.out
+
+{lines}
+# synthe.exe computes line opacities
+ln xnfpelsyn.dat fort.10
+ln -s {s_files}/he1tables.dat fort.18
+{synthe_suite}/synthe.exe>synthe.out
+
+# spectrv.exe computes the synthetic spectrum
+ln -s {s_files}/molecules.dat fort.2
+cat <<"EOF" >fort.25
+0.0       0.        1.        0.        0.        0.        0.        0.
+0.
+RHOXJ     R1        R101      PH1       PC1       PSI1      PRDDOP    PRDPOW
+EOF
+{synthe_suite}/spectrv.exe<"{synthe_solar}">spectrv.out
+
+mv fort.7 spectrum.bin
+rm fort.*
+rm xnfpelsyn.dat
+"""
+
+xnfpelsyn_control = """cd {xnfpelsyn_dir}
 ln -s {s_files}/molecules.dat fort.2
 ln -s {s_files}/continua.dat fort.17
 
@@ -369,6 +398,9 @@ ln -s {s_files}/continua.dat fort.17
 {synthe_suite}/xnfpelsyn.exe< {synthe_solar}>xnfpelsyn.out
 mv fort.10 xnfpelsyn.dat
 rm fort.*
+"""
+
+synthe_lines = """cd {lines_dir}
 
 # synbeg.exe initializes the computation
 {synthe_suite}/synbeg.exe<<"EOF">synbeg.out
@@ -385,69 +417,69 @@ rm fort.11
 {C12C13}
 
 # Import diatomic molecular lines
-ln -s  {s_files}/chmasseron_corrected.asc fort.11
+ln -s  {l_files}/chmasseron_corrected.asc fort.11
 {synthe_suite}/rmolecasc.exe>chmasseron.out
 rm fort.11
-ln -s {s_files}/mgh_exomol.asc fort.11
+ln -s {l_files}/mgh_exomol.asc fort.11
 {synthe_suite}/rmolecasc.exe>mgh.out
 rm fort.11
-ln -s {s_files}/nh.asc fort.11
+ln -s {l_files}/nh.asc fort.11
 {synthe_suite}/rmolecasc.exe>nh.out
 rm fort.11
-ln -s  {s_files}/ohupdate.asc fort.11
+ln -s  {l_files}/ohupdate.asc fort.11
 {synthe_suite}/rmolecasc.exe>oh.out
 rm fort.11
-ln -s  {s_files}/sihax.asc fort.11
+ln -s  {l_files}/sihax.asc fort.11
 {synthe_suite}/rmolecasc.exe>sihax.out
 rm fort.11
-ln -s {s_files}/h2.asc fort.11
+ln -s {l_files}/h2.asc fort.11
 {synthe_suite}/rmolecasc.exe>h2.out
 rm fort.11
-ln -s {s_files}/h2xx.asc fort.11
+ln -s {l_files}/h2xx.asc fort.11
 {synthe_suite}/rmolecasc.exe>h2xx.out
 rm fort.11
-ln -s {s_files}/hdxx.asc fort.11
+ln -s {l_files}/hdxx.asc fort.11
 {synthe_suite}/rmolecasc.exe>hdxx.out
 rm fort.11
-ln -s {s_files}/c2ax.asc fort.11
+ln -s {l_files}/c2ax.asc fort.11
 {synthe_suite}/rmolecasc.exe>c2ax.out
 rm fort.11
-ln -s {s_files}/c2ba.asc fort.11
+ln -s {l_files}/c2ba.asc fort.11
 {synthe_suite}/rmolecasc.exe>c2ba.out
 rm fort.11
-ln -s {s_files}/c2dabrookek.asc fort.11
+ln -s {l_files}/c2dabrookek.asc fort.11
 {synthe_suite}/rmolecasc.exe>c2da.out
 rm fort.11
-ln -s  {s_files}/c2ea.asc fort.11
+ln -s  {l_files}/c2ea.asc fort.11
 {synthe_suite}/rmolecasc.exe>c2ea.out
 rm fort.11
-ln -s {s_files}/cnaxbrookek.asc fort.11
+ln -s {l_files}/cnaxbrookek.asc fort.11
 {synthe_suite}/rmolecasc.exe>cnax.out
 rm fort.11
-ln -s {s_files}/cnbxbrookek.asc fort.11
+ln -s {l_files}/cnbxbrookek.asc fort.11
 {synthe_suite}/rmolecasc.exe>cnbx.out
 rm fort.11
-ln -s {s_files}/cnxx12brooke.asc fort.11
+ln -s {l_files}/cnxx12brooke.asc fort.11
 {synthe_suite}/rmolecasc.exe>cnxx12.out
 rm fort.11
-ln -s {s_files}/coax.asc fort.11
+ln -s {l_files}/coax.asc fort.11
 {synthe_suite}/rmolecasc.exe>coax.out
 rm fort.11
-ln -s {s_files}/coxx.asc fort.11
+ln -s {l_files}/coxx.asc fort.11
 {synthe_suite}/rmolecasc.exe>coxx.out
 rm fort.11
-ln -s {s_files}/sioax.asc fort.11
+ln -s {l_files}/sioax.asc fort.11
 {synthe_suite}/rmolecasc.exe>sioax.out
 rm fort.11
-ln -s {s_files}/sioex.asc fort.11
+ln -s {l_files}/sioex.asc fort.11
 {synthe_suite}/rmolecasc.exe>sioex.out
 rm fort.11
-ln -s {s_files}/sioxx.asc fort.11
+ln -s {l_files}/sioxx.asc fort.11
 {synthe_suite}/rmolecasc.exe>sioxx.out
 rm fort.11
 
 # Import TiO lines
-ln -s {s_files}/tiototo.asc fort.11
+ln -s {l_files}/tiototo.asc fort.11
 {synthe_suite}/rmolecasc.exe>tio.out
 rm fort.11
 
@@ -456,23 +488,12 @@ ln -s {d_files}/h2ofastfix.bin fort.11
 {synthe_suite}/rh2ofast.exe>h2ofastfix.out
 rm fort.11
 
-# synthe.exe computes line opacities
-ln xnfpelsyn.dat fort.10
-ln -s {s_files}/he1tables.dat fort.18
-{synthe_suite}/synthe.exe>synthe.out
-
-# spectrv.exe computes the synthetic spectrum
-ln -s {s_files}/molecules.dat fort.2
-cat <<"EOF" >fort.25
-0.0       0.        1.        0.        0.        0.        0.        0.
-0.
-RHOXJ     R1        R101      PH1       PC1       PSI1      PRDDOP    PRDPOW
-EOF
-{synthe_suite}/spectrv.exe<"{synthe_solar}">spectrv.out
+# Remove the line lists extracted for the wavelength range (see window_linelists() in atlas.py)
+rm -rf linelists
+"""
 
-mv fort.7 spectrum.bin
-rm fort.*
-rm xnfpelsyn.dat
+synthe_lines_cached = """# Line lists imported in {lines_dir}
+{link_commands}
 """
 
 synthe_cleanup = """cd {output_dir}
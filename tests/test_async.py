@@ -0,0 +1,55 @@
+# Unit tests of the asyncio interface that do not require the Kurucz executables
+#
+# Usage: python -m pytest tests
+
+import os, sys, time
+import asyncio
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)) + '/..')
+import atlas
+
+
+def alive(pid):
+    # Terminated processes that have not been reaped yet are zombies
+    try:
+        f = open('/proc/{}/stat'.format(pid), 'r')
+        state = f.read().split(')')[-1].split()[0]
+        f.close()
+    except FileNotFoundError:
+        return False
+    return state != 'Z'
+
+def test_run_async_cancel(tmp_path):
+    # The executable starts a process of its own, which must be terminated along with it
+    (tmp_path / 'slow.exe').write_text('#!/bin/sh\necho $$ > pids\nsleep 60 &\necho $! >> pids\nwait\n')
+    os.chmod(tmp_path / 'slow.exe', 0o755)
+    (tmp_path / 'slow.com').write_text('cd {0}\n{0}/slow.exe>slow.out\n'.format(tmp_path))
+
+    async def cancel():
+        task = asyncio.ensure_future(atlas.run_async('import_lines', str(tmp_path / 'slow.com'), silent = True))
+        for i in range(100):
+            if os.path.isfile(tmp_path / 'pids') and len((tmp_path / 'pids').read_text().split()) == 2:
+                break
+            await asyncio.sleep(0.1)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            return True
+        return False
+    startTime = time.time()
+    assert asyncio.run(cancel())
+    pids = [int(pid) for pid in (tmp_path / 'pids').read_text().split()]
+    assert len(pids) == 2
+    for i in range(50):
+        if not any([alive(pid) for pid in pids]):
+            break
+        time.sleep(0.1)
+    assert not any([alive(pid) for pid in pids])
+    assert time.time() - startTime < 30
+
+def test_run_async_error(tmp_path):
+    # Exceptions raised in the worker process are raised by the coroutine
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(atlas.run_async('import_lines', str(tmp_path / 'missing.com')))
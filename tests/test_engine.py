@@ -0,0 +1,90 @@
+# Unit tests of the execution engine of the control files
+#
+# Usage: python -m pytest tests
+
+import os, sys, time
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)) + '/..')
+import engine
+
+
+def test_parse_script():
+    script = '\n'.join([
+        '# Comment',
+        'cd run',
+        'mkdir -p a/b',
+        'ln -s /data/lines.dat fort.11',
+        'ln fort.11 fort.12',
+        'cp fort.12 copy.dat',
+        'rm -f fort.*',
+        'echo "1 2" > c12c13.dat',
+        'cat <<"EOF">input.dat',
+        'line 1',
+        'EOF',
+        '/bin/synbeg.exe<<"EOF">synbeg.out',
+        'cards',
+        'EOF',
+        '/bin/xnfpelsyn.exe<fort.5',
+    ])
+    assert engine.parse_script(script) == [
+        ('cd', 'run'),
+        ('mkdir', 'a/b', True),
+        ('ln', '/data/lines.dat', 'fort.11', True),
+        ('ln', 'fort.11', 'fort.12', False),
+        ('cp', 'fort.12', 'copy.dat'),
+        ('rm', ['fort.*'], True, False),
+        ('write', 'c12c13.dat', '1 2\n'),
+        ('write', 'input.dat', 'line 1\n'),
+        ('run', '/bin/synbeg.exe', None, 'cards\n', 'synbeg.out'),
+        ('run', '/bin/xnfpelsyn.exe', 'fort.5', None, None),
+    ]
+    for script in ['ls | grep x', 'cp -r a b', 'rm']:
+        with pytest.raises(ValueError):
+            engine.parse_script(script)
+
+def test_apply_step(tmp_path):
+    cwd = str(tmp_path)
+    cwd = engine.apply_step(('mkdir', 'run/sub', True), cwd)
+    cwd = engine.apply_step(('cd', 'run'), cwd)
+    assert cwd == str(tmp_path / 'run')
+    engine.apply_step(('write', 'a.dat', 'text\n'), cwd)
+    engine.apply_step(('ln', 'a.dat', 'b.dat', False), cwd)
+    engine.apply_step(('ln', cwd + '/a.dat', 'c.dat', True), cwd)
+    engine.apply_step(('cp', 'a.dat', 'sub'), cwd)
+    assert (tmp_path / 'run' / 'sub' / 'a.dat').read_text() == 'text\n'
+    assert os.stat(tmp_path / 'run' / 'a.dat').st_nlink == 2
+    assert os.path.islink(tmp_path / 'run' / 'c.dat')
+    engine.apply_step(('mv', 'b.dat', 'd.dat'), cwd)
+    assert sorted(os.listdir(cwd)) == ['a.dat', 'c.dat', 'd.dat', 'sub']
+    engine.apply_step(('rm', ['*.dat'], False, False), cwd)
+    assert os.listdir(cwd) == ['sub']
+    with pytest.raises(ValueError):
+        engine.apply_step(('rm', ['missing'], False, False), cwd)
+    engine.apply_step(('rm', ['missing'], True, False), cwd)
+    with pytest.raises(ValueError):
+        engine.apply_step(('rm', ['sub'], False, False), cwd)
+    engine.apply_step(('rm', ['sub'], False, True), cwd)
+    assert os.listdir(cwd) == []
+
+def test_run_script_timeout(tmp_path):
+    f = open(tmp_path / 'slow.exe', 'w')
+    f.write('#!/bin/sh\nsleep 10\n')
+    f.close()
+    os.chmod(tmp_path / 'slow.exe', 0o755)
+    f = open(tmp_path / 'slow.com', 'w')
+    f.write('cd {}\n{}/slow.exe\n'.format(tmp_path, tmp_path))
+    f.close()
+    startTime = time.time()
+    with pytest.raises(ValueError, match = 'timed out'):
+        engine.run_script(str(tmp_path / 'slow.com'), timeout = 0.5)
+    assert time.time() - startTime < 5
+
+
+def test_clone_file(tmp_path):
+    (tmp_path / 'source').write_bytes(b'data')
+    os.chmod(tmp_path / 'source', 0o444)
+    assert engine.clone_file(str(tmp_path / 'source'), str(tmp_path / 'copy')) in ['reflink', 'copy']
+    # The copy is writable and independent of the source
+    (tmp_path / 'copy').write_bytes(b'changed')
+    assert (tmp_path / 'source').read_bytes() == b'data'
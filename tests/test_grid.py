@@ -0,0 +1,38 @@
+# Unit tests of atlas_grid() with the calculation of individual models replaced
+#
+# Usage: python -m pytest tests
+
+import os, sys, json
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)) + '/..')
+import atlas
+
+
+def crashing_model(output_dir, settings, restart, niter, ODF, molecules, ODF_library, silent):
+    # The worker process dies without reporting back, e.g. when killed by the out-of-memory killer
+    if settings.teff == 4000:
+        os._exit(1)
+    os.mkdir(output_dir)
+    return 'done', None, 0.0
+
+def working_model(output_dir, settings, restart, niter, ODF, molecules, ODF_library, silent):
+    os.mkdir(output_dir)
+    return 'done', None, 0.0
+
+def test_atlas_grid_broken_pool(tmp_path, monkeypatch):
+    grid = [{'teff': 4000, 'logg': 1.5}, {'teff': 5000, 'logg': 2.5}, {'teff': 6000, 'logg': 3.5}]
+    output_dir = str(tmp_path / 'grid')
+    monkeypatch.setattr(atlas, 'atlas_grid_model', crashing_model)
+    manifest = atlas.atlas_grid(output_dir, grid, max_workers = 1, silent = True)
+    statuses = [model['status'] for model in manifest['models']]
+    assert 'running' not in statuses and 'pending' not in statuses
+    assert manifest['models'][0]['status'] == 'failed'
+    assert manifest['models'][0]['error'].startswith('BrokenProcessPool')
+    f = open(output_dir + '/manifest.json', 'r')
+    assert json.load(f) == manifest
+    f.close()
+
+    # The models lost with the pool are recalculated on request
+    monkeypatch.setattr(atlas, 'atlas_grid_model', working_model)
+    manifest = atlas.atlas_grid(output_dir, grid, max_workers = 1, retry_failed = True, silent = True)
+    assert [model['status'] for model in manifest['models']] == ['done'] * 3
@@ -0,0 +1,156 @@
+# Unit tests of the handling of ODFs and their libraries that do not require DFSYNTHE
+#
+# Usage: python -m pytest tests
+
+import os, sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)) + '/..')
+import atlas
+
+
+def test_link_or_copy(tmp_path):
+    (tmp_path / 'p00big2.bdf').write_bytes(b'odf')
+    method = atlas.link_or_copy(str(tmp_path / 'p00big2.bdf'), str(tmp_path / 'odf_9.bdf'))
+    assert method in ['reflink', 'hardlink']
+    assert (tmp_path / 'odf_9.bdf').read_bytes() == b'odf'
+    # A staged file that shares its content with the library cannot be modified in place
+    if method == 'hardlink':
+        assert os.stat(tmp_path / 'odf_9.bdf').st_mode & 0o222 == 0
+
+
+def test_ODF_key():
+    assert atlas.ODF_key(-0.0, 0.2484, {}) == atlas.ODF_key(0.001, 0.2481, {'Fe': 0.0})
+    assert atlas.ODF_key(0.0, 0.25, {'Mg': 0.4, 'Ca': 0.4}) == atlas.ODF_key(0.0, 0.25, {'Ca': 0.4, 'Mg': 0.4})
+    assert atlas.ODF_key(0.0, 0.25, {}) != atlas.ODF_key(0.01, 0.25, {})
+
+def test_ODF_index(tmp_path, monkeypatch):
+    compositions = {'solar': (0.0, 0.25, {}), 'poor': (-1.0, 0.25, {'Mg': 0.4})}
+    def meta(run_dir):
+        meta.calls += 1
+        zscale, Y, abun = compositions[os.path.basename(run_dir)]
+        return {'zscale': zscale, 'Y': Y, 'abun': abun, 'type': 'DFSYNTHE', 'interpolated': False}
+    meta.calls = 0
+    monkeypatch.setattr(atlas, 'meta', meta)
+    for name in compositions:
+        os.mkdir(tmp_path / name)
+        for filename in ['xnfdf.out', 'kappa.ros', 'p00big2.bdf']:
+            (tmp_path / name / filename).write_text('x')
+    os.mkdir(tmp_path / 'incomplete')
+    library = str(tmp_path)
+
+    index = atlas.ODF_index(library)
+    assert sorted(index['ODFs']) == ['poor', 'solar']
+    assert index['ODFs']['solar']['vturb'] == [2]
+    assert index['lookup'][atlas.ODF_key(-1.0, 0.25, {'Mg': 0.4})] == 'poor'
+    assert meta.calls == 2
+
+    # The index is neither parsed nor written again while the library is unchanged
+    mtime = os.stat(tmp_path / 'ODF_index.json').st_mtime_ns
+    atlas.ODF_index_cache.clear()
+    atlas.ODF_index(library)
+    assert meta.calls == 2
+    assert os.stat(tmp_path / 'ODF_index.json').st_mtime_ns == mtime
+
+    # Only the changed ODF is parsed again
+    (tmp_path / 'solar' / 'p00big4.bdf').write_text('x')
+    index = atlas.ODF_index(library)
+    assert index['ODFs']['solar']['vturb'] == [2, 4]
+    assert meta.calls == 3
+
+def test_ODF_index_floored(tmp_path, monkeypatch):
+    # ATLAS floors abundances at -20 in its own format, so meta() reports the floored enhancement instead of the requested one
+    settings = atlas.Settings()
+    settings.abun = {'Li': -15.0}
+    reported = settings.abun_atlas_to_std(settings.atlas_abun(), settings.zscale)
+    assert reported['abun']['Li'] > -15.0
+    def meta(run_dir):
+        return {'zscale': settings.zscale, 'Y': reported['Y'], 'abun': dict(reported['abun']), 'type': 'DFSYNTHE', 'interpolated': False}
+    monkeypatch.setattr(atlas, 'meta', meta)
+    os.mkdir(tmp_path / 'depleted')
+    for filename in ['xnfdf.out', 'kappa.ros', 'p00big2.bdf']:
+        (tmp_path / 'depleted' / filename).write_text('x')
+    library = str(tmp_path)
+
+    assert atlas.find_ODF(settings, library) == os.path.realpath(library) + '/depleted'
+    assert atlas.missing_ODFs([settings], library) == []
+    # Depletions that ATLAS can represent are still told apart
+    settings.abun = {'Li': -5.0}
+    assert len(atlas.missing_ODFs([settings], library)) == 1
+
+
+def test_dfsynthe_resume(tmp_path, monkeypatch):
+    # The executables are replaced with functions that create their output files and record the calls
+    calls = []
+    def run_script(filename, timeout = None, cancel = None, env = None):
+        name = os.path.basename(filename); cwd = os.path.dirname(filename)
+        calls.append(name)
+        if name == 'xnfdf.com':
+            outputs = [cwd + '/' + output for output in ['xnfdf.out', 'xnfpdf.dat', 'xnfpdfmax.dat']]
+        elif name == 'separatedf.com':
+            v = os.path.basename(cwd)[6:]
+            outputs = [cwd + '/../p00big{}.bdf'.format(v), cwd + '/../p00lit{}.bdf'.format(v)]
+        elif name.startswith('kappa9v'):
+            v = name[7:-4]
+            outputs = [cwd + '/kapk{}.dat'.format(v), cwd + '/vturb_{}/kapm40k2.out'.format(v)]
+        else:
+            outputs = [cwd + '/kappa.ros', cwd + '/kapm40k2.out']
+        for output in outputs:
+            f = open(output, 'w')
+            f.write(name)
+            f.close()
+    def dfsynthe_temperature(output_dir, cards, dfts, vs, i, timeout = None):
+        calls.append(i)
+        if i == 50 and dfsynthe_temperature.fail:
+            raise ValueError('DFSYNTHE interrupted')
+        files = ['dfp00t{}vt{}sortp.asc'.format(dfts[i], v) for v in vs]
+        for filename in files:
+            f = open(output_dir + '/' + filename, 'w')
+            f.write('x')
+            f.close()
+        return files
+    monkeypatch.setattr(atlas.engine, 'run_script', run_script)
+    monkeypatch.setattr(atlas, 'dfsynthe_temperature', dfsynthe_temperature)
+    monkeypatch.setattr(atlas, 'validate_run', lambda run_dir, silent = False: None)
+    settings = atlas.Settings()
+    settings.zscale = -1.0
+    output_dir = str(tmp_path / 'ODF')
+
+    # The hottest temperatures are calculated first, so the run stops after the six hottest ones
+    dfsynthe_temperature.fail = True
+    with pytest.raises(ValueError, match = 'interrupted'):
+        atlas.dfsynthe(output_dir, settings, silent = True)
+    assert calls == ['xnfdf.com', 56, 55, 54, 53, 52, 51, 50]
+    with pytest.raises(ValueError, match = 'already exists'):
+        atlas.dfsynthe(output_dir, settings, silent = True)
+
+    # Only the unfinished stages are carried out when resuming, including a completed stage whose output has changed
+    dfsynthe_temperature.fail = False
+    calls.clear()
+    f = open(output_dir + '/dfp00t{}vt0sortp.asc'.format('199526.'), 'a')
+    f.write('truncated run')
+    f.close()
+    atlas.dfsynthe(output_dir, settings, resume = True, silent = True)
+    assert calls[:52] == [56] + list(range(50, -1, -1))
+    assert sorted(calls[52:]) == sorted(['separatedf.com'] * 5 + ['kappa9v{}.com'.format(v) for v in [0, 1, 2, 4, 8]] + ['kapreadts.com'])
+
+    # A completed run is not repeated, and cannot be resumed for a different composition
+    calls.clear()
+    atlas.dfsynthe(output_dir, settings, resume = True, silent = True)
+    assert calls == []
+    settings.zscale = 0.0
+    with pytest.raises(ValueError, match = 'different chemical composition'):
+        atlas.dfsynthe(output_dir, settings, resume = True, silent = True)
+
+
+def test_fortran_records(tmp_path):
+    records = [b'', b'\x01\x02\x03', np.arange(1000, dtype = '<i2').tobytes()]
+    atlas.write_fortran_records(str(tmp_path / 'fort.9'), records)
+    assert atlas.read_fortran_records(str(tmp_path / 'fort.9')) == records
+    # Every record is enclosed by its length in bytes
+    f = open(tmp_path / 'fort.9', 'rb')
+    content = f.read()
+    f.close()
+    assert len(content) == sum([len(record) + 8 for record in records])
+    assert np.frombuffer(content[8:12], dtype = '<i4')[0] == 3
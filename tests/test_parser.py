@@ -0,0 +1,32 @@
+# Unit tests of the parser of the main output of ATLAS-9
+#
+# Usage: python -m pytest tests
+
+import os, sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)) + '/..')
+import atlas
+
+
+def frequency_line(triples, length):
+    # Index, frequency and integration coefficient of every frequency, padded to "length" with the line terminator
+    line = ''.join(['{:>5d}{:>22.4f}{:>10.4f}'.format(*triple) for triple in triples])
+    return line.ljust(length - 1) + '\n'
+
+def test_parse_atlas_output():
+    row = ' '.join(['1.0'] * 11 + ['0.5', '-3.0'])
+    lines = ['HEADER\n', '0FREQID\n']
+    lines += [frequency_line([(1, 3.0e15, 0.1)], 60)]
+    lines += [frequency_line([(2, 1.0e15, 0.2), (3, 2.0e15, 0.3)], 80)]
+    lines += ['\n']
+    lines += ['START TABLE\n'] + ['HEADER\n'] * 3 + [row + '\n'] * 72 + ['END TABLE\n']
+    lines += ['CHEMFAIL\n', 'START TABLE\n'] + ['HEADER\n'] * 3 + [row + '\n'] * 72 + ['END TABLE\n']
+    lines += ['REACHED GOLD TOLERANCES\n']
+    events = list(atlas.parse_atlas_output(lines))
+    assert [event[0] for event in events] == ['frequencies', 'iteration', 'iteration', 'marker']
+    assert np.allclose(events[0][1], [1.0e15, 2.0e15, 3.0e15])
+    assert events[1][1]['number'] == 1 and not events[1][1]['chemfail']
+    assert events[1][1]['max_err'] == 0.5 and events[1][1]['max_de'] == 3.0
+    assert events[2][1]['chemfail'] and events[2][1]['max_err'] == 88888.888
+    assert events[3][1] == 'REACHED GOLD TOLERANCES'
@@ -0,0 +1,180 @@
+# Unit tests of the parts of synthe() that do not require the Kurucz executables
+#
+# Usage: python -m pytest tests
+
+import os, sys, json, time, threading
+import concurrent.futures
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)) + '/..')
+import atlas
+
+
+def test_publish_cache_entry(tmp_path):
+    for name in ['.first', '.second']:
+        os.mkdir(tmp_path / name)
+        (tmp_path / name / 'fort.12').write_text(name)
+        (tmp_path / name / 'fort.93').write_text(name)
+    atlas.publish_cache_entry(str(tmp_path / '.first'), str(tmp_path / 'entry'), ['fort.12'])
+    assert not os.path.exists(tmp_path / '.first')
+    assert os.stat(tmp_path / 'entry' / 'fort.12').st_mode & 0o777 == 0o444
+    assert os.stat(tmp_path / 'entry' / 'fort.93').st_mode & 0o200
+    # An entry published by another run in the meantime is kept
+    atlas.publish_cache_entry(str(tmp_path / '.second'), str(tmp_path / 'entry'), ['fort.12'])
+    assert not os.path.exists(tmp_path / '.second')
+    assert (tmp_path / 'entry' / 'fort.12').read_text() == '.first'
+
+
+def test_synthe_chunks():
+    batches = atlas.synthe_chunks(500, 530, 100000, 20000, 4, overlap = 1.0)
+    assert len(batches) == 4
+    # The trimmed ranges tile the requested range
+    assert batches[0][2] == 500 and batches[-1][3] == 530
+    assert all([batches[i][3] == batches[i + 1][2] for i in range(len(batches) - 1)])
+    # Internal boundaries are extended by the overlap
+    assert batches[0][0] == 500 and batches[-1][1] == 530
+    assert all([np.isclose(batch[2] - batch[0], 1.0) for batch in batches[1:]])
+    assert all([np.isclose(batch[1] - batch[3], 1.0) for batch in batches[:-1]])
+    # The padded chunks have equal costs
+    points = [atlas.synbeg(batch[0], batch[1], 100000) for batch in batches]
+    assert max(points) - min(points) <= 2
+
+def test_synthe_chunks_buffer():
+    batches = atlas.synthe_chunks(500, 530, 100000, 1000, 1, overlap = 0.5)
+    assert all([atlas.synbeg(batch[0], batch[1], 100000) <= 1000 for batch in batches])
+    assert len(batches) > int(np.ceil(atlas.synbeg(500, 530, 100000) / 1000))
+
+def test_synthe_chunks_overlap():
+    with pytest.warns(UserWarning):
+        batches = atlas.synthe_chunks(500, 503, 100000, 2010001, 8, overlap = 1.0)
+    assert len(batches) < 8
+    assert all([batch[3] - batch[2] >= (batch[2] - batch[0]) + (batch[1] - batch[3]) for batch in batches])
+    with pytest.raises(ValueError):
+        atlas.synthe_chunks(500, 503, 100000, 2010001, 2, overlap = -1.0)
+
+
+def write_spectrum(filename, start, points, res, value):
+    dt = np.dtype('i4,f8,f8,S74,f8,f8,i4,i4,i4,' + ','.join(['f8'] * 20 + ['i4'] + ['f8'] * 377))
+    header = np.zeros(1, dtype = dt)
+    header['f4'] = start; header['f5'] = res; header['f6'] = points
+    data = np.zeros(points, dtype = np.dtype('f8,f8,f8'))
+    data['f1'] = value; data['f2'] = 1.0
+    f = open(filename, 'wb')
+    header.tofile(f)
+    data.tofile(f)
+    f.close()
+
+def test_read_spectrum(tmp_path):
+    res = 10000
+    # Batch 2 precedes batch 1 in wavelength (e.g. appended to a previous run), and both extend past their shared boundary
+    for synthe_num, wlbeg, wlend, min_wl, max_wl in [(1, 509, 520, 510, 520), (2, 500, 511, 500, 510)]:
+        os.mkdir(tmp_path / 'synthe_{}'.format(synthe_num))
+        write_spectrum(str(tmp_path / 'synthe_{}/spectrum.bin'.format(synthe_num)), wlbeg, atlas.synbeg(wlbeg, wlend, res), res, synthe_num)
+        f = open(tmp_path / 'synthe_{}/batch.json'.format(synthe_num), 'w')
+        json.dump({'min_wl': min_wl, 'max_wl': max_wl, 'wlbeg': wlbeg, 'wlend': wlend, 'settings': {}}, f)
+        f.close()
+    spectrum = atlas.read_spectrum(str(tmp_path))
+    assert np.all(np.diff(spectrum['wl']) > 0)
+    assert np.isclose(spectrum['wl'][0], 5000)
+    assert np.all(spectrum['line'][spectrum['wl'] < 5100] == 2)
+    assert np.all(spectrum['line'][spectrum['wl'] >= 5100] == 1)
+
+
+def test_synthe_cache_stats(tmp_path):
+    cache = str(tmp_path)
+    for i, key in enumerate(['old', 'kept', 'new']):
+        os.mkdir(tmp_path / key)
+        (tmp_path / key / 'spectrum.bin').write_bytes(b'\0' * 100)
+        os.utime(tmp_path / key, (time.time() - 100 + i, time.time() - 100 + i))
+    stats = atlas.synthe_cache_stats(cache, hits = 2, misses = 1)
+    assert stats['entries'] == 3 and stats['size'] == 300 and stats['evictions'] == 0
+
+    # The least recently used entries are evicted first, unless they are in use
+    os.utime(tmp_path / 'kept', (time.time() - 200, time.time() - 200))
+    stats = atlas.synthe_cache_stats(cache, max_size = 150, keep = ['kept'], silent = True)
+    assert sorted([name for name in os.listdir(cache) if os.path.isdir(tmp_path / name)]) == ['kept']
+    assert stats['evictions'] == 2 and stats['entries'] == 1 and stats['size'] == 100
+    assert stats['hits'] == 2 and stats['misses'] == 1
+    assert atlas.synthe_cache_stats(cache) == stats
+
+def test_synthe_cache_restore_eviction(tmp_path, monkeypatch):
+    cache = str(tmp_path / 'cache')
+    os.makedirs(tmp_path / 'cache' / 'key')
+    (tmp_path / 'cache' / 'key' / 'spectrum.bin').write_bytes(b'spectrum')
+    (tmp_path / 'cache' / 'key' / 'synbeg.out').write_bytes(b'synbeg')
+    cards = {'spectrum_key': 'key', 'output_dir': str(tmp_path / 'run'), 'synthe_num': 1, 'min_wl': 500, 'max_wl': 510, 'wlbeg': 499, 'wlend': 511, 'settings': {}}
+
+    # The restore is paused after linking the first file, while it holds the shared lock on the cache
+    linking = threading.Event(); resume = threading.Event()
+    link = os.link
+    def paused_link(source, destination):
+        link(source, destination)
+        linking.set()
+        resume.wait(5)
+    monkeypatch.setattr(os, 'link', paused_link)
+    restored = []
+    restore = threading.Thread(target = lambda: restored.append(atlas.synthe_cache_restore(cache, cards, silent = True)))
+    restore.start()
+    assert linking.wait(5)
+
+    # The eviction of the entry waits until the restore is complete
+    evict = threading.Thread(target = atlas.synthe_cache_stats, args = [cache], kwargs = {'max_size': 0, 'silent': True})
+    evict.start()
+    time.sleep(0.5)
+    assert evict.is_alive() and os.path.isdir(tmp_path / 'cache' / 'key')
+    resume.set()
+    restore.join(); evict.join()
+    assert restored == [True]
+    assert not os.path.isdir(tmp_path / 'cache' / 'key')
+    # The restored files outlive the entry
+    assert (tmp_path / 'run' / 'synthe_1' / 'spectrum.bin').read_bytes() == b'spectrum'
+    assert (tmp_path / 'run' / 'synthe_1' / 'synbeg.out').read_bytes() == b'synbeg'
+
+
+def test_synthe_monitor(tmp_path):
+    output_dir = str(tmp_path)
+    futures = [concurrent.futures.Future(), concurrent.futures.Future()]
+    for synthe_num in [1, 2]:
+        os.mkdir(tmp_path / 'synthe_{}'.format(synthe_num))
+        os.mkfifo(tmp_path / 'synthe_{}/progress.dat'.format(synthe_num))
+
+    # Patched synthe.for writes a line at the beginning of every layer. Lines may arrive in pieces
+    def run_batches():
+        f = open(tmp_path / 'synthe_1/progress.dat', 'wb', buffering = 0)
+        for chunk in [b'  1/ 4\n  2', b'/ 4\n']:
+            f.write(chunk)
+            time.sleep(0.1)
+        f.close()
+        futures[0].set_result(None)
+        time.sleep(0.1)
+        futures[1].set_result(None)
+    events = []
+    thread = threading.Thread(target = run_batches)
+    thread.start()
+    atlas.synthe_monitor(output_dir, [1, 2], futures, events.append)
+    thread.join()
+
+    assert [(event['batch'], event['layer'], event['layers'], event['done']) for event in events] == [(1, 1, 4, False), (1, 2, 4, False), (1, 4, 4, True), (2, 0, 0, True)]
+    assert events[1]['eta'] is not None and events[2]['eta'] == 0.0
+    assert [event['progress'] for event in events] == [0.0, 0.125, 0.5, 1.0]
+    # The pipes are removed once the run is complete
+    assert not os.path.exists(tmp_path / 'synthe_1/progress.dat') and not os.path.exists(tmp_path / 'synthe_2/progress.dat')
+
+def test_synthe_monitor_callback_error(tmp_path):
+    futures = [concurrent.futures.Future(), concurrent.futures.Future()]
+    for synthe_num in [1, 2]:
+        os.mkdir(tmp_path / 'synthe_{}'.format(synthe_num))
+    def callback(event):
+        raise KeyboardInterrupt()
+    thread = threading.Thread(target = lambda: (time.sleep(0.1), futures[0].set_result(None)))
+    thread.start()
+    with pytest.raises(KeyboardInterrupt):
+        atlas.synthe_monitor(str(tmp_path), [1, 2], futures, callback)
+    thread.join()
+    # Batches completing after the monitor has returned must not write into its closed pipe
+    descriptor = os.open(str(tmp_path / 'reused'), os.O_WRONLY | os.O_CREAT)
+    futures[1].set_result(None)
+    os.close(descriptor)
+    assert os.path.getsize(tmp_path / 'reused') == 0
+